@@ -0,0 +1,118 @@
+""" Benchmark of the intermediate formats requested to QGIS Server, for each output format.
+
+Each export is run with the plugin in a QGIS Server, with every intermediate format. The features of
+the output are compared to the output with GML2, the default intermediate format.
+
+    python3 benchmarks/intermediate.py tests/data/lines.qgs lines --formats gpkg,csv,kml --runs 5
+"""
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from qgis.core import QgsApplication, QgsProject, QgsVectorLayer
+from qgis.server import (
+    QgsBufferServerRequest,
+    QgsBufferServerResponse,
+    QgsServer,
+    QgsServerRequest,
+)
+
+# The plugin is imported from the repository
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from wfsOutputExtension.definitions import INTERMEDIATE_FORMATS, OutputFormats  # noqa: E402
+from wfsOutputExtension.wfs_filter import WFSFilter  # noqa: E402
+
+
+def features(file_path: Path, zipped: bool) -> List[Tuple]:
+    """ Attributes and geometries of the output, to compare the outputs. """
+    layer = QgsVectorLayer(f"/vsizip/{file_path}" if zipped else str(file_path), 'output', 'ogr')
+    return [
+        (
+            tuple(str(value) for value in feature.attributes()),
+            feature.geometry().asWkt(6) if feature.hasGeometry() else None,
+        )
+        for feature in layer.getFeatures()
+    ]
+
+
+def export(server: QgsServer, project: QgsProject, type_name: str, output_format: str) -> Optional[bytes]:
+    query_string = (
+        "?SERVICE=WFS&VERSION=1.1.0&REQUEST=GetFeature"
+        f"&TYPENAME={type_name}&OUTPUTFORMAT={output_format}&MAP={project.fileName()}"
+    )
+    request = QgsBufferServerRequest(query_string, QgsServerRequest.GetMethod, {}, None)
+    response = QgsBufferServerResponse()
+    server.handleRequest(request, response, project)
+    if response.statusCode() != 200:
+        return None
+    return bytes(response.body())
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('project')
+    parser.add_argument('typename')
+    parser.add_argument('--formats', default=','.join(f.filename_ext for f in OutputFormats))
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ['QT_QPA_PLATFORM'] = 'offscreen'
+    application = QgsApplication([], False)
+    application.initQgis()
+
+    project = QgsProject()
+    if not project.read(args.project):
+        print(f"Error reading the project {args.project}", file=sys.stderr)
+        return 1
+
+    server = QgsServer()
+    wfs_filter = WFSFilter(server.serverInterface())
+    server.serverInterface().registerFilter(wfs_filter, 50)
+
+    print(f"{'format':<8} {'intermediate':<12} {'median ms':>10} {'bytes':>12}  output")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for output_format in args.formats.split(','):
+            format_definition = OutputFormats.find(output_format)
+            reference = None
+            for name, intermediate in INTERMEDIATE_FORMATS.items():
+                wfs_filter.intermediates[output_format] = intermediate
+                durations = []
+                content = None
+                for _ in range(args.runs):
+                    start = time.perf_counter()
+                    content = export(server, project, args.typename, output_format)
+                    durations.append((time.perf_counter() - start) * 1000)
+
+                if content is None:
+                    print(f"{output_format:<8} {name:<12} {'error':>10}")
+                    continue
+
+                file_path = Path(temp_dir, f"{output_format}-{name}.{output_format}")
+                file_path.write_bytes(content)
+                result = features(file_path, format_definition.zip)
+                if reference is None:
+                    reference = result
+                comparison = 'identical' if result == reference else 'different'
+                print(
+                    f"{output_format:<8} {name:<12} {statistics.median(durations):>10.1f} {len(content):>12}"
+                    f"  {comparison}")
+
+    application.exitQgis()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
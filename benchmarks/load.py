@@ -0,0 +1,216 @@
+""" Load test of QGIS Server with the plugin, with several worker processes.
+
+Each worker is a process with its own QGIS Server and the plugin, like a pool of FCGI workers. A mixed
+workload of GetCapabilities, small GetFeature requests and whole exports is sent at a target rate, the
+latency of a request includes the time waiting for a free worker.
+
+The mix is a comma separated list of weighted requests : `capabilities`, `small` for a GetFeature of
+a few features in CSV, or an output format for the export of the whole layer.
+
+    python3 benchmarks/load.py tests/data/lines.qgs lines --workers 4 --rate 20 --duration 30 \\
+        --mix capabilities:2,small:6,shp:1,xlsx:1
+"""
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# The plugin is imported from the repository
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from wfsOutputExtension.definitions import OutputFormats  # noqa: E402
+
+CAPABILITIES = "SERVICE=WFS&VERSION=1.1.0&REQUEST=GetCapabilities"
+GET_FEATURE = "SERVICE=WFS&VERSION=1.1.0&REQUEST=GetFeature&TYPENAME={typename}&OUTPUTFORMAT={output_format}"
+SMALL_FEATURES = 10
+
+
+def query_strings(mix: str, typename: str) -> Dict[str, Tuple[str, int]]:
+    """ Query string and weight of each request of the mix. """
+    requests = {}
+    for item in mix.split(','):
+        name, _, weight = item.strip().partition(':')
+        name = name.strip().lower()
+        if name == 'capabilities':
+            query_string = CAPABILITIES
+        elif name == 'small':
+            query_string = GET_FEATURE.format(typename=typename, output_format='csv')
+            query_string += f"&MAXFEATURES={SMALL_FEATURES}"
+        elif OutputFormats.find(name):
+            query_string = GET_FEATURE.format(typename=typename, output_format=name)
+        else:
+            raise ValueError(f"Unknown request {name} in the mix")
+        requests[name] = (query_string, int(weight or 1))
+    return requests
+
+
+def worker(project_path: str, jobs: multiprocessing.Queue, results: multiprocessing.Queue) -> None:
+    """ Run the requests of the queue with a QGIS Server and the plugin, until None. """
+    os.environ['QT_QPA_PLATFORM'] = 'offscreen'
+    from qgis.core import QgsApplication, QgsProject
+    from qgis.server import (
+        QgsBufferServerRequest,
+        QgsBufferServerResponse,
+        QgsServer,
+        QgsServerRequest,
+    )
+
+    from wfsOutputExtension.wfs_filter import WFSFilter
+
+    application = QgsApplication([], False)
+    application.initQgis()
+    project = QgsProject()
+    project.read(project_path)
+    server = QgsServer()
+    server.serverInterface().registerFilter(WFSFilter(server.serverInterface()), 50)
+    results.put(None)
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+
+        name, query_string, scheduled = job
+        start = time.monotonic()
+        try:
+            request = QgsBufferServerRequest(
+                f"?{query_string}&MAP={project_path}", QgsServerRequest.GetMethod, {}, None)
+            response = QgsBufferServerResponse()
+            server.handleRequest(request, response, project)
+            status = response.statusCode()
+            size = len(response.body())
+        except Exception:
+            status = 0
+            size = 0
+        end = time.monotonic()
+        results.put((name, status, end - scheduled, end - start, size, end))
+
+    application.exitQgis()
+
+
+def percentile(values: List[float], rank: float) -> float:
+    """ Nearest-rank percentile of the values. """
+    if not values:
+        return math.nan
+    values = sorted(values)
+    return values[max(0, math.ceil(rank / 100 * len(values)) - 1)]
+
+
+def report(results: List[Tuple], start: float) -> Dict[str, Dict]:
+    """ Throughput, latency percentiles and errors of each request of the mix, and of all the requests. """
+    groups: Dict[str, List[Tuple]] = {}
+    for result in results:
+        groups.setdefault(result[0], []).append(result)
+    groups['all'] = results
+
+    summary = {}
+    for name, group in groups.items():
+        succeeded = [result for result in group if result[1] == 200]
+        duration = max(result[5] for result in group) - start
+        latencies = [result[2] * 1000 for result in succeeded]
+        statuses = {}
+        for result in group:
+            if result[1] != 200:
+                statuses[result[1]] = statuses.get(result[1], 0) + 1
+        summary[name] = {
+            'requests': len(group),
+            'errors': len(group) - len(succeeded),
+            'error_rate': (len(group) - len(succeeded)) / len(group),
+            'statuses': statuses,
+            'throughput': len(succeeded) / duration if duration > 0 else math.nan,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'service_p50': percentile([result[3] * 1000 for result in succeeded], 50),
+            'bytes': sum(result[4] for result in succeeded),
+        }
+    return summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('project')
+    parser.add_argument('typename')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--rate', type=float, default=10, help="Requests per second")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds")
+    parser.add_argument('--mix', default='capabilities:2,small:6,shp:1,xlsx:1')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="File of the report, to compare runs")
+    args = parser.parse_args()
+
+    try:
+        requests = query_strings(args.mix, args.typename)
+    except ValueError as e:
+        parser.error(str(e))
+
+    project_path = str(Path(args.project).resolve())
+    # QGIS is not safe to fork
+    multiprocessing_context = multiprocessing.get_context('spawn')
+    jobs = multiprocessing_context.Queue()
+    results = multiprocessing_context.Queue()
+    workers = [
+        multiprocessing_context.Process(target=worker, args=(project_path, jobs, results))
+        for _ in range(args.workers)
+    ]
+    for process in workers:
+        process.start()
+
+    # Wait for the workers to be ready, their start is not part of the test
+    for _ in workers:
+        results.get()
+
+    names = list(requests)
+    weights = [requests[name][1] for name in names]
+    generator = random.Random(args.seed)
+    count = max(1, int(args.rate * args.duration))
+    start = time.monotonic()
+    # Open loop, requests are sent on schedule even if the workers are late
+    for index in range(count):
+        scheduled = start + index / args.rate
+        delay = scheduled - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        name = generator.choices(names, weights)[0]
+        jobs.put((name, requests[name][0], scheduled))
+
+    for _ in workers:
+        jobs.put(None)
+    collected = [results.get() for _ in range(count)]
+    for process in workers:
+        process.join()
+
+    summary = report(collected, start)
+    print(f"{args.workers} workers, {args.rate} requests/s during {args.duration} s")
+    print(
+        f"{'request':<14} {'requests':>8} {'errors':>7} {'req/s':>7} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'service ms':>10}")
+    for name, values in summary.items():
+        print(
+            f"{name:<14} {values['requests']:>8} {values['error_rate']:>7.1%} "
+            f"{values['throughput']:>7.2f} {values['p50']:>9.1f} {values['p95']:>9.1f} "
+            f"{values['p99']:>9.1f} {values['service_p50']:>10.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            data = {'workers': args.workers, 'rate': args.rate, 'mix': args.mix, 'report': summary}
+            json.dump(data, f, indent=2)
+
+    return 1 if summary['all']['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+""" Benchmark of the time added by the plugin to the start of a QGIS Server worker.
+
+Each run is a new Python process creating a QGIS Server, then loading the plugin like QGIS Server does,
+with the import of the package and the call to serverClassFactory.
+
+    python3 benchmarks/startup.py --runs 20
+"""
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from pathlib import Path
+
+WORKER = """
+import json
+import sys
+import time
+
+start = time.perf_counter()
+from qgis.core import QgsApplication
+from qgis.server import QgsServer
+
+application = QgsApplication([], False)
+application.initQgis()
+server = QgsServer()
+server_ready = time.perf_counter()
+
+sys.path.insert(0, sys.argv[1])
+import wfsOutputExtension
+imported = time.perf_counter()
+plugin = wfsOutputExtension.serverClassFactory(server.serverInterface())
+loaded = time.perf_counter()
+
+print(json.dumps({
+    'server': server_ready - start,
+    'import': imported - server_ready,
+    'factory': loaded - imported,
+    'modules': sorted(name for name in sys.modules if name.split('.')[0] in ('osgeo', 'xml')),
+}))
+application.exitQgis()
+"""
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    plugin_path = str(Path(__file__).resolve().parent.parent)
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    results = []
+    modules = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, '-c', WORKER, plugin_path], env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        modules = result.pop('modules')
+        results.append(result)
+
+    print(f"{args.runs} runs, milliseconds : median / max")
+    for key in ('server', 'import', 'factory'):
+        values = [result[key] * 1000 for result in results]
+        print(f"  {key:<8} {statistics.median(values):8.1f} / {max(values):8.1f}")
+    plugin = [(result['import'] + result['factory']) * 1000 for result in results]
+    print(f"  {'plugin':<8} {statistics.median(plugin):8.1f} / {max(plugin):8.1f}")
+    print(f"Modules osgeo and xml loaded after the start : {', '.join(modules) or 'none'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
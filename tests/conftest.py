@@ -57,6 +57,9 @@ def pytest_report_header(config):
 def pytest_configure(config):
     global plugin_path
     plugin_path = config.getoption('qgis_plugins')
+    if plugin_path:
+        # Make the plugin modules importable by the tests
+        sys.path.append(plugin_path)
 
 
 def pytest_sessionstart(session):
@@ -188,6 +191,77 @@ def client(request):
     return _Client()
 
 
+@pytest.fixture
+def wfs_filter(client) -> Any:
+    """ Return the filter of the plugin loaded by the server
+    """
+    from wfsOutputExtension.wfs_filter import WFSFilter
+
+    for server_filters in client.server.serverInterface().filters().values():
+        for server_filter in server_filters:
+            if isinstance(server_filter, WFSFilter):
+                return server_filter
+    raise AssertionError('Filter of the plugin not registered')
+
+
+class _MessageLog:
+    """ Record the messages of the plugin
+    """
+
+    def __init__(self) -> None:
+        self.messages = []
+
+    def logMessage(self, message, tag, level) -> None:
+        self.messages.append(message)
+
+
+@pytest.fixture
+def message_log(monkeypatch) -> _MessageLog:
+    """ Return the messages logged by the plugin during the test
+    """
+    from wfsOutputExtension import logging as plugin_logging
+
+    log = _MessageLog()
+    monkeypatch.setattr(plugin_logging, 'QgsMessageLog', log)
+    return log
+
+
+class _Handler:
+    """ Record the body and the flushes of the response, like QgsRequestHandler
+    """
+
+    def __init__(self) -> None:
+        # The body sent to the client and the body not sent yet
+        self.sent = bytearray()
+        self.pending = bytearray()
+        # Size of the body sent at each flush
+        self.flushes = []
+        self.on_flush = None
+
+    def appendBody(self, data) -> None:
+        self.pending += data
+
+    def clearBody(self) -> None:
+        self.pending = bytearray()
+
+    def headersSent(self) -> bool:
+        return bool(self.flushes)
+
+    def sendResponse(self) -> None:
+        self.sent += self.pending
+        self.pending = bytearray()
+        self.flushes.append(len(self.sent))
+        if self.on_flush:
+            self.on_flush()
+
+
+@pytest.fixture
+def handler() -> _Handler:
+    """ Return a request handler recording the response
+    """
+    return _Handler()
+
+
 ##
 ## Plugins
 ##
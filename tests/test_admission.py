@@ -0,0 +1,70 @@
+import logging
+import threading
+import time
+
+import pytest
+
+from wfsOutputExtension.admission import AdmissionControl, AdmissionRejected
+from wfsOutputExtension.definitions import MB, OutputFormats
+
+LOGGER = logging.getLogger('server')
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+def test_admission_heavy_exports(tmp_path):
+    """ Test the limit of concurrent heavy exports. """
+    admission = AdmissionControl(tmp_path, max_slots=1, max_wait=0, retry_after=12)
+
+    # The threshold depends on the format
+    assert not admission.is_heavy(OutputFormats.Xlsx, 1 * MB)
+    assert admission.is_heavy(OutputFormats.Xlsx, 10 * MB)
+    assert not admission.is_heavy(OutputFormats.Csv, 10 * MB)
+
+    with admission.slot(OutputFormats.Shp, 50 * MB):
+        # Small exports are not limited
+        with admission.slot(OutputFormats.Shp, 1 * MB):
+            pass
+
+        # The only slot is taken
+        with pytest.raises(AdmissionRejected) as e:
+            with admission.slot(OutputFormats.Shp, 50 * MB):
+                pass
+        assert e.value.retry_after == 12
+
+    # The slot has been released
+    with admission.slot(OutputFormats.Shp, 50 * MB):
+        pass
+
+
+def test_admission_wait(tmp_path):
+    """ Test a heavy export waits for a slot released by another export. """
+    admission = AdmissionControl(tmp_path, max_slots=2, max_wait=10, retry_after=12)
+    holding = threading.Event()
+    release = threading.Event()
+
+    def hold() -> None:
+        with admission.slot(OutputFormats.Shp, 50 * MB):
+            holding.set()
+            release.wait(10)
+
+    threads = [threading.Thread(target=hold) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+        holding.wait(10)
+        holding.clear()
+
+    threading.Timer(0.2, release.set).start()
+    start = time.monotonic()
+    with admission.slot(OutputFormats.Shp, 50 * MB):
+        assert 0.1 < time.monotonic() - start < 5
+    for thread in threads:
+        thread.join()
+
+    # The lock taken by the other waiting thread is released
+    time.sleep(0.2)
+    admission = AdmissionControl(tmp_path, max_slots=2, max_wait=0, retry_after=12)
+    with admission.slot(OutputFormats.Shp, 50 * MB), admission.slot(OutputFormats.Shp, 50 * MB):
+        pass
@@ -0,0 +1,69 @@
+import io
+import logging
+import time
+
+import pytest
+
+from wfsOutputExtension.deadline import (
+    CHECK_INTERVAL,
+    Deadline,
+    ExportCancelled,
+    cancellable,
+)
+from wfsOutputExtension.streaming import CHUNK_SIZE, FlushPolicy, stream_bytes
+
+LOGGER = logging.getLogger('server')
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+def test_deadline():
+    """ Test the feedback is canceled when the deadline has passed. """
+    deadline = Deadline(3600)
+    assert not deadline.is_canceled()
+    deadline.check('write')
+
+    deadline = Deadline(0.1)
+    time.sleep(0.2)
+    # Checked by the writer of QGIS when the progress is reported
+    deadline.feedback.setProgress(50)
+    assert deadline.feedback.isCanceled()
+    with pytest.raises(ExportCancelled) as e:
+        deadline.check('zip')
+    assert e.value.step == 'zip'
+
+
+def test_cancellable_features():
+    """ Test the iteration of the features stops after the deadline. """
+    deadline = Deadline(3600)
+    features = cancellable(range(3 * CHECK_INTERVAL), deadline)
+    assert [next(features) for _ in range(CHECK_INTERVAL)] == list(range(CHECK_INTERVAL))
+
+    deadline.feedback.cancel()
+    assert list(features) == []
+
+
+def test_stream_bytes_deadline(handler):
+    """ Test the streaming stops after the deadline. """
+    content = b'x' * (4 * CHUNK_SIZE)
+    policy = FlushPolicy(max_bytes=CHUNK_SIZE, max_delay=3600)
+    deadline = Deadline(3600)
+    deadline.feedback.cancel()
+    with pytest.raises(ExportCancelled):
+        stream_bytes(handler, io.BufferedReader(io.BytesIO(content)), policy, deadline=deadline)
+    assert not handler.flushes
+
+
+def test_stream_bytes_deadline_headers_sent(handler):
+    """ Test the streaming stops without error after the deadline, when a part of the body is sent. """
+    content = b'x' * (4 * CHUNK_SIZE)
+    policy = FlushPolicy(max_bytes=CHUNK_SIZE, max_delay=3600)
+    deadline = Deadline(3600)
+    # The deadline passes after the first flush
+    handler.on_flush = deadline.feedback.cancel
+    sent = stream_bytes(handler, io.BufferedReader(io.BytesIO(content)), policy, deadline=deadline)
+    assert sent == CHUNK_SIZE
+    assert handler.flushes == [CHUNK_SIZE]
+    assert not handler.pending
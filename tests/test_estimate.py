@@ -0,0 +1,40 @@
+import logging
+
+from wfsOutputExtension.definitions import INTERMEDIATE_FORMATS, OutputFormats
+from wfsOutputExtension.estimate import (
+    LayerSample,
+    estimate_bytes,
+    parse_hits,
+    pipeline_stages,
+)
+
+LOGGER = logging.getLogger('server')
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+def test_parse_hits():
+    """ Test the count read from a hits response. """
+    assert parse_hits(b'<wfs:FeatureCollection numberOfFeatures="12" timeStamp="now"/>') == 12
+    assert parse_hits(b'<wfs:FeatureCollection numberMatched="3" numberReturned="0"/>') == 3
+    assert parse_hits(b'<ServiceExceptionReport/>') is None
+
+
+def test_estimate_bytes():
+    """ Test the estimated size of the output. """
+    sample = LayerSample(vertices=10, values=5, text_length=50)
+    assert estimate_bytes(OutputFormats.Gpkg, sample, 0) == 0
+    size = estimate_bytes(OutputFormats.Gpkg, sample, 1000)
+    assert estimate_bytes(OutputFormats.Gpkg, sample, 2000) == 2 * size
+    # No geometry in the spreadsheet
+    assert estimate_bytes(OutputFormats.Xlsx, sample, 1000) < estimate_bytes(OutputFormats.Kml, sample, 1000)
+
+
+def test_pipeline_stages():
+    """ Test the stages of an export. """
+    assert pipeline_stages(OutputFormats.Kml, INTERMEDIATE_FORMATS['gml2']) == [
+        'GetFeature GML2', 'DescribeFeatureType 1.0.0', 'Reproject EPSG:4326', 'Write KML', 'Stream']
+    assert pipeline_stages(OutputFormats.Shp, INTERMEDIATE_FORMATS['geojson']) == [
+        'GetFeature GeoJSON', 'Write ESRI Shapefile', 'Zip', 'Stream']
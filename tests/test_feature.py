@@ -1,4 +1,6 @@
+import json
 import logging
+import sqlite3
 
 from qgis.core import Qgis, QgsVectorLayer
 from qgis.PyQt.QtCore import NULL, QDate, QDateTime, QVariant
@@ -123,11 +125,22 @@ def test_getfeature_gpkg(client):
     rv = client.get(query_string, PROJECT)
     assert rv.status_code == 200
     assert 'application/geopackage+vnd.sqlite3' in rv.headers.get('Content-Type'), rv.headers
-    layer = _test_vector_layer(rv.file('gpkg'), 'GPKG')
+    gpkg_file = rv.file('gpkg')
+    layer = _test_vector_layer(gpkg_file, 'GPKG')
     _test_list(
         layer.fields().names(),
         ['fid', 'gml_id', 'id', 'trailing_zero', 'name', 'comment', 'date_time', 'date'])
 
+    # The file written with the fast pragmas is still a valid GeoPackage with its spatial index
+    connection = sqlite3.connect(gpkg_file)
+    try:
+        assert connection.execute('PRAGMA application_id').fetchone()[0] == 0x47504B47
+        assert connection.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+        extensions = connection.execute('SELECT extension_name FROM gpkg_extensions').fetchall()
+        assert ('gpkg_rtree_index',) in extensions
+    finally:
+        connection.close()
+
     # ID
     index = layer.fields().indexFromName('id')
     assert layer.uniqueValues(index) == {1, 2, 3, 4}
@@ -291,6 +304,32 @@ def test_getfeature_excel(client):
     assert layer.fields().at(index).type() == QVariant.Date
 
 
+def test_getfeature_excel_native_writer(client, wfs_filter, monkeypatch):
+    """ Test GetFeature as Excel written by the plugin, enabled with WFSOUTPUTEXTENSION_NATIVE_WRITERS. """
+    monkeypatch.setattr(wfs_filter, 'native_writers', ['xlsx'])
+    query_string = (
+        "?"
+        "SERVICE=WFS&"
+        "VERSION=1.1.0&"
+        "REQUEST=GetFeature&"
+        "TYPENAME=lines&"
+        "OUTPUTFORMAT=XLSX&"
+        f"MAP={PROJECT}"
+    )
+    rv = client.get(query_string, PROJECT)
+    assert rv.status_code == 200
+    layer = _test_vector_layer(rv.file('xlsx'), 'XLSX')
+    _test_list(
+        layer.fields().names(),
+        ['gml_id', 'id', 'trailing_zero', 'name', 'comment', 'date_time', 'date'])
+
+    index = layer.fields().indexFromName('id')
+    assert layer.uniqueValues(index) == {1, 2, 3, 4}
+
+    index = layer.fields().indexFromName('trailing_zero')
+    assert '05200' in layer.uniqueValues(index)
+
+
 def test_getfeature_csv(client):
     """ Test GetFeature as CSV. """
     query_string = (
@@ -305,6 +344,7 @@ def test_getfeature_csv(client):
     rv = client.get(query_string, PROJECT)
     assert rv.status_code == 200
     assert 'text/csv' in rv.headers.get('Content-Type'), rv.headers
+    assert int(rv.headers.get('Content-Length')) == len(rv.content)
     layer = _test_vector_layer(rv.file('csv'), 'CSV')
     _test_list(
         layer.fields().names(),
@@ -505,3 +545,142 @@ def test_getfeature_fgb(client):
     index = layer.fields().indexFromName('date')
     assert QDateTime(2023, 8, 1, 0, 0) in layer.uniqueValues(index)
     assert layer.fields().at(index).type() == QVariant.DateTime
+
+
+def test_getfeature_estimate(client):
+    """ Test GetFeature with RESULTTYPE=estimate. """
+    query_string = (
+        "?"
+        "SERVICE=WFS&"
+        "VERSION=1.1.0&"
+        "REQUEST=GetFeature&"
+        "TYPENAME=lines&"
+        "OUTPUTFORMAT=SHP&"
+        "RESULTTYPE=estimate&"
+        "FEATUREID=lines.1,lines.2&"
+        f"MAP={PROJECT}"
+    )
+    rv = client.get(query_string, PROJECT)
+    assert rv.status_code == 200
+    assert 'application/json' in rv.headers.get('Content-Type'), rv.headers
+    estimate = json.loads(rv.content.decode('utf-8'))
+    assert estimate['numberOfFeatures'] == 2
+    assert estimate['estimatedSize'] > 0
+    assert estimate['pipeline'][-2:] == ['Zip', 'Stream']
+
+
+def test_getfeature_csv_without_geometry(client):
+    """ Test GetFeature as CSV without the geometry. """
+    query_string = (
+        "?"
+        "SERVICE=WFS&"
+        "VERSION=1.1.0&"
+        "REQUEST=GetFeature&"
+        "TYPENAME=lines&"
+        "OUTPUTFORMAT=CSV&"
+        "GEOMETRY=none&"
+        f"MAP={PROJECT}"
+    )
+    rv = client.get(query_string, PROJECT)
+    assert rv.status_code == 200
+    assert 'text/csv' in rv.headers.get('Content-Type'), rv.headers
+    layer = _test_vector_layer(rv.file('csv'), 'CSV')
+    assert not layer.isSpatial()
+    _test_list(
+        layer.fields().names(),
+        ['gml_id', 'id', 'trailing_zero', 'name', 'comment', 'date_time', 'date'])
+
+    index = layer.fields().indexFromName('id')
+    assert layer.uniqueValues(index) == {'1', '2', '3', '4'}
+
+
+def test_getfeature_kml_precision(client):
+    """ Test GetFeature as KML with a precision and a simplification. """
+    query_string = (
+        "?"
+        "SERVICE=WFS&"
+        "VERSION=1.1.0&"
+        "REQUEST=GetFeature&"
+        "TYPENAME=lines&"
+        "OUTPUTFORMAT=KML&"
+        "PRECISION=3&"
+        "SIMPLIFY_TOLERANCE=0.0001&"
+        f"MAP={PROJECT}"
+    )
+    rv = client.get(query_string, PROJECT)
+    assert rv.status_code == 200
+    layer = _test_vector_layer(rv.file('kml'), 'LIBKML')
+    for feature in layer.getFeatures():
+        for vertex in feature.geometry().vertices():
+            assert abs(round(vertex.x(), 3) - vertex.x()) < 1e-9
+            assert abs(round(vertex.y(), 3) - vertex.y()) < 1e-9
+
+    query_string = query_string.replace("PRECISION=3", "PRECISION=-1")
+    rv = client.get(query_string, PROJECT)
+    assert rv.status_code == 400
+
+
+def test_getfeature_mbtiles(client):
+    """ Test GetFeature as a package of vector tiles. """
+    query_string = (
+        "?"
+        "SERVICE=WFS&"
+        "VERSION=1.1.0&"
+        "REQUEST=GetFeature&"
+        "TYPENAME=lines&"
+        "OUTPUTFORMAT=MBTILES&"
+        f"MAP={PROJECT}"
+    )
+    rv = client.get(query_string, PROJECT)
+    assert rv.status_code == 200
+    assert 'application/vnd.sqlite3' in rv.headers.get('Content-Type'), rv.headers
+
+    # The features of the highest zoom level, a line may be cut by the edges of the tiles
+    file_path = rv.file('mbtiles')
+    layer = QgsVectorLayer(f"{file_path}|layername=lines", 'test', 'ogr')
+    assert layer.isValid()
+    assert layer.storageType() == 'MBTiles', layer.storageType()
+    assert layer.featureCount() >= 4
+    assert 'name' in layer.fields().names()
+
+    connection = sqlite3.connect(file_path)
+    try:
+        metadata = dict(connection.execute("SELECT name, value FROM metadata").fetchall())
+    finally:
+        connection.close()
+    assert metadata['format'] == 'pbf'
+    assert metadata['maxzoom'] == '14'
+
+
+def test_getfeature_shapefile_split_writer(client, wfs_filter, monkeypatch):
+    """ Test the Shapefile written feature by feature, when it can be split, is like the one of QGIS. """
+    query_string = (
+        "?"
+        "SERVICE=WFS&"
+        "VERSION=1.1.0&"
+        "REQUEST=GetFeature&"
+        "TYPENAME=lines&"
+        "OUTPUTFORMAT=SHP&"
+        f"MAP={PROJECT}"
+    )
+
+    def shapefile_features() -> tuple:
+        rv = client.get(query_string, PROJECT)
+        assert rv.status_code == 200
+        layer = _test_vector_layer('/vsizip/' + rv.file('zip'), 'ESRI Shapefile')
+        return (
+            [(field.name(), field.type(), field.length()) for field in layer.fields()],
+            layer.wkbType(),
+            layer.crs().authid(),
+            {
+                feature['id']: (feature.attributes(), feature.geometry().asWkt())
+                for feature in layer.getFeatures()
+            },
+        )
+
+    monkeypatch.setattr(wfs_filter, 'split_size', 0)
+    expected = shapefile_features()
+
+    # Below the limit, a single part
+    monkeypatch.setattr(wfs_filter, 'split_size', 1900 * 1024 * 1024)
+    assert shapefile_features() == expected
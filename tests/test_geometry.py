@@ -0,0 +1,78 @@
+import logging
+
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransform,
+    QgsCoordinateTransformContext,
+    QgsGeometry,
+    QgsVectorLayer,
+)
+
+from wfsOutputExtension.geometry import batch_reproject
+
+LOGGER = logging.getLogger('server')
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+def _assert_same_geometries(expected: QgsGeometry, result: QgsGeometry, tolerance: float):
+    assert result.wkbType() == expected.wkbType(), result.asWkt()
+    expected_vertices = list(expected.vertices())
+    result_vertices = list(result.vertices())
+    assert len(result_vertices) == len(expected_vertices)
+    for expected_vertex, vertex in zip(expected_vertices, result_vertices):
+        assert abs(vertex.x() - expected_vertex.x()) <= tolerance
+        assert abs(vertex.y() - expected_vertex.y()) <= tolerance
+        assert vertex.is3D() == expected_vertex.is3D()
+        if vertex.is3D():
+            assert vertex.z() == expected_vertex.z()
+
+
+def test_batch_reproject(client):
+    """ Test the batch reprojection gives the same coordinates as the geometry transform. """
+    transform = QgsCoordinateTransform(
+        QgsCoordinateReferenceSystem('EPSG:2154'),
+        QgsCoordinateReferenceSystem('EPSG:4326'),
+        QgsCoordinateTransformContext(),
+    )
+    geometries = [
+        QgsGeometry.fromWkt(wkt) for wkt in (
+            'Point (770000 6280000)',
+            'PointZ (770000 6280000 12)',
+            'LineString (770000 6280000, 771000 6281000, 772500 6280500)',
+            'Polygon ((770000 6280000, 771000 6280000, 771000 6281000, 770000 6280000),'
+            '(770200 6280100, 770800 6280100, 770800 6280600, 770200 6280100))',
+            'MultiLineStringZ ((770000 6280000 1, 771000 6281000 2),(772000 6282000 3, 773000 6283000 4))',
+            'MultiPolygon (((770000 6280000, 771000 6280000, 771000 6281000, 770000 6280000)))',
+            # Transformed alone
+            'CircularString (770000 6280000, 771000 6281000, 772000 6280000)',
+        )
+    ]
+    geometries.append(QgsGeometry())
+
+    results = batch_reproject(geometries, transform)
+    assert len(results) == len(geometries)
+    assert results[-1].isNull()
+
+    for geometry, result in zip(geometries[:-1], results[:-1]):
+        expected = QgsGeometry(geometry)
+        expected.transform(transform)
+        _assert_same_geometries(expected, result, 1e-9)
+
+
+def test_batch_reproject_layer(client):
+    """ Test the batch reprojection of the test layer. """
+    layer = QgsVectorLayer(str(client.getprojectpath('lines.geojson')), 'lines', 'ogr')
+    assert layer.isValid()
+    transform = QgsCoordinateTransform(
+        layer.crs(),
+        QgsCoordinateReferenceSystem('EPSG:3857'),
+        QgsCoordinateTransformContext(),
+    )
+    geometries = [feature.geometry() for feature in layer.getFeatures()]
+    for geometry, result in zip(geometries, batch_reproject(geometries, transform)):
+        expected = QgsGeometry(geometry)
+        expected.transform(transform)
+        _assert_same_geometries(expected, result, 1e-6)
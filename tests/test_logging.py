@@ -0,0 +1,44 @@
+import logging
+
+from wfsOutputExtension.logging import CRITICAL, INFO, Logger, log_function
+
+LOGGER = logging.getLogger('server')
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+def test_log_level(message_log, monkeypatch):
+    """ Test the messages below the level of the server are skipped. """
+    monkeypatch.setattr(Logger, '_level', CRITICAL)
+
+    Logger.info('info')
+    Logger.warning('warning')
+    Logger.critical('critical')
+    assert message_log.messages == ['critical']
+
+    @log_function
+    def function():
+        return 1
+
+    assert function() == 1
+    assert message_log.messages == ['critical']
+
+    monkeypatch.setattr(Logger, '_level', INFO)
+    assert function() == 1
+    assert message_log.messages[-1].startswith('function ran in')
+
+
+def test_log_sampling(message_log, monkeypatch):
+    """ Test the info messages of a request are skipped when it is not sampled. """
+    monkeypatch.setattr(Logger, '_level', INFO)
+
+    Logger.sample_request(0)
+    Logger.info('info')
+    Logger.critical('critical')
+    assert message_log.messages == ['critical']
+
+    Logger.sample_request(1)
+    Logger.info('info')
+    assert message_log.messages == ['critical', 'info']
@@ -0,0 +1,52 @@
+import logging
+import sys
+import tracemalloc
+
+import pytest
+
+from wfsOutputExtension.logging import INFO, Logger
+from wfsOutputExtension.memory import MemoryProbe, peak_rss, rss, stage
+
+LOGGER = logging.getLogger('server')
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Resident memory read in /proc")
+def test_rss():
+    """ Test the resident memory of the process. """
+    assert rss() > 0
+    assert peak_rss() >= rss()
+
+
+def test_memory_probe(message_log, monkeypatch):
+    """ Test the memory of the stages is logged with the request ID. """
+    monkeypatch.setattr(Logger, '_level', INFO)
+    monkeypatch.setattr(Logger, '_sampled', True)
+
+    probe = MemoryProbe('1234', tracemalloc_top=3)
+    assert tracemalloc.is_tracing()
+
+    with probe.stage('write'):
+        data = [bytes(1000) for _ in range(1000)]
+    for _ in range(3):
+        with probe.stage('intercept', log=False):
+            data.append(bytes(1000))
+    assert list(probe.stages) == ['write', 'intercept']
+    assert len(message_log.messages) == 2
+    assert message_log.messages[0].startswith('REQ_ID:1234\t memory write start, RSS ')
+
+    probe.finish()
+    assert not tracemalloc.is_tracing()
+    summary = message_log.messages[2]
+    assert summary.startswith('REQ_ID:1234\t memory RSS ')
+    assert 'stages : write ' in summary
+    assert ', intercept ' in summary
+    assert len(message_log.messages) == 6
+    assert all(m.startswith('REQ_ID:1234\t tracemalloc ') for m in message_log.messages[3:])
+
+    # Nothing measured without a probe
+    with stage(None, 'write'):
+        pass
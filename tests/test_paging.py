@@ -0,0 +1,81 @@
+import logging
+import sqlite3
+
+from qgis.core import QgsVectorLayer
+
+from wfsOutputExtension.paging import (
+    page_subset,
+    requested_page,
+    snapshot_feature_count,
+)
+from wfsOutputExtension.retention import RetainedOutputs
+
+LOGGER = logging.getLogger('server')
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+def test_requested_page():
+    """ Test the page read from the parameters. """
+    assert requested_page({'TYPENAME': 'lines'}) is None
+    assert requested_page({'STARTINDEX': 'abc', 'COUNT': '10'}) is None
+    assert requested_page({'STARTINDEX': '20', 'COUNT': '10'}) == (20, 10)
+    assert requested_page({'STARTINDEX': '20', 'MAXFEATURES': '5'}) == (20, 5)
+    assert requested_page({'STARTINDEX': '0'}) == (0, None)
+
+
+def test_page_subset():
+    """ Test the filter of the features of a page. """
+    assert page_subset(0, 10) == "wfs_position > 0 AND wfs_position <= 10"
+    assert page_subset(20, 10) == "wfs_position > 20 AND wfs_position <= 30"
+    assert page_subset(20, None) == "wfs_position > 20"
+
+
+def test_snapshot_feature_count(tmp_path):
+    """ Test the number of features read from the GeoPackage metadata. """
+    snapshot = tmp_path.joinpath('snapshot.gpkg')
+    connection = sqlite3.connect(snapshot)
+    connection.execute("CREATE TABLE gpkg_ogr_contents (table_name TEXT, feature_count INTEGER)")
+    connection.execute("INSERT INTO gpkg_ogr_contents VALUES ('features', 42)")
+    connection.commit()
+    connection.close()
+    assert snapshot_feature_count(snapshot) == 42
+
+    assert snapshot_feature_count(tmp_path.joinpath('other.gpkg')) == 0
+
+
+def test_getfeature_pages(client, wfs_filter, tmp_path, monkeypatch):
+    """ Test the pages of a filtered result, the first one stores the snapshot read by the second one. """
+    monkeypatch.setattr(wfs_filter, 'paging', RetainedOutputs(tmp_path, ttl=60))
+
+    pages = []
+    for start in (0, 2):
+        query_string = (
+            "?"
+            "SERVICE=WFS&"
+            "VERSION=1.1.0&"
+            "REQUEST=GetFeature&"
+            "TYPENAME=lines&"
+            "OUTPUTFORMAT=GPKG&"
+            # The IDs of the result have a gap
+            "EXP_FILTER=\"id\" <> 2&"
+            f"STARTINDEX={start}&"
+            "COUNT=2&"
+            "MAP=lines.qgs"
+        )
+        rv = client.get(query_string, 'lines.qgs')
+        assert rv.status_code == 200
+        layer = QgsVectorLayer(rv.file('gpkg'), 'page', 'ogr')
+        assert layer.isValid()
+        assert 'wfs_position' not in layer.fields().names()
+        index = layer.fields().indexFromName('id')
+        pages.append([feature.attribute(index) for feature in layer.getFeatures()])
+
+        # Written by the first page only
+        assert len(list(tmp_path.glob('*.gpkg'))) == 1
+
+    assert len(pages[0]) == 2
+    assert len(pages[1]) == 1
+    assert sorted(pages[0] + pages[1]) == [1, 3, 4]
@@ -0,0 +1,166 @@
+import logging
+import shutil
+
+from osgeo import gdal
+from qgis.core import QgsVectorLayer
+from qgis.PyQt.QtCore import QByteArray
+
+from wfsOutputExtension.partition import (
+    PartitionResponse,
+    PartitionTask,
+    TileGrid,
+    convert_partition,
+    merge_partitions,
+    partition_parameters,
+    partitionable,
+)
+
+LOGGER = logging.getLogger('server')
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+def test_tile_grid():
+    """ Test the tiles cover the extent and share their edges, a point is owned by a single tile. """
+    grid = TileGrid.create((0, 0, 40, 10), 8)
+    assert (grid.columns, grid.rows) == (6, 2)
+    assert grid.tile(0) == (0, 0, 40 / 6, 5)
+    assert grid.tile(0, 0.5) == (-0.5, -0.5, 40 / 6 + 0.5, 5.5)
+    assert grid.tile(grid.count - 1) == (40 * 5 / 6, 5, 40, 10)
+
+    # On the edge of 4 tiles, the tile above on the right
+    assert grid.owner(40 / 6, 5) == 7
+    assert grid.owner(1, 1) == 0
+    assert grid.owner(0, 0) == 0
+    # The right and top edges of the grid
+    assert grid.owner(40, 10) == grid.count - 1
+    assert grid.owner(50, 1) is None
+
+    # A single point
+    grid = TileGrid.create((3, 4, 3, 4), 4)
+    assert grid.owner(3, 4) is not None
+
+
+def test_partition_parameters():
+    """ Test the parameters of the requests of the partitions. """
+    params = {
+        'SERVICE': 'WFS', 'VERSION': '1.1.0', 'REQUEST': 'GetFeature', 'TYPENAME': 'lines',
+        'OUTPUTFORMAT': 'gpkg', 'RESULTTYPE': 'hits', 'EXP_FILTER': '"id" > 2',
+    }
+    assert partitionable(params)
+    assert not partitionable({**params, 'BBOX': '0,0,1,1'})
+    assert not partitionable({**params, 'TYPENAME': 'lines,points'})
+
+    parameters = partition_parameters(params, bbox=(0, 0.5, 1, 2))
+    assert parameters['VERSION'] == '1.0.0'
+    assert parameters['OUTPUTFORMAT'] == 'GML2'
+    assert parameters['BBOX'] == '0,0.5,1,2'
+    assert 'RESULTTYPE' not in parameters
+    assert parameters['EXP_FILTER'] == '"id" > 2'
+
+    parameters = partition_parameters(params, null_geometry=True)
+    assert parameters['EXP_FILTER'] == '("id" > 2) AND $geometry IS NULL'
+
+
+def test_partitions_without_duplicate(client, tmp_path):
+    """ Test the features returned by several tiles are written once. """
+    source = str(client.getprojectpath('lines.geojson'))
+    dataset = gdal.OpenEx(source)
+    layer = dataset.GetLayer(0)
+    feature_count = layer.GetFeatureCount()
+    xmin, xmax, ymin, ymax = layer.GetExtent()
+    del layer, dataset
+
+    gml = tmp_path.joinpath('lines.gml')
+    gdal.VectorTranslate(str(gml), source, format='GML')
+
+    # Each tile returns all the features, like a bounding box larger than the tile
+    grid = TileGrid.create((xmin, ymin, xmax, ymax), 4)
+    paths = []
+    counts = []
+    for index in range(grid.count):
+        partition = tmp_path.joinpath(f'partition-{index}.gml')
+        shutil.copy(gml, partition)
+        shutil.copy(gml.with_suffix('.xsd'), partition.with_suffix('.xsd'))
+        paths.append(tmp_path.joinpath(f'partition-{index}.fgb'))
+        counts.append(convert_partition(PartitionTask(str(partition), (), str(paths[-1]), grid, index)))
+        assert not partition.exists()
+
+    assert sum(counts) == feature_count
+
+    output_file = tmp_path.joinpath('lines.gpkg')
+    assert merge_partitions(paths, output_file, 'GPKG', 'lines')
+    dataset = gdal.OpenEx(str(output_file))
+    assert dataset.GetLayerByName('lines').GetFeatureCount() == feature_count
+
+
+def test_partition_response(tmp_path):
+    """ Test the GML of a partition is written in its file at each flush, without the schema location. """
+    path = tmp_path.joinpath('partition.gml')
+    with path.open('wb') as stream:
+        response = PartitionResponse(stream)
+        response.setHeader('Content-Type', 'text/xml')
+        response.write(QByteArray(b'<wfs:FeatureCollection xsi:schemaLocation="http://server/schema">'))
+        response.flush()
+        assert response.headersSent()
+        assert stream.tell() > 0
+
+        response.write(QByteArray(b'<gml:featureMember/>'))
+        assert bytes(response.data()) == b'<gml:featureMember/>'
+        response.write(QByteArray(b'</wfs:FeatureCollection>'))
+        response.finish()
+
+    assert response.statusCode() == 200
+    assert path.read_bytes() == (
+        b'<wfs:FeatureCollection xsi:schemaLocation=""><gml:featureMember/></wfs:FeatureCollection>')
+
+
+def _partitioned_ids(client) -> list:
+    query_string = (
+        "?"
+        "SERVICE=WFS&"
+        "VERSION=1.1.0&"
+        "REQUEST=GetFeature&"
+        "TYPENAME=lines&"
+        "OUTPUTFORMAT=GPKG&"
+        "MAP=lines.qgs"
+    )
+    rv = client.get(query_string, 'lines.qgs')
+    assert rv.status_code == 200
+    layer = QgsVectorLayer(rv.file('gpkg'), 'lines', 'ogr')
+    assert layer.isValid()
+    index = layer.fields().indexFromName('id')
+    return sorted(feature.attribute(index) for feature in layer.getFeatures())
+
+
+def test_getfeature_partitioned(client, wfs_filter, monkeypatch):
+    """ Test the export by partitions, like with WFSOUTPUTEXTENSION_PARTITION_WORKERS=2. """
+    monkeypatch.setattr(wfs_filter.partitions, 'workers', 2)
+    # A tile by feature
+    monkeypatch.setattr(wfs_filter.partitions, 'features', 1)
+
+    assert _partitioned_ids(client) == [1, 2, 3, 4]
+
+    # The pool is kept for the next exports
+    pool = wfs_filter.partitions.pool()
+    assert _partitioned_ids(client) == [1, 2, 3, 4]
+    assert wfs_filter.partitions.pool() is pool
+
+
+def test_getfeature_partitioned_fallback(client, wfs_filter, monkeypatch):
+    """ Test the features not owned by a tile are exported in a single partition. """
+    monkeypatch.setattr(wfs_filter.partitions, 'workers', 2)
+    monkeypatch.setattr(wfs_filter.partitions, 'features', 1)
+
+    # A grid smaller than the extent of the layer
+    create = TileGrid.create
+
+    def small_grid(extent: tuple, count: int) -> TileGrid:
+        xmin, ymin = extent[:2]
+        return create((xmin, ymin, xmin + 1e-6, ymin + 1e-6), count)
+
+    monkeypatch.setattr(TileGrid, 'create', staticmethod(small_grid))
+
+    assert _partitioned_ids(client) == [1, 2, 3, 4]
@@ -0,0 +1,49 @@
+import logging
+import os
+import time
+
+from wfsOutputExtension.retention import RetainedOutputs, request_key
+
+LOGGER = logging.getLogger('server')
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+def test_request_key(tmp_path):
+    """ Test the key of a request. """
+    project = tmp_path.joinpath('project.qgs')
+    project.write_text('<qgis/>')
+    params = {'SERVICE': 'WFS', 'REQUEST': 'GetFeature', 'TYPENAME': 'lines', 'OUTPUTFORMAT': 'shp'}
+
+    key = request_key(params, str(project), {})
+    assert key == request_key(dict(reversed(params.items())), str(project), {})
+    assert key != request_key(dict(params, TYPENAME='points'), str(project), {})
+    assert key != request_key(params, str(project), {'X-Lizmap-User': 'admin'})
+    assert key == request_key(dict(params, STARTINDEX='10'), str(project), {}, ignore=('startindex',))
+
+    # The project has been modified
+    os.utime(project, (time.time() + 10, time.time() + 10))
+    assert key != request_key(params, str(project), {})
+
+
+def test_retained_outputs(tmp_path):
+    """ Test outputs are kept during the retention window. """
+    retention = RetainedOutputs(tmp_path.joinpath('retained'), ttl=60)
+    assert retention.lookup('key', 'zip') is None
+
+    output = tmp_path.joinpath('output.zip')
+    output.write_bytes(b'content')
+    retained = retention.store('key', 'zip', output)
+    assert not output.exists()
+    assert retention.lookup('key', 'zip') == retained
+    assert retained.read_bytes() == b'content'
+    assert retention.etag(retained).startswith('"')
+
+    # Expired
+    old = time.time() - 120
+    os.utime(retained, (old, old))
+    assert retention.lookup('key', 'zip') is None
+    retention.purge()
+    assert not retained.exists()
@@ -0,0 +1,79 @@
+import logging
+import threading
+import time
+
+from wfsOutputExtension.singleflight import POLL_INTERVAL, SingleFlight
+
+LOGGER = logging.getLogger('server')
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+def _join_later(single_flight: SingleFlight, key: str, results: list) -> threading.Thread:
+    """ Join the export in a thread, like a request of another process. """
+    thread = threading.Thread(target=lambda: results.append(single_flight.join(key, 'gpkg')))
+    thread.start()
+    # The request is waiting for the lock
+    time.sleep(2 * POLL_INTERVAL)
+    return thread
+
+
+def test_single_flight_shared_output(tmp_path):
+    """ Test the identical request waits for the output of the first one. """
+    single_flight = SingleFlight(tmp_path.joinpath('inflight'), max_wait=10)
+    assert single_flight.enabled
+
+    lock, output = single_flight.join('key', 'gpkg')
+    assert lock is not None
+    assert output is None
+
+    results = []
+    thread = _join_later(single_flight, 'key', results)
+
+    output_file = tmp_path.joinpath('to-gpkg.gpkg')
+    output_file.write_bytes(b'output')
+    spool = single_flight.publish(lock, 'key', 'gpkg', output_file)
+    thread.join()
+
+    assert results == [(None, spool)]
+    # The output file is not moved
+    output_file.unlink()
+    assert spool.read_bytes() == b'output'
+
+    # A later request runs its own export
+    lock, output = single_flight.join('key', 'gpkg')
+    assert lock is not None
+    assert output is None
+    single_flight.release(lock)
+
+
+def test_single_flight_failed_export(tmp_path):
+    """ Test the identical request runs the export if the first one has failed. """
+    single_flight = SingleFlight(tmp_path, max_wait=10)
+    lock, _ = single_flight.join('key', 'gpkg')
+
+    results = []
+    thread = _join_later(single_flight, 'key', results)
+    single_flight.release(lock)
+    thread.join()
+
+    (lock, output), = results
+    assert lock is not None
+    assert output is None
+    single_flight.release(lock)
+
+
+def test_single_flight_wait(tmp_path):
+    """ Test the identical request does not wait too long. """
+    single_flight = SingleFlight(tmp_path, max_wait=0.5)
+    lock, _ = single_flight.join('key', 'gpkg')
+    assert single_flight.join('key', 'gpkg') == (None, None)
+    # Other requests are not blocked
+    other, _ = single_flight.join('other', 'gpkg')
+    assert other is not None
+    single_flight.release(other)
+    single_flight.release(lock)
+
+    assert not SingleFlight(tmp_path, max_wait=0).enabled
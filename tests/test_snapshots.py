@@ -0,0 +1,122 @@
+import logging
+import os
+import time
+
+from wfsOutputExtension.definitions import OutputFormats
+from wfsOutputExtension.retention import request_key
+from wfsOutputExtension.snapshots import Snapshots, source_stamps
+
+LOGGER = logging.getLogger('server')
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+def _record(snapshots, tmp_path, project, source):
+    stamps = source_stamps([str(project), str(source)])
+    export = tmp_path.joinpath('export')
+    export.write_bytes(b'zip content')
+    return snapshots.record(str(project), 'lines', OutputFormats.Shp, export, stamps, time.time())
+
+
+def test_snapshot_lookup(tmp_path):
+    """ Test a snapshot is served while its sources are not modified. """
+    project = tmp_path.joinpath('project.qgs')
+    project.write_text('<qgis/>')
+    source = tmp_path.joinpath('lines.gpkg')
+    source.write_bytes(b'data')
+    snapshots = Snapshots(tmp_path.joinpath('snapshots'), max_age=0)
+
+    target = _record(snapshots, tmp_path, project, source)
+    assert target.name == 'lines.zip'
+    assert target.read_bytes() == b'zip content'
+
+    params = {'SERVICE': 'WFS', 'REQUEST': 'GetFeature', 'TYPENAME': 'lines', 'OUTPUTFORMAT': 'shp'}
+    assert snapshots.lookup(str(project), params, OutputFormats.Shp) == target
+    # Another format
+    assert snapshots.lookup(str(project), params, OutputFormats.Gpkg) is None
+    # A filtered request
+    assert snapshots.lookup(str(project), {**params, 'BBOX': '0,0,1,1'}, OutputFormats.Shp) is None
+    # Not a single layer
+    assert snapshots.lookup(str(project), {**params, 'TYPENAME': 'lines,points'}, OutputFormats.Shp) is None
+    assert snapshots.lookup(str(project), {**params, 'TYPENAME': '../lines'}, OutputFormats.Shp) is None
+
+    # The source is modified
+    source.write_bytes(b'new data')
+    os.utime(source, ns=(time.time_ns() + 10**9, time.time_ns() + 10**9))
+    assert snapshots.lookup(str(project), params, OutputFormats.Shp) is None
+
+    _record(snapshots, tmp_path, project, source)
+    assert snapshots.lookup(str(project), params, OutputFormats.Shp) == target
+
+
+def test_snapshot_max_age(tmp_path):
+    """ Test a snapshot expires after its maximum age. """
+    project = tmp_path.joinpath('project.qgs')
+    project.write_text('<qgis/>')
+    source = tmp_path.joinpath('lines.gpkg')
+    source.write_bytes(b'data')
+    snapshots = Snapshots(tmp_path.joinpath('snapshots'), max_age=60)
+    params = {'SERVICE': 'WFS', 'REQUEST': 'GetFeature', 'TYPENAME': 'lines', 'OUTPUTFORMAT': 'shp'}
+
+    target = _record(snapshots, tmp_path, project, source)
+    assert snapshots.lookup(str(project), params, OutputFormats.Shp) == target
+
+    stamps = source_stamps([str(project), str(source)])
+    export = tmp_path.joinpath('export')
+    export.write_bytes(b'zip content')
+    snapshots.record(str(project), 'lines', OutputFormats.Shp, export, stamps, time.time() - 120)
+    assert snapshots.lookup(str(project), params, OutputFormats.Shp) is None
+
+    assert Snapshots(None, 0).lookup(str(project), params, OutputFormats.Shp) is None
+
+
+def test_snapshot_variant(tmp_path):
+    """ Test the cached FlatGeobuf of a user is not served to another one. """
+    project = tmp_path.joinpath('project.qgs')
+    project.write_text('<qgis/>')
+    snapshots = Snapshots(tmp_path.joinpath('fgb'), max_age=60)
+    params = {'SERVICE': 'WFS', 'REQUEST': 'GetFeature', 'TYPENAME': 'lines', 'OUTPUTFORMAT': 'fgb'}
+
+    export = tmp_path.joinpath('export')
+    export.write_bytes(b'fgb content')
+    stamps = source_stamps([str(project)])
+    target = snapshots.record(str(project), 'lines', OutputFormats.Fgb, export, stamps, time.time(), 'user-a')
+
+    assert snapshots.lookup(str(project), params, OutputFormats.Fgb, 'user-a') == target
+    assert snapshots.lookup(str(project), params, OutputFormats.Fgb, 'user-b') is None
+    assert snapshots.lookup(str(project), params, OutputFormats.Fgb) is None
+
+
+def test_getfeature_snapshot_by_user(client, wfs_filter, tmp_path, monkeypatch):
+    """ Test a snapshot is only served to the user it has been exported for. """
+    snapshots = Snapshots(tmp_path.joinpath('snapshots'), max_age=0)
+    monkeypatch.setattr(wfs_filter, 'snapshots', snapshots)
+    project = client.getprojectpath('lines.qgs').strpath
+    stamps = source_stamps([os.path.abspath(project)])
+    query_string = (
+        "?"
+        "SERVICE=WFS&"
+        "VERSION=1.1.0&"
+        "REQUEST=GetFeature&"
+        "TYPENAME=lines&"
+        "OUTPUTFORMAT=SHP&"
+        "MAP=lines.qgs"
+    )
+
+    # Exported for another user
+    export = tmp_path.joinpath('export')
+    export.write_bytes(b'zip content')
+    snapshots.record(project, 'lines', OutputFormats.Shp, export, stamps, time.time(), 'user-a')
+    rv = client.get(query_string, 'lines.qgs')
+    assert rv.status_code == 200
+    assert rv.content != b'zip content'
+
+    # Exported like pregenerate, without the headers of a user
+    anonymous = request_key({}, "", {name: "" for name in wfs_filter.key_headers})
+    export.write_bytes(b'zip content')
+    snapshots.record(project, 'lines', OutputFormats.Shp, export, stamps, time.time(), anonymous)
+    rv = client.get(query_string, 'lines.qgs')
+    assert rv.status_code == 200
+    assert rv.content == b'zip content'
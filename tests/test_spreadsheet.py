@@ -0,0 +1,75 @@
+import logging
+
+import pytest
+
+from qgis.core import QgsFeature, QgsVectorLayer
+from qgis.PyQt.QtCore import NULL, QDate, QDateTime, QVariant
+
+from wfsOutputExtension.spreadsheet import column_name, sheet_name, write_spreadsheet
+
+LOGGER = logging.getLogger('server')
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+def test_names():
+    """ Test the names of the columns and of the sheets. """
+    assert column_name(0) == 'A'
+    assert column_name(25) == 'Z'
+    assert column_name(26) == 'AA'
+    assert column_name(702) == 'AAA'
+    assert sheet_name('lines', 1) == 'lines'
+    assert sheet_name('lines', 2) == 'lines_2'
+    assert sheet_name('a:b', 1) == 'a_b'
+    assert len(sheet_name('a' * 40, 12)) == 31
+
+
+@pytest.mark.parametrize('extension, storage', [('xlsx', 'XLSX'), ('ods', 'ODS')])
+def test_write_spreadsheet(client, tmp_path, extension, storage):
+    """ Test the spreadsheet is read by OGR, with a new sheet when a sheet is full. """
+    layer = QgsVectorLayer(
+        'None?field=id:integer&field=code:string&field=name:string&field=date_time:datetime&field=date:date',
+        'lines', 'memory')
+    features = []
+    for i in range(5):
+        feature = QgsFeature(layer.fields())
+        feature.setAttributes([
+            i + 1, '05200', f'Line <{i}> & "é"' if i else NULL,
+            QDateTime(2023, 8, 1, 12, 0), QDate(2023, 8, 1),
+        ])
+        features.append(feature)
+
+    output_file = tmp_path.joinpath(f'to-{extension}.{extension}')
+    # 2 features by sheet, with the header
+    assert write_spreadsheet(features, output_file, layer.fields(), extension, 'lines', max_rows=3) == 3
+
+    sheets = [
+        QgsVectorLayer(f'{output_file}|layername={name}', name, 'ogr')
+        for name in ('lines', 'lines_2', 'lines_3')
+    ]
+    for sheet in sheets:
+        assert sheet.isValid()
+        assert sheet.storageType() == storage
+        assert sheet.fields().names() == ['id', 'code', 'name', 'date_time', 'date']
+    assert [sheet.featureCount() for sheet in sheets] == [2, 2, 1]
+
+    sheet = sheets[0]
+    index = sheet.fields().indexFromName('id')
+    assert sheet.uniqueValues(index) == {1, 2}
+    assert sheet.fields().at(index).type() == QVariant.Int
+
+    index = sheet.fields().indexFromName('code')
+    assert sheet.uniqueValues(index) == {'05200'}
+
+    index = sheet.fields().indexFromName('name')
+    assert sheet.uniqueValues(index) == {NULL, 'Line <1> & "é"'}
+
+    index = sheet.fields().indexFromName('date_time')
+    assert sheet.uniqueValues(index) == {QDateTime(2023, 8, 1, 12, 0)}
+    assert sheet.fields().at(index).type() == QVariant.DateTime
+
+    index = sheet.fields().indexFromName('date')
+    assert sheet.uniqueValues(index) == {QDate(2023, 8, 1)}
+    assert sheet.fields().at(index).type() == QVariant.Date
@@ -0,0 +1,70 @@
+import logging
+import os
+import time
+
+import pytest
+
+from wfsOutputExtension.storage import TempQuotaExceeded, TempStorage
+
+LOGGER = logging.getLogger('server')
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+PREFIX = 'QGIS_WfsOutputExtension-'
+
+
+def test_temp_storage_quota(tmp_path):
+    """ Test the quota of a request directory. """
+    storage = TempStorage(tmp_path, PREFIX, quota=10, max_age=0, sweep_interval=0)
+    lock_dir, temp_dir = storage.create(keep=False)
+    assert temp_dir.name.startswith(PREFIX)
+
+    temp_dir.joinpath('features.gml').write_bytes(b'0123456789')
+    assert storage.check_quota(temp_dir) == 10
+
+    temp_dir.joinpath('features.xsd').write_bytes(b'0')
+    with pytest.raises(TempQuotaExceeded):
+        storage.check_quota(temp_dir)
+
+    lock_dir.cleanup()
+    assert not temp_dir.exists()
+
+
+def test_temp_storage_sweep(tmp_path):
+    """ Test stale directories are removed. """
+    storage = TempStorage(tmp_path, PREFIX, quota=0, max_age=3600, sweep_interval=3600)
+    _, stale = storage.create(keep=True)
+    _, recent = storage.create(keep=True)
+    other = tmp_path.joinpath('other')
+    other.mkdir()
+
+    two_hours_ago = time.time() - 7200
+    for path in (stale, other):
+        os.utime(path, (two_hours_ago, two_hours_ago))
+
+    storage.sweep()
+    assert not stale.exists()
+    assert recent.exists()
+    assert other.exists()
+
+
+def test_temp_storage_first_sweep(tmp_path, monkeypatch):
+    """ Test the first sweep is done even if the monotonic clock is below the interval. """
+    # A host started a minute ago
+    monkeypatch.setattr(time, 'monotonic', lambda: 60.0)
+    storage = TempStorage(tmp_path, PREFIX, quota=0, max_age=3600, sweep_interval=3600)
+    _, stale = storage.create(keep=True)
+    two_hours_ago = time.time() - 7200
+    os.utime(stale, (two_hours_ago, two_hours_ago))
+
+    storage.sweep_if_due()
+    assert not stale.exists()
+    assert storage.last_sweep == 60.0
+
+    # Not before the interval
+    _, stale = storage.create(keep=True)
+    os.utime(stale, (two_hours_ago, two_hours_ago))
+    storage.sweep_if_due()
+    assert stale.exists()
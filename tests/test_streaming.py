@@ -0,0 +1,92 @@
+import io
+import logging
+
+import pytest
+
+from qgis.core import QgsVectorLayer
+
+from wfsOutputExtension import streaming
+from wfsOutputExtension.streaming import (
+    CHUNK_SIZE,
+    FlushPolicy,
+    RangeNotSatisfiable,
+    parse_range,
+    stream_bytes,
+)
+
+LOGGER = logging.getLogger('server')
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+def test_stream_bytes_flush_policy(handler):
+    """ Test the body is flushed according to the size budget. """
+    content = bytes(range(256)) * (CHUNK_SIZE // 64)  # 4 chunks
+    policy = FlushPolicy(max_bytes=2 * CHUNK_SIZE, max_delay=3600)
+    sent = stream_bytes(handler, io.BufferedReader(io.BytesIO(content)), policy)
+    assert sent == len(content)
+    assert bytes(handler.sent) == content
+    assert handler.flushes == [2 * CHUNK_SIZE, 4 * CHUNK_SIZE]
+
+
+def test_stream_bytes_last_flush(handler):
+    """ Test the remaining body is flushed at the end. """
+    content = b'x' * (CHUNK_SIZE + 10)
+    policy = FlushPolicy(max_bytes=4 * CHUNK_SIZE, max_delay=3600)
+    stream_bytes(handler, io.BufferedReader(io.BytesIO(content)), policy)
+    assert bytes(handler.sent) == content
+    assert handler.flushes == [CHUNK_SIZE + 10]
+
+
+def test_stream_bytes_length(handler):
+    """ Test only the requested length is sent. """
+    content = b'0123456789' * CHUNK_SIZE
+    stream = io.BufferedReader(io.BytesIO(content))
+    stream.seek(5)
+    sent = stream_bytes(handler, stream, FlushPolicy(max_bytes=CHUNK_SIZE, max_delay=3600), CHUNK_SIZE + 3)
+    assert sent == CHUNK_SIZE + 3
+    assert bytes(handler.sent) == content[5:CHUNK_SIZE + 8]
+
+
+def test_parse_range():
+    """ Test the Range header. """
+    assert parse_range('bytes=0-99', 1000) == (0, 99)
+    assert parse_range('bytes=500-', 1000) == (500, 999)
+    assert parse_range('bytes=900-2000', 1000) == (900, 999)
+    assert parse_range('bytes=-100', 1000) == (900, 999)
+    assert parse_range('bytes=-2000', 1000) == (0, 999)
+
+    # Ignored, the whole file is sent
+    assert parse_range('bytes=0-10,20-30', 1000) is None
+    assert parse_range('items=0-10', 1000) is None
+    assert parse_range('bytes=10-5', 1000) is None
+    assert parse_range('bytes=a-b', 1000) is None
+
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range('bytes=1000-', 1000)
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range('bytes=-0', 1000)
+
+
+def test_getfeature_streamed_chunks(client, wfs_filter, monkeypatch):
+    """ Test the body of an export sent in several chunks by the request handler of QGIS Server. """
+    monkeypatch.setattr(streaming, 'CHUNK_SIZE', 512)
+    monkeypatch.setattr(wfs_filter, 'flush_policy', FlushPolicy(max_bytes=1024, max_delay=3600))
+    query_string = (
+        "?"
+        "SERVICE=WFS&"
+        "VERSION=1.1.0&"
+        "REQUEST=GetFeature&"
+        "TYPENAME=lines&"
+        "OUTPUTFORMAT=GPKG&"
+        "MAP=lines.qgs"
+    )
+    rv = client.get(query_string, 'lines.qgs')
+    assert rv.status_code == 200
+    # Several chunks
+    assert len(rv.content) > 4 * 512
+    layer = QgsVectorLayer(rv.file('gpkg'), 'lines', 'ogr')
+    assert layer.isValid()
+    assert layer.featureCount() == 4
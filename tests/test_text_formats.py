@@ -0,0 +1,91 @@
+import logging
+
+from typing import List, Optional, Tuple
+
+import pytest
+
+from qgis.core import (
+    QgsCoordinateTransformContext,
+    QgsVectorFileWriter,
+    QgsVectorLayer,
+)
+
+from wfsOutputExtension.definitions import OutputFormats
+from wfsOutputExtension.text_formats import (
+    csv_escape,
+    text_writer_supported,
+    write_text,
+)
+
+LOGGER = logging.getLogger('server')
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+def _features(file_path: str) -> Tuple[List[str], List[Tuple[List[str], Optional[str]]]]:
+    layer = QgsVectorLayer(file_path, 'output', 'ogr')
+    assert layer.isValid(), file_path
+    return layer.fields().names(), [
+        (
+            [str(value) for value in feature.attributes()],
+            feature.geometry().asWkt(9) if feature.hasGeometry() else None,
+        )
+        for feature in layer.getFeatures()
+    ]
+
+
+def test_csv_escape():
+    """ Test the values are quoted like the OGR CSV driver. """
+    assert csv_escape('Line name', True) == 'Line name'
+    assert csv_escape('05200', True) == '"05200"'
+    assert csv_escape('05200', False) == '05200'
+    assert csv_escape('a, "b"', False) == '"a, ""b"""'
+
+
+@pytest.mark.parametrize('extension, layer_name', [('csv', None), ('kml', None), ('gpx', 'routes')])
+def test_write_text_like_ogr(client, tmp_path, extension, layer_name):
+    """ Test the output of the plugin is read like the output of OGR. """
+    layer = QgsVectorLayer(str(client.getprojectpath('lines.geojson')), 'lines', 'ogr')
+    assert layer.isValid()
+    assert text_writer_supported(extension, layer.fields(), layer.wkbType())
+    format_definition = OutputFormats.find(extension)
+
+    # Golden file, written by OGR
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = format_definition.ogr_provider
+    options.fileEncoding = 'utf-8'
+    options.datasourceOptions = list(format_definition.ogr_datasource_options)
+    ogr_file = tmp_path.joinpath(f'ogr.{extension}')
+    # noinspection PyArgumentList
+    result, message, _, _ = QgsVectorFileWriter.writeAsVectorFormatV3(
+        layer, str(ogr_file), QgsCoordinateTransformContext(), options)
+    assert result == QgsVectorFileWriter.NoError, message
+
+    output_file = tmp_path.joinpath(f'plugin.{extension}')
+    write_text(layer.getFeatures(), output_file, layer.fields(), extension, layer.wkbType(), 'lines')
+
+    suffix = f'|layername={layer_name}' if layer_name else ''
+    expected_fields, expected = _features(f'{ogr_file}{suffix}')
+    fields, features = _features(f'{output_file}{suffix}')
+    assert fields == expected_fields
+    assert len(features) == layer.featureCount()
+    assert features == expected
+
+
+def test_text_writer_supported():
+    """ Test the layers written by OGR. """
+    layer = QgsVectorLayer(
+        'Point?field=name:string&field=time:datetime', 'points', 'memory')
+    # The time of a waypoint is written by OGR
+    assert not text_writer_supported('gpx', layer.fields(), layer.wkbType())
+    assert text_writer_supported('kml', layer.fields(), layer.wkbType())
+
+    layer = QgsVectorLayer('Polygon?field=name:string', 'polygons', 'memory')
+    assert not text_writer_supported('gpx', layer.fields(), layer.wkbType())
+    assert text_writer_supported('csv', layer.fields(), layer.wkbType())
+    assert not text_writer_supported('shp', layer.fields(), layer.wkbType())
+
+    layer = QgsVectorLayer('CurvePolygon?field=name:string', 'curves', 'memory')
+    assert not text_writer_supported('kml', layer.fields(), layer.wkbType())
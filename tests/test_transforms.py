@@ -0,0 +1,30 @@
+import logging
+
+from qgis.core import QgsCoordinateReferenceSystem, QgsCoordinateTransformContext
+
+from wfsOutputExtension.transforms import TransformCache
+
+LOGGER = logging.getLogger('server')
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+def test_transform_cache():
+    """ Test transforms are reused and the cache is bounded. """
+    cache = TransformCache(max_size=2)
+    context = QgsCoordinateTransformContext()
+    wgs84 = QgsCoordinateReferenceSystem('EPSG:4326')
+    lambert = QgsCoordinateReferenceSystem('EPSG:2154')
+    mercator = QgsCoordinateReferenceSystem('EPSG:3857')
+
+    transform = cache.get(lambert, wgs84, context)
+    assert transform.sourceCrs() == lambert
+    assert transform.destinationCrs() == wgs84
+    assert cache.get(lambert, wgs84, context) is transform
+
+    cache.get(mercator, wgs84, context)
+    cache.get(lambert, mercator, context)
+    # The least recently used has been removed
+    assert cache.get(lambert, wgs84, context) is not transform
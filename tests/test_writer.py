@@ -0,0 +1,149 @@
+import logging
+
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransform,
+    QgsCoordinateTransformContext,
+    QgsFeature,
+    QgsGeometry,
+    QgsVectorFileWriter,
+    QgsVectorLayer,
+)
+
+from wfsOutputExtension.writer import (
+    SplitPolicy,
+    output_parts,
+    part_path,
+    reprojected_features,
+    simplified_features,
+    write_features,
+)
+
+LOGGER = logging.getLogger('server')
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+def test_simplified_features(client):
+    """ Test the simplification and the rounding of the geometries. """
+    feature = QgsFeature()
+    feature.setGeometry(QgsGeometry.fromWkt('LineString (0.123456 0, 1 0.001, 2.654321 0)'))
+    no_geometry = QgsFeature()
+
+    result = list(simplified_features([feature, no_geometry], 0.01, 2))
+    assert len(result) == 2
+    assert result[0].geometry().asWkt(6) == 'LineString (0.12 0, 2.65 0)'
+    assert not result[1].hasGeometry()
+
+    feature.setGeometry(QgsGeometry.fromWkt('LineString (0.123456 0, 1 0.001, 2.654321 0)'))
+    result = list(simplified_features([feature], 0, 1))
+    assert result[0].geometry().asWkt(6) == 'LineString (0.1 0, 1 0, 2.7 0)'
+
+
+def test_write_features_split(client, tmp_path):
+    """ Test the features are written in several parts when a part is full. """
+    layer = QgsVectorLayer(str(client.getprojectpath('lines.geojson')), 'lines', 'ogr')
+    assert layer.isValid()
+    count = layer.featureCount()
+    assert count > 2
+
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = 'ESRI Shapefile'
+    options.fileEncoding = 'utf-8'
+    output_file = tmp_path.joinpath('to-shp.shp')
+    result, message = write_features(
+        layer.getFeatures(),
+        output_file,
+        layer.fields(),
+        layer.wkbType(),
+        layer.crs(),
+        QgsCoordinateTransformContext(),
+        options,
+        split=SplitPolicy(max_bytes=0, max_features=2, extensions=('shx', 'dbf', 'prj')),
+    )
+    assert result == QgsVectorFileWriter.NoError, message
+
+    parts = output_parts(output_file)
+    assert parts[0] == output_file
+    assert parts[1] == tmp_path.joinpath('to-shp_part2.shp')
+    assert len(parts) == (count + 1) // 2
+    assert part_path(output_file, 3) == tmp_path.joinpath('to-shp_part3.shp')
+
+    written = 0
+    for part in parts:
+        assert part.with_suffix('.dbf').exists()
+        part_layer = QgsVectorLayer(str(part), 'part', 'ogr')
+        assert part_layer.isValid()
+        assert part_layer.featureCount() <= 2
+        written += part_layer.featureCount()
+    assert written == count
+
+
+def test_write_features_projection_error(client, tmp_path):
+    """ Test a geometry which can not be reprojected stops the writer with its error code. """
+    layer = QgsVectorLayer('Point?crs=EPSG:4326', 'points', 'memory')
+    feature = QgsFeature()
+    # Outside of the domain of the projection
+    feature.setGeometry(QgsGeometry.fromWkt('Point (0 95)'))
+    layer.dataProvider().addFeatures([feature])
+    transform = QgsCoordinateTransform(
+        layer.crs(),
+        QgsCoordinateReferenceSystem('EPSG:3857'),
+        QgsCoordinateTransformContext(),
+    )
+
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = 'GPKG'
+    result, message = write_features(
+        reprojected_features(layer, transform, 10),
+        tmp_path.joinpath('to-gpkg.gpkg'),
+        layer.fields(),
+        layer.wkbType(),
+        transform.destinationCrs(),
+        QgsCoordinateTransformContext(),
+        options,
+    )
+    assert result == QgsVectorFileWriter.ErrProjection
+    assert message
+
+
+def test_write_features_split_reprojected(client, tmp_path):
+    """ Test the parts of a reprojected output are in the destination CRS. """
+    layer = QgsVectorLayer(str(client.getprojectpath('lines.geojson')), 'lines', 'ogr')
+    assert layer.isValid()
+    transform = QgsCoordinateTransform(
+        layer.crs(),
+        QgsCoordinateReferenceSystem('EPSG:3857'),
+        QgsCoordinateTransformContext(),
+    )
+
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = 'ESRI Shapefile'
+    options.fileEncoding = 'utf-8'
+    output_file = tmp_path.joinpath('to-shp.shp')
+    result, message = write_features(
+        reprojected_features(layer, transform, 10),
+        output_file,
+        layer.fields(),
+        layer.wkbType(),
+        transform.destinationCrs(),
+        QgsCoordinateTransformContext(),
+        options,
+        split=SplitPolicy(max_bytes=0, max_features=2, extensions=('shx', 'dbf', 'prj')),
+    )
+    assert result == QgsVectorFileWriter.NoError, message
+
+    expected = [feature.geometry() for feature in layer.getFeatures()]
+    for geometry in expected:
+        geometry.transform(transform)
+    written = []
+    for part in output_parts(output_file):
+        part_layer = QgsVectorLayer(str(part), 'part', 'ogr')
+        assert part_layer.crs().authid() == 'EPSG:3857'
+        written.extend(feature.geometry() for feature in part_layer.getFeatures())
+
+    assert len(written) == len(expected)
+    for geometry, result_geometry in zip(expected, written):
+        assert geometry.boundingBox().center().distance(result_geometry.boundingBox().center()) < 1e-3
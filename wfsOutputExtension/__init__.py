@@ -3,7 +3,6 @@ __license__ = 'GPL version 3'
 __email__ = 'info@3liz.org'
 
 from wfsOutputExtension.logging import Logger
-from wfsOutputExtension.plausible import Plausible
 
 
 # noinspection PyPep8Naming
@@ -43,18 +42,23 @@ class WfsOutputExtensionServer:
     def __init__(self, server_iface):
         self.serverIface = server_iface
         self.logger = Logger()
+        self.plausible = None
 
+        from .wfs_filter import WFSFilter
+        # Sent after the first response, the start of the server is not delayed
+        server_iface.registerFilter(WFSFilter(server_iface, on_first_response=self.request_stat_event), 50)
+
+    def request_stat_event(self) -> None:
+        """ Send the event to the API stats. """
         # noinspection PyBroadException
         try:
+            from .plausible import Plausible
             self.plausible = Plausible()
             self.plausible.request_stat_event()
         except Exception as e:
             self.logger.log_exception(e)
             self.logger.critical('Error while calling the API stats')
 
-        from .wfs_filter import WFSFilter
-        server_iface.registerFilter(WFSFilter(server_iface), 50)
-
 
 # noinspection PyPep8Naming
 def serverClassFactory(server_iface):
@@ -0,0 +1,129 @@
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, heavy exports are not limited
+    fcntl = None
+
+from wfsOutputExtension.definitions import Format
+from wfsOutputExtension.logging import Logger
+
+
+class AdmissionRejected(Exception):
+    """ When no slot has been available for a heavy export. """
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"No slot available for a heavy export, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionControl:
+    """ Limit the number of heavy exports running at the same time in all server processes.
+
+    Each slot is a lock file in a directory shared by the processes. A slot is taken by holding
+    an exclusive lock on its file, the lock is released by the system if the process dies.
+    """
+
+    def __init__(self, lock_dir: Path, max_slots: int, max_wait: float, retry_after: int):
+        self.lock_dir = lock_dir
+        self.max_slots = max_slots
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+        self.logger = Logger()
+        if self.enabled:
+            self.lock_dir.mkdir(exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return fcntl is not None and self.max_slots > 0
+
+    def is_heavy(self, format_definition: Format, estimated_size: int) -> bool:
+        """ If the export must take a slot, according to the format and the size of the GML. """
+        if format_definition.heavy_size is None:
+            return False
+        return estimated_size >= format_definition.heavy_size
+
+    def _open(self, index: int) -> int:
+        return os.open(self.lock_dir.joinpath(f"slot-{index}.lock"), os.O_RDWR | os.O_CREAT, 0o666)
+
+    def _try_acquire(self) -> Optional[int]:
+        """ Return the file descriptor of the slot taken, None if all slots are busy. """
+        for index in range(self.max_slots):
+            fd = self._open(index)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                continue
+            return fd
+        return None
+
+    def _wait_acquire(self, timeout: float) -> Optional[int]:
+        """ Block on the locks of all the slots until one is released, at most timeout seconds.
+
+        flock has no timeout, a thread waits for each slot. The first lock is the slot taken, the
+        locks obtained after it or after the timeout are released at once by their threads.
+
+        :return: The file descriptor of the slot taken, None if no slot has been released
+        """
+        claim = threading.Lock()
+        acquired = threading.Event()
+        taken: List[int] = []
+
+        def wait(index: int) -> None:
+            fd = self._open(index)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with claim:
+                if not acquired.is_set():
+                    acquired.set()
+                    taken.append(fd)
+                    return
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+        for index in range(self.max_slots):
+            threading.Thread(target=wait, args=(index,), daemon=True).start()
+
+        acquired.wait(timeout)
+        with claim:
+            # The threads still waiting release their lock as soon as they get it
+            acquired.set()
+            return taken[0] if taken else None
+
+    @contextmanager
+    def slot(self, format_definition: Format, estimated_size: int, request_id: str = "") -> Iterator[None]:
+        """ Hold a slot during the export if it is a heavy one.
+
+        :raise AdmissionRejected when no slot has been released during the maximum wait time
+        """
+        if not self.enabled or not self.is_heavy(format_definition, estimated_size):
+            yield
+            return
+
+        start = time.monotonic()
+        fd = self._try_acquire()
+        if fd is None and self.max_wait > 0:
+            fd = self._wait_acquire(self.max_wait)
+        if fd is None:
+            self.logger.warning(
+                f"REQ_ID:{request_id or '-'}\t heavy export rejected, {self.max_slots} exports running")
+            raise AdmissionRejected(self.retry_after)
+
+        self.logger.info(
+            f"REQ_ID:{request_id or '-'}\t heavy export admitted after {round(time.monotonic() - start, 2)}s")
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
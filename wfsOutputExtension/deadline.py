@@ -0,0 +1,66 @@
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import time
+
+from typing import Iterable, Iterator
+
+from qgis.core import QgsFeature, QgsFeedback
+
+# Number of features written between two checks of the deadline
+CHECK_INTERVAL = 100
+
+
+class ExportCancelled(Exception):
+    """ When the export has lasted longer than the deadline of its format. """
+
+    def __init__(self, step: str, elapsed: float):
+        super().__init__(f"Export cancelled during the step '{step}' after {round(elapsed, 1)}s")
+        self.step = step
+        self.elapsed = elapsed
+
+
+class Deadline:
+    """ Cancel the export of a request lasting longer than the maximum time.
+
+    The feedback is given to the vector file writer of QGIS, which reports its progress and stops
+    when the feedback is canceled. The loops of the plugin check the deadline themselves.
+    """
+
+    def __init__(self, seconds: float):
+        # Maximum time in seconds since the request has been accepted
+        self.seconds = seconds
+        self.start = time.monotonic()
+        self.feedback = QgsFeedback()
+        # Emitted by the writer between the features, in the thread of the request
+        self.feedback.progressChanged.connect(self.update)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def update(self, _progress: float = 0) -> None:
+        """ Cancel the feedback if the deadline has passed. """
+        if not self.feedback.isCanceled() and self.elapsed >= self.seconds:
+            self.feedback.cancel()
+
+    def is_canceled(self) -> bool:
+        self.update()
+        return self.feedback.isCanceled()
+
+    def check(self, step: str) -> None:
+        """ Stop the export if the deadline has passed.
+
+        :raise ExportCancelled
+        """
+        if self.is_canceled():
+            raise ExportCancelled(step, self.elapsed)
+
+
+def cancellable(features: Iterable[QgsFeature], deadline: Deadline) -> Iterator[QgsFeature]:
+    """ Stop iterating the features when the deadline has passed, the caller checks the deadline after. """
+    for count, feature in enumerate(features):
+        if count % CHECK_INTERVAL == 0 and deadline.is_canceled():
+            return
+        yield feature
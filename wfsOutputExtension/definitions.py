@@ -3,10 +3,27 @@ __license__ = 'GPL version 3'
 __email__ = 'info@3liz.org'
 
 from enum import Enum
-from typing import NamedTuple, Union
+from typing import Dict, NamedTuple, Optional, Union
 
 PLUGIN = 'WfsOutputExtension'
 
+MB = 1024 * 1024
+
+
+class Intermediate(NamedTuple):
+    """ Format of the features returned by QGIS Server, read by OGR. """
+    output_format: str
+    extension: str
+    # Version of the DescribeFeatureType request giving the schema, None if not needed
+    schema_version: Optional[str]
+
+
+INTERMEDIATE_FORMATS: Dict[str, Intermediate] = {
+    'gml2': Intermediate(output_format='GML2', extension='gml', schema_version='1.0.0'),
+    'gml3': Intermediate(output_format='GML3', extension='gml', schema_version='1.1.0'),
+    'geojson': Intermediate(output_format='GeoJSON', extension='geojson', schema_version=None),
+}
+
 
 class Format(NamedTuple):
     content_type: str
@@ -16,6 +33,19 @@ class Format(NamedTuple):
     ogr_datasource_options: tuple
     zip: bool
     ext_to_zip: tuple
+    ogr_layer_options: tuple = ()
+    # GDAL configuration options set while writing the file
+    ogr_config_options: tuple = ()
+    # Size of the GML above which the export is limited by the admission control
+    heavy_size: Union[int, None] = None
+    # Table format, the geometry can be skipped with GEOMETRY=none
+    table: bool = False
+    # Key of INTERMEDIATE_FORMATS, the format requested to QGIS Server
+    intermediate: str = 'gml2'
+    # Written in several files when a file reaches the limits of the format
+    split: bool = False
+    # Package of vector tiles, with the zoom levels and the simplification of the configuration
+    tiles: bool = False
     """ Format available for exporting data. """
 
 
@@ -37,6 +67,8 @@ class OutputFormats(Format, Enum):
         ogr_datasource_options=(),
         zip=True,
         ext_to_zip=('shx', 'dbf', 'prj', 'cpg'),
+        heavy_size=20 * MB,
+        split=True,
     )
     Tab = Format(
         content_type='application/x-zipped-tab',
@@ -46,6 +78,8 @@ class OutputFormats(Format, Enum):
         ogr_datasource_options=(),
         zip=True,
         ext_to_zip=('dat', 'map', 'id'),
+        heavy_size=20 * MB,
+        split=True,
     )
     Mif = Format(
         content_type='application/x-zipped-mif',
@@ -55,6 +89,7 @@ class OutputFormats(Format, Enum):
         ogr_datasource_options=('FORMAT=MIF',),
         zip=True,
         ext_to_zip=('mid',),
+        heavy_size=20 * MB,
     )
     Kml = Format(
         content_type='application/vnd.google-earth.kml+xml',
@@ -64,6 +99,7 @@ class OutputFormats(Format, Enum):
         ogr_datasource_options=(),
         zip=False,
         ext_to_zip=(),
+        heavy_size=100 * MB,
     )
     Gpkg = Format(
         content_type='application/geopackage+vnd.sqlite3',
@@ -73,6 +109,12 @@ class OutputFormats(Format, Enum):
         ogr_datasource_options=(),
         zip=False,
         ext_to_zip=(),
+        # The file is temporary, no need for a rollback journal nor to wait for the disk
+        ogr_config_options=(
+            'OGR_SQLITE_JOURNAL=OFF',
+            'OGR_SQLITE_SYNCHRONOUS=OFF',
+        ),
+        heavy_size=100 * MB,
     )
     Gpx = Format(
         content_type='application/gpx+xml',
@@ -86,6 +128,7 @@ class OutputFormats(Format, Enum):
         ),
         zip=False,
         ext_to_zip=(),
+        heavy_size=100 * MB,
     )
     Ods = Format(
         content_type='application/vnd.oasis.opendocument.spreadsheet',
@@ -95,6 +138,8 @@ class OutputFormats(Format, Enum):
         ogr_datasource_options=(),
         zip=False,
         ext_to_zip=(),
+        heavy_size=5 * MB,
+        table=True,
     )
     Xlsx = Format(
         content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
@@ -104,6 +149,8 @@ class OutputFormats(Format, Enum):
         ogr_datasource_options=(),
         zip=False,
         ext_to_zip=(),
+        heavy_size=5 * MB,
+        table=True,
     )
     Csv = Format(
         content_type='text/csv',
@@ -113,6 +160,8 @@ class OutputFormats(Format, Enum):
         ogr_datasource_options=(),
         zip=False,
         ext_to_zip=(),
+        heavy_size=200 * MB,
+        table=True,
     )
     Fgb = Format(
         content_type='application/x-fgb',
@@ -122,4 +171,31 @@ class OutputFormats(Format, Enum):
         ogr_datasource_options=(),
         zip=False,
         ext_to_zip=(),
+        # Packed Hilbert R-tree, clients read the features of an extent with range requests
+        ogr_layer_options=('SPATIAL_INDEX=YES',),
+        heavy_size=100 * MB,
+    )
+    Mbtiles = Format(
+        content_type='application/vnd.sqlite3',
+        filename_ext='mbtiles',
+        # The tiling scheme of the MVT writer
+        force_crs='EPSG:3857',
+        ogr_provider='MBTiles',
+        ogr_datasource_options=(),
+        zip=False,
+        ext_to_zip=(),
+        heavy_size=20 * MB,
+        tiles=True,
+    )
+    # Since GDAL 3.8, not published with an older GDAL
+    Pmtiles = Format(
+        content_type='application/vnd.pmtiles',
+        filename_ext='pmtiles',
+        force_crs='EPSG:3857',
+        ogr_provider='PMTiles',
+        ogr_datasource_options=(),
+        zip=False,
+        ext_to_zip=(),
+        heavy_size=20 * MB,
+        tiles=True,
     )
@@ -0,0 +1,116 @@
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import re
+
+from typing import List, NamedTuple, Optional
+
+from qgis.core import QgsFeatureRequest, QgsProject, QgsVectorLayer
+
+from wfsOutputExtension.definitions import Format, Intermediate
+from wfsOutputExtension.tools import layer_type_name
+
+# Number of features read to get the average size of a feature
+SAMPLE_SIZE = 100
+
+
+class Cost(NamedTuple):
+    """ Approximate bytes written for a feature. """
+    vertex: float
+    # Added to the length of the value as text
+    value: float
+    feature: float
+    # Ratio of the file size after the zip compression, or of the compressed parts
+    compression: float = 1.0
+
+
+# Without geometry for ODS, XLSX and CSV
+COSTS = {
+    'shp': Cost(vertex=16, value=4, feature=60, compression=0.6),
+    'tab': Cost(vertex=16, value=4, feature=60, compression=0.6),
+    'mif': Cost(vertex=24, value=4, feature=40, compression=0.4),
+    'kml': Cost(vertex=26, value=45, feature=300),
+    'gpkg': Cost(vertex=16, value=8, feature=90),
+    'gpx': Cost(vertex=50, value=30, feature=120),
+    'ods': Cost(vertex=0, value=60, feature=40, compression=0.15),
+    'xlsx': Cost(vertex=0, value=35, feature=30, compression=0.15),
+    'csv': Cost(vertex=0, value=1, feature=1),
+    'fgb': Cost(vertex=16, value=6, feature=80),
+    # Simplified in each tile, but written in all the zoom levels
+    'mbtiles': Cost(vertex=6, value=4, feature=30, compression=0.5),
+    'pmtiles': Cost(vertex=6, value=4, feature=30, compression=0.5),
+}
+
+# The numberOfFeatures of WFS 1.0 and 1.1, numberMatched of WFS 2.0
+HITS_REGEX = re.compile(rb'number(?:OfFeatures|Matched)="(\d+)"')
+
+
+class LayerSample(NamedTuple):
+    """ Average size of a feature of a layer. """
+    vertices: float
+    values: int
+    text_length: float
+
+
+def find_layer(project: QgsProject, type_name: str) -> Optional[QgsVectorLayer]:
+    """ The vector layer published with this type name in the WFS. """
+    for layer in project.mapLayers().values():
+        if not isinstance(layer, QgsVectorLayer):
+            continue
+        if layer_type_name(layer) == type_name or layer.id() == type_name:
+            return layer
+    return None
+
+
+def sample_layer(layer: QgsVectorLayer) -> LayerSample:
+    """ Read the first features of the layer, without serializing them. """
+    request = QgsFeatureRequest()
+    request.setLimit(SAMPLE_SIZE)
+    count = 0
+    vertices = 0
+    text_length = 0
+    for feature in layer.getFeatures(request):
+        count += 1
+        if feature.hasGeometry():
+            vertices += feature.geometry().constGet().nCoordinates()
+        text_length += sum(len(str(value)) for value in feature.attributes() if value is not None)
+
+    count = max(count, 1)
+    return LayerSample(
+        vertices=vertices / count,
+        values=layer.fields().count(),
+        text_length=text_length / count,
+    )
+
+
+def parse_hits(body: bytes) -> Optional[int]:
+    """ Number of features of a GetFeature response with RESULTTYPE=hits. """
+    match = HITS_REGEX.search(body)
+    return int(match.group(1)) if match else None
+
+
+def estimate_bytes(format_definition: Format, sample: LayerSample, feature_count: int) -> int:
+    """ Estimated size of the output file. """
+    cost = COSTS.get(format_definition.filename_ext, COSTS['gpkg'])
+    feature_size = (
+        cost.feature
+        + cost.vertex * sample.vertices
+        + cost.value * sample.values
+        + sample.text_length
+    )
+    return int(feature_size * feature_count * cost.compression)
+
+
+def pipeline_stages(format_definition: Format, intermediate: Intermediate) -> List[str]:
+    """ The stages of the export of this format. """
+    stages = [f'GetFeature {intermediate.output_format}']
+    if intermediate.schema_version:
+        stages.append(f'DescribeFeatureType {intermediate.schema_version}')
+    if format_definition.force_crs:
+        stages.append(f'Reproject {format_definition.force_crs}')
+    stages.append(f'Write {format_definition.ogr_provider}')
+    if format_definition.zip:
+        stages.append('Zip')
+    stages.append('Stream')
+    return stages
@@ -0,0 +1,139 @@
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+from typing import List, Optional, Sequence, Tuple
+
+from qgis.core import (
+    QgsAbstractGeometry,
+    QgsCoordinateTransform,
+    QgsCsException,
+    QgsGeometry,
+    QgsGeometryCollection,
+    QgsLineString,
+    QgsPoint,
+    QgsPolygon,
+    QgsWkbTypes,
+)
+
+
+def _collect(geometry: QgsAbstractGeometry, xs: List[float], ys: List[float]) -> bool:
+    """ Append the coordinates of the geometry, False if the geometry type is not supported. """
+    if isinstance(geometry, QgsPoint):
+        xs.append(geometry.x())
+        ys.append(geometry.y())
+        return True
+
+    if isinstance(geometry, QgsLineString):
+        xs.extend(geometry.xVector())
+        ys.extend(geometry.yVector())
+        return True
+
+    if isinstance(geometry, QgsPolygon):
+        rings = [geometry.exteriorRing()]
+        rings.extend(geometry.interiorRing(i) for i in range(geometry.numInteriorRings()))
+        return all(ring is None or _collect(ring, xs, ys) for ring in rings)
+
+    if isinstance(geometry, QgsGeometryCollection):
+        return all(_collect(geometry.geometryN(i), xs, ys) for i in range(geometry.numGeometries()))
+
+    # Curves
+    return False
+
+
+def _rebuild(
+        geometry: QgsAbstractGeometry, xs: Sequence[float], ys: Sequence[float], offset: int,
+) -> Tuple[QgsAbstractGeometry, int]:
+    """ Return a copy of the geometry with the coordinates read from the offset, and the next offset.
+
+    Z and M values are kept, like the writer which does not transform the Z values.
+    """
+    if isinstance(geometry, QgsPoint):
+        point = geometry.clone()
+        point.setX(xs[offset])
+        point.setY(ys[offset])
+        return point, offset + 1
+
+    if isinstance(geometry, QgsLineString):
+        end = offset + geometry.numPoints()
+        line = QgsLineString(
+            xs[offset:end],
+            ys[offset:end],
+            geometry.zVector(),
+            geometry.mVector(),
+            geometry.wkbType() == QgsWkbTypes.LineString25D,
+        )
+        return line, end
+
+    if isinstance(geometry, QgsPolygon):
+        polygon = geometry.createEmptyWithSameType()
+        exterior = geometry.exteriorRing()
+        if exterior is None:
+            return polygon, offset
+        ring, offset = _rebuild(exterior, xs, ys, offset)
+        polygon.setExteriorRing(ring)
+        for i in range(geometry.numInteriorRings()):
+            ring, offset = _rebuild(geometry.interiorRing(i), xs, ys, offset)
+            polygon.addInteriorRing(ring)
+        return polygon, offset
+
+    # Collection, the only other type accepted by _collect
+    collection = geometry.createEmptyWithSameType()
+    for i in range(geometry.numGeometries()):
+        part, offset = _rebuild(geometry.geometryN(i), xs, ys, offset)
+        collection.addGeometry(part)
+    return collection, offset
+
+
+def batch_reproject(
+        geometries: Sequence[QgsGeometry], transform: QgsCoordinateTransform,
+) -> List[QgsGeometry]:
+    """ Reproject the geometries with a single call to PROJ.
+
+    The coordinates of all the geometries are copied in one line string, its arrays are
+    transformed by PROJ at once and the geometries are then rebuilt from the arrays.
+    Geometries with curves are transformed one by one.
+
+    :raise QgsCsException when a point can not be transformed
+    """
+    xs: List[float] = []
+    ys: List[float] = []
+    # For each geometry, the offset of its first coordinate, None if transformed alone
+    offsets: List[Optional[int]] = []
+    for geometry in geometries:
+        if geometry.isNull():
+            offsets.append(None)
+            continue
+
+        size = len(xs)
+        if _collect(geometry.constGet(), xs, ys):
+            offsets.append(size)
+        else:
+            del xs[size:]
+            del ys[size:]
+            offsets.append(None)
+
+    if xs:
+        line = QgsLineString(xs, ys)
+        try:
+            # Z values are not transformed, like the vector file writer
+            line.transform(transform)
+        except QgsCsException:
+            # Transform them one by one, to raise the error of the invalid geometry
+            offsets = [None] * len(offsets)
+        else:
+            xs = line.xVector()
+            ys = line.yVector()
+
+    result = []
+    for geometry, offset in zip(geometries, offsets):
+        if geometry.isNull():
+            result.append(QgsGeometry())
+        elif offset is None:
+            copy = QgsGeometry(geometry)
+            copy.transform(transform)
+            result.append(copy)
+        else:
+            rebuilt, _ = _rebuild(geometry.constGet(), xs, ys, offset)
+            result.append(QgsGeometry(rebuilt))
+    return result
@@ -3,30 +3,86 @@ __license__ = 'GPL version 3'
 __email__ = 'info@3liz.org'
 
 import functools
+import os
+import random
 import time
 import traceback
 
 from contextlib import contextmanager
+from typing import Optional
 
 from qgis.core import Qgis, QgsMessageLog
 
 from wfsOutputExtension.definitions import PLUGIN
 
+# Values of Qgis.MessageLevel
+INFO = 0
+WARNING = 1
+CRITICAL = 2
+
+
+def server_log_level() -> int:
+    """ Minimum level of the messages written in the log of QGIS Server. """
+    level = os.getenv("WFSOUTPUTEXTENSION_LOG_LEVEL")
+    if level and level.isdigit():
+        return int(level)
+
+    try:
+        from qgis.server import QgsServerSettings
+    except ImportError:
+        # QGIS Desktop
+        return INFO
+
+    settings = QgsServerSettings()
+    settings.load()
+    return int(settings.logLevel())
+
 
 class Logger:
 
+    # Read once, when the first message is logged
+    _level: Optional[int] = None
+    # If the info messages of the current request are logged
+    _sampled = True
+
+    @classmethod
+    def level(cls) -> int:
+        if cls._level is None:
+            cls._level = server_log_level()
+        return cls._level
+
+    @classmethod
+    def enabled(cls, level: int) -> bool:
+        return level >= cls.level()
+
+    @classmethod
+    def info_enabled(cls) -> bool:
+        """ If an info message is logged, to skip building it. """
+        return cls._sampled and cls.enabled(INFO)
+
+    @classmethod
+    def sample_request(cls, rate: float) -> None:
+        """ Choose if the info messages of a new request are logged, for the given rate of requests. """
+        cls._sampled = rate >= 1 or random.random() < rate
+
     @staticmethod
     def info(message: str):
+        if not Logger.info_enabled():
+            return
         # noinspection PyTypeChecker
         QgsMessageLog.logMessage(str(message), PLUGIN, Qgis.Info)
 
     @staticmethod
     def warning(message: str):
+        if not Logger.enabled(WARNING):
+            return
         # noinspection PyTypeChecker
         QgsMessageLog.logMessage(str(message), PLUGIN, Qgis.Warning)
 
     @staticmethod
     def critical(message: str):
+        if not Logger.enabled(CRITICAL):
+            return
         # noinspection PyTypeChecker
         QgsMessageLog.logMessage(str(message), PLUGIN, Qgis.Critical)
 
@@ -59,10 +115,10 @@ def log_function(func):
     """ Decorator to log function. """
     @functools.wraps(func)
     def log_function_core(*args, **kwargs):
-        start = time.time()
+        start = time.perf_counter()
         value = func(*args, **kwargs)
-        end = time.time()
-        Logger.info(f"{func.__name__} ran in {round(end - start, 2)}s")
+        if Logger.info_enabled():
+            Logger.info(f"{func.__name__} ran in {round(time.perf_counter() - start, 2)}s")
         return value
 
     return log_function_core
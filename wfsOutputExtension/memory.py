@@ -0,0 +1,120 @@
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import os
+import sys
+
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Dict, Iterator, List, Optional
+
+from wfsOutputExtension.definitions import MB
+from wfsOutputExtension.logging import Logger
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def rss() -> int:
+    """ Resident memory of the process in bytes, 0 if not available. """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def peak_rss() -> int:
+    """ Peak resident memory of the process in bytes, since the last reset on Linux. """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return 0
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def reset_peak_rss() -> None:
+    """ Reset the peak resident memory, on Linux only. """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+class MemoryProbe:
+    """ Memory used by the stages of a request, logged with the request ID.
+
+    The top allocations of the Python code can be traced with tracemalloc, which slows down the request.
+    """
+
+    def __init__(self, request_id: str, tracemalloc_top: int = 0):
+        self.request_id = request_id or '-'
+        self.tracemalloc_top = tracemalloc_top
+        self.logger = Logger()
+        # Resident memory before the first call and after the last call of each stage
+        self.stages: Dict[str, List[int]] = {}
+        self.tracing = False
+        if tracemalloc_top:
+            # Only loaded when the allocations are traced
+            import tracemalloc
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.tracing = True
+        reset_peak_rss()
+        self.start_rss = rss()
+
+    @contextmanager
+    def stage(self, name: str, log: bool = True) -> Iterator[None]:
+        """ Measure the resident memory before and after the stage.
+
+        :param log: False for a stage called many times, only in the summary
+        """
+        before = rss()
+        if log:
+            self.logger.info(f"REQ_ID:{self.request_id}\t memory {name} start, RSS {before / MB:.1f} MB")
+        try:
+            yield
+        finally:
+            after = rss()
+            self.stages.setdefault(name, [before, after])[1] = after
+            if log:
+                self.logger.info(
+                    f"REQ_ID:{self.request_id}\t memory {name} end, RSS {after / MB:.1f} MB "
+                    f"({(after - before) / MB:+.1f} MB)")
+
+    def finish(self) -> None:
+        """ Log the summary of the request. """
+        stages = ', '.join(
+            f"{name} {(after - before) / MB:+.1f} MB" for name, (before, after) in self.stages.items())
+        self.logger.info(
+            f"REQ_ID:{self.request_id}\t memory RSS {self.start_rss / MB:.1f} MB -> {rss() / MB:.1f} MB, "
+            f"peak {peak_rss() / MB:.1f} MB, stages : {stages or '-'}")
+
+        if not self.tracing:
+            return
+
+        import tracemalloc
+
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        self.tracing = False
+        for statistic in snapshot.statistics('lineno')[:self.tracemalloc_top]:
+            self.logger.info(f"REQ_ID:{self.request_id}\t tracemalloc {statistic}")
+
+
+def stage(probe: Optional[MemoryProbe], name: str, log: bool = True) -> ContextManager[None]:
+    """ The stage of the probe, nothing if the memory is not measured. """
+    return probe.stage(name, log) if probe else nullcontext()
@@ -0,0 +1,64 @@
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, Optional, Tuple
+
+if TYPE_CHECKING:
+    from qgis.core import QgsFeature
+
+# Not part of the key of the paging snapshot, shared by all the pages
+PAGING_PARAMETERS = ('STARTINDEX', 'COUNT', 'MAXFEATURES')
+
+# Layer of the paging snapshot
+LAYER_NAME = 'features'
+# Feature ID column of the paging snapshot, not named like a column of the result
+POSITION_COLUMN = 'wfs_position'
+
+
+def requested_page(params: Dict[str, str]) -> Optional[Tuple[int, Optional[int]]]:
+    """ Index of the first feature and number of features of a paged request, None if not paged. """
+    start = params.get('STARTINDEX', '')
+    if not start.isdigit():
+        return None
+
+    count = params.get('COUNT') or params.get('MAXFEATURES') or ''
+    return int(start), int(count) if count.isdigit() else None
+
+
+def page_subset(start: int, count: Optional[int]) -> str:
+    """ Filter of the features of the page, on their positions written by numbered_features. """
+    if count is None:
+        return f"{POSITION_COLUMN} > {start}"
+    return f"{POSITION_COLUMN} > {start} AND {POSITION_COLUMN} <= {start + count}"
+
+
+def numbered_features(features: Iterable['QgsFeature']) -> Iterator['QgsFeature']:
+    """ The features with their positions in the result as feature IDs, starting at 1.
+
+    The IDs of the result are not used, they come from the GML and might have gaps.
+    """
+    for position, feature in enumerate(features, start=1):
+        feature.setId(position)
+        yield feature
+
+
+def snapshot_feature_count(path: Path) -> int:
+    """ Number of features in the paging snapshot, from the GeoPackage metadata. """
+    import sqlite3
+
+    try:
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    except sqlite3.Error:
+        return 0
+
+    try:
+        row = connection.execute(
+            "SELECT feature_count FROM gpkg_ogr_contents WHERE table_name = ?", (LAYER_NAME,),
+        ).fetchone()
+    except sqlite3.Error:
+        return 0
+    finally:
+        connection.close()
+    return row[0] if row and row[0] else 0
@@ -0,0 +1,617 @@
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import atexit
+import math
+import multiprocessing
+import os
+import re
+import sys
+import threading
+
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    BinaryIO,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+from urllib.parse import urlencode
+
+from qgis.core import QgsCoordinateReferenceSystem, QgsProject
+from qgis.PyQt.QtCore import QBuffer, QByteArray, QIODevice
+from qgis.server import (
+    QgsBufferServerRequest,
+    QgsServerInterface,
+    QgsServerProjectUtils,
+    QgsServerRequest,
+    QgsServerResponse,
+)
+
+from wfsOutputExtension.deadline import Deadline
+from wfsOutputExtension.definitions import Format
+from wfsOutputExtension.estimate import find_layer
+from wfsOutputExtension.logging import Logger
+from wfsOutputExtension.memory import MemoryProbe, stage
+from wfsOutputExtension.tools import gdal_config_options
+from wfsOutputExtension.transforms import TransformCache
+
+if TYPE_CHECKING:
+    from osgeo import ogr
+
+# The partitions are not defined if the request selects the features by other means
+EXCLUDED_PARAMETERS = (
+    'BBOX', 'FILTER', 'FEATUREID', 'MAXFEATURES', 'COUNT', 'STARTINDEX', 'SORTBY',
+    'PRECISION', 'SIMPLIFY_TOLERANCE',
+)
+
+# Driver of the partial outputs written by the pool, merged in the output format
+PARTIAL_DRIVER = 'FlatGeobuf'
+PARTIAL_EXTENSION = 'fgb'
+
+# Output formats which can be merged from the partial outputs
+PARTITION_FORMATS = ('gpkg', 'fgb', 'csv')
+
+Extent = Tuple[float, float, float, float]
+Point = Tuple[float, float]
+
+
+class PartitionError(Exception):
+    """ When a partition can not be fetched or converted. """
+    pass
+
+
+class TileGrid(NamedTuple):
+    """ Regular grid of tiles covering the extent of the request, numbered by rows. """
+    xmin: float
+    ymin: float
+    xmax: float
+    ymax: float
+    columns: int
+    rows: int
+
+    @classmethod
+    def create(cls, extent: Extent, count: int) -> 'TileGrid':
+        """ Grid of about count tiles, as square as possible. """
+        xmin, ymin, xmax, ymax = extent
+        # The extent of a single point or of aligned points
+        if xmax <= xmin:
+            xmin, xmax = xmin - 0.5, xmin + 0.5
+        if ymax <= ymin:
+            ymin, ymax = ymin - 0.5, ymin + 0.5
+        columns = max(1, round(math.sqrt(count * (xmax - xmin) / (ymax - ymin))))
+        rows = max(1, math.ceil(count / columns))
+        return cls(xmin, ymin, xmax, ymax, columns, rows)
+
+    @property
+    def count(self) -> int:
+        return self.columns * self.rows
+
+    def _x(self, column: int) -> float:
+        if column >= self.columns:
+            return self.xmax
+        return self.xmin + (self.xmax - self.xmin) * column / self.columns
+
+    def _y(self, row: int) -> float:
+        if row >= self.rows:
+            return self.ymax
+        return self.ymin + (self.ymax - self.ymin) * row / self.rows
+
+    def tile(self, index: int, margin: float = 0) -> Extent:
+        """ Extent of the tile, the tiles share their edges.
+
+        :param margin: Added on each side of the tile
+        """
+        row, column = divmod(index, self.columns)
+        return (
+            self._x(column) - margin, self._y(row) - margin,
+            self._x(column + 1) + margin, self._y(row + 1) + margin,
+        )
+
+    def owner(self, x: float, y: float) -> Optional[int]:
+        """ The tile containing the point, None if outside the grid.
+
+        The tiles are half-open, the point on an edge is in the tile on its right or above it,
+        except on the right and top edges of the grid. A point is in a single tile.
+        """
+
+        def position(value: float, start: float, end: float, size: int, edge: Callable[[int], float]) -> int:
+            if value < start or value > end:
+                return -1
+            index = min(size - 1, math.floor((value - start) / (end - start) * size))
+            # The edges computed like the extents of the tiles
+            if index > 0 and value < edge(index):
+                index -= 1
+            elif index < size - 1 and value >= edge(index + 1):
+                index += 1
+            return index
+
+        column = position(x, self.xmin, self.xmax, self.columns, self._x)
+        row = position(y, self.ymin, self.ymax, self.rows, self._y)
+        if column < 0 or row < 0:
+            return None
+        return row * self.columns + column
+
+
+class PartitionTask(NamedTuple):
+    """ Conversion of the GML of a partition, run in a process of the pool. """
+    source: str
+    open_options: Tuple[str, ...]
+    target: str
+    # Only the features owned by the tile are kept, all the features if None
+    grid: Optional[TileGrid] = None
+    tile: Optional[int] = None
+
+
+def partitionable(params: Dict[str, str]) -> bool:
+    """ If the features of the request can be fetched by tiles of its extent. """
+    if any(params.get(name) for name in EXCLUDED_PARAMETERS):
+        return False
+    type_name = params.get('TYPENAME', '')
+    return bool(type_name) and ',' not in type_name
+
+
+def partition_parameters(
+        params: Dict[str, str], bbox: Optional[Extent] = None, null_geometry: bool = False,
+) -> Dict[str, str]:
+    """ Parameters of the GetFeature request of a partition, returning GML2 in the CRS of the request.
+
+    :param bbox: Extent of the tile, in the CRS of the output
+    :param null_geometry: Only the features without geometry, not in any tile
+    """
+    parameters = {
+        name: value for name, value in params.items()
+        if name.upper() not in ('VERSION', 'OUTPUTFORMAT', 'RESULTTYPE')
+    }
+    # The axis order of the BBOX is always x, y in WFS 1.0.0
+    parameters['VERSION'] = '1.0.0'
+    parameters['OUTPUTFORMAT'] = 'GML2'
+    if bbox:
+        parameters['BBOX'] = ','.join(repr(value) for value in bbox)
+    if null_geometry:
+        expression = params.get('EXP_FILTER')
+        parameters['EXP_FILTER'] = (
+            f"({expression}) AND $geometry IS NULL" if expression else "$geometry IS NULL")
+    return parameters
+
+
+def first_point(geometry: 'ogr.Geometry') -> Optional[Point]:
+    """ The first vertex of the geometry, None if it is empty. """
+    while not geometry.GetPointCount():
+        if not geometry.GetGeometryCount():
+            return None
+        geometry = geometry.GetGeometryRef(0)
+    x, y = geometry.GetPoint_2D(0)
+    return x, y
+
+
+def owner_tile(grid: TileGrid, geometry: 'ogr.Geometry') -> Optional[int]:
+    """ The tile owning the feature, containing the first vertex of its geometry.
+
+    The vertex is on the geometry, so the request of a tile extended by a margin bigger than the
+    rounding of the coordinates in the GML returns all the features owned by the tile, whether
+    QGIS Server compares the bounding box or the geometry to the tile.
+    """
+    point = first_point(geometry)
+    return grid.owner(*point) if point else None
+
+
+def convert_partition(task: PartitionTask) -> int:
+    """ Write the features of the partition owned by its tile in a partial output, the GML is removed.
+
+    :return: The number of features written, -1 if the GML has no layer
+    """
+    from osgeo import gdal, ogr
+
+    gdal.UseExceptions()
+    try:
+        source = gdal.OpenEx(task.source, gdal.OF_VECTOR, open_options=list(task.open_options))
+        if not source.GetLayerCount():
+            return -1
+        layer = source.GetLayer(0)
+
+        target = ogr.GetDriverByName(PARTIAL_DRIVER).CreateDataSource(task.target)
+        output = target.CreateLayer(
+            layer.GetName(), layer.GetSpatialRef(), layer.GetGeomType(), ['SPATIAL_INDEX=NO'])
+        definition = layer.GetLayerDefn()
+        for index in range(definition.GetFieldCount()):
+            output.CreateField(definition.GetFieldDefn(index))
+
+        count = 0
+        for feature in layer:
+            if task.grid is not None:
+                geometry = feature.GetGeometryRef()
+                if geometry is None or owner_tile(task.grid, geometry) != task.tile:
+                    continue
+            output_feature = ogr.Feature(output.GetLayerDefn())
+            output_feature.SetFrom(feature)
+            output.CreateFeature(output_feature)
+            count += 1
+
+        # Close the files
+        del output, target, layer, source
+        return count
+    finally:
+        os.remove(task.source)
+
+
+def union_vrt(name: str, paths: Sequence[Path]) -> str:
+    """ OGR virtual layer of the union of the partial outputs. """
+    from xml.sax.saxutils import escape, quoteattr
+
+    layers = ''.join(
+        f'<OGRVRTLayer name={quoteattr(path.stem)}>'
+        f'<SrcDataSource>{escape(str(path))}</SrcDataSource></OGRVRTLayer>'
+        for path in paths)
+    return (
+        f'<OGRVRTDataSource><OGRVRTUnionLayer name={quoteattr(name)}>{layers}</OGRVRTUnionLayer>'
+        '</OGRVRTDataSource>')
+
+
+def merge_partitions(
+        paths: Sequence[Path],
+        output_file: Path,
+        driver: str,
+        name: str,
+        datasource_options: Sequence[str] = (),
+        layer_options: Sequence[str] = (),
+        canceled: Optional[Callable[[], bool]] = None,
+) -> bool:
+    """ Write the partial outputs in the output file, in a single layer.
+
+    :return: False if the merge has failed or has been canceled
+    """
+    from osgeo import gdal
+
+    vrt = output_file.with_name(f'{output_file.stem}.vrt')
+    vrt.write_text(union_vrt(name, paths), encoding='utf8')
+    options = gdal.VectorTranslateOptions(
+        format=driver,
+        layerName=name,
+        datasetCreationOptions=list(datasource_options),
+        layerCreationOptions=list(layer_options),
+        callback=(lambda *_args: 0 if canceled() else 1) if canceled else None,
+    )
+    try:
+        dataset = gdal.VectorTranslate(str(output_file), str(vrt), options=options)
+    except RuntimeError:
+        return False
+    finally:
+        vrt.unlink()
+    if dataset is None:
+        return False
+    # Close the file
+    del dataset
+    return True
+
+
+def default_executable() -> str:
+    """ The Python interpreter of the process, empty if Python is embedded in another executable. """
+    executable = sys.executable or ''
+    return executable if Path(executable).name.lower().startswith('python') else ''
+
+
+def process_pool(workers: int, executable: str) -> ProcessPoolExecutor:
+    """ Pool of processes converting the partitions, spawned as QGIS is not safe to fork. """
+    context = multiprocessing.get_context('spawn')
+    if executable != sys.executable:
+        # The interpreter of all the processes spawned by multiprocessing
+        context.set_executable(executable)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+class PartitionResponse(QgsServerResponse):
+    """ Response of the WFS service writing the GML of a partition in a file, each time it is flushed. """
+
+    def __init__(self, stream: BinaryIO):
+        super().__init__()
+        self.stream = stream
+        self.error = ''
+        self._headers = {}
+        self._headers_sent = False
+        self._status_code = 200
+        self._finished = False
+        self._buffer = QBuffer()
+        self._buffer.open(QIODevice.ReadWrite)
+
+    def setHeader(self, key: str, value: str) -> None:
+        if not self._headers_sent:
+            self._headers[key] = value
+
+    def removeHeader(self, key: str) -> None:
+        if not self._headers_sent:
+            self._headers.pop(key, None)
+
+    def header(self, key: str) -> str:
+        return self._headers.get(key, '')
+
+    def headers(self) -> Dict[str, str]:
+        return dict(self._headers)
+
+    def headersSent(self) -> bool:
+        return self._headers_sent
+
+    def setStatusCode(self, code: int) -> None:
+        if not self._headers_sent:
+            self._status_code = code
+
+    def statusCode(self) -> int:
+        return self._status_code
+
+    def sendError(self, code: int, message: str) -> None:
+        self.clear()
+        self._status_code = code
+        self.error = message
+        self._finished = True
+
+    def io(self) -> QIODevice:
+        return self._buffer
+
+    def data(self) -> QByteArray:
+        # The buffer is reused from its start after each flush
+        return self._buffer.data().left(self._buffer.pos())
+
+    def clear(self) -> None:
+        self._headers = {}
+        self._status_code = 200
+        self.truncate()
+
+    def truncate(self) -> None:
+        self._buffer.seek(0)
+
+    def flush(self) -> None:
+        self._headers_sent = True
+        # noinspection PyTypeChecker
+        data = bytes(self.data())
+        if b'xsi:schemaLocation' in data:
+            # to avoid that OGR loads schemas when reading GML
+            data = re.sub(rb'xsi:schemaLocation=\".*\"', b'xsi:schemaLocation=""', data)
+        self.stream.write(data)
+        self._buffer.seek(0)
+
+    def finish(self) -> None:
+        if not self._finished:
+            self.flush()
+            self._finished = True
+
+
+class PartitionedRequest(NamedTuple):
+    """ A GetFeature request exported by partitions, with the features counted by QGIS Server. """
+    params: Dict[str, str]
+    headers: Dict[str, str]
+    type_name: str
+    feature_count: int
+    temp_dir: Path
+    request_id: str = ""
+    deadline: Optional[Deadline] = None
+    memory: Optional[MemoryProbe] = None
+
+
+# Parameters of the request of a partition, with the grid and the tile owning its features
+Partition = Tuple[Dict[str, str], Optional[TileGrid], Optional[int]]
+
+
+class PartitionedExport:
+    """ Export of the features fetched by partitions of the extent of the layer.
+
+    QGIS Server writes the GML of the partitions one by one, with the access control of the request,
+    while a pool of processes converts the previous ones. The partial outputs are then merged. The
+    pool is created by the first partitioned export and kept until the server process exits.
+    """
+
+    def __init__(
+            self,
+            server_iface: QgsServerInterface,
+            transforms: TransformCache,
+            workers: int,
+            features: int,
+            formats: Sequence[str],
+            executable: str = '',
+    ):
+        """
+        :param executable: Python interpreter of the pool, the one of the process by default
+        """
+        self.server_iface = server_iface
+        self.transforms = transforms
+        self.workers = workers
+        self.features = max(1, features)
+        self.formats = [name for name in formats if name in PARTITION_FORMATS]
+        self.executable = executable or default_executable()
+        self.logger = Logger()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+        if self.workers > 0 and not self.executable:
+            self.logger.warning(
+                "Python is embedded in the server, set WFSOUTPUTEXTENSION_PARTITION_PYTHON to export by "
+                "partitions")
+            self.workers = 0
+        if self.workers > 0 and not getattr(sys, 'argv', None):
+            # Sent to the spawned processes by multiprocessing
+            self.logger.warning("No sys.argv in the server, the exports by partitions are disabled")
+            self.workers = 0
+        atexit.register(self.shutdown)
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def pool(self) -> ProcessPoolExecutor:
+        """ The pool of the server process, created by the first partitioned export. """
+        with self._lock:
+            if self._pool is None:
+                self._pool = process_pool(self.workers, self.executable)
+            return self._pool
+
+    def discard(self, pool: ProcessPoolExecutor) -> None:
+        """ Replace a broken pool by a new one at the next export. """
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        """ Stop the processes of the pool. """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def accepts(self, params: Dict[str, str], format_definition: Format) -> bool:
+        """ If the request can be exported by partitions in this format. """
+        return (
+            self.enabled
+            and format_definition.filename_ext in self.formats
+            and partitionable(params)
+        )
+
+    def write(
+            self,
+            request: PartitionedRequest,
+            output_file: Path,
+            format_definition: Format,
+            layer_options: Sequence[str],
+            open_options: Tuple[str, ...] = (),
+    ) -> bool:
+        """ Fetch the features by partitions, converted in parallel by the pool, then merged.
+
+        :param open_options: Options of the GML driver reading the partitions
+        :return: False if the partitions have not been merged
+        :raise PartitionError when a partition can not be fetched or the pool has failed
+        """
+        partitions = self.partitions(request)
+        paths, counts = self.convert(request, partitions, open_options)
+        written = sum(count for count in counts if count > 0)
+        if written != request.feature_count and len(partitions) > 1:
+            # A feature missing or duplicated, like a geometry outside the extent of the layer
+            self.logger.warning(
+                f"REQ_ID:{request.request_id or '-'}\t {written} features in the partitions, "
+                f"{request.feature_count} counted, fetched in a single partition")
+            for path in paths:
+                path.unlink(missing_ok=True)
+            partitions = [(partition_parameters(request.params), None, None)]
+            paths, counts = self.convert(request, partitions, open_options)
+
+        # Without features, the first partition gives the fields of the output
+        sources = [path for path, count in zip(paths, counts) if count > 0] or [
+            path for path, count in zip(paths, counts) if count == 0][:1]
+        if not sources:
+            raise PartitionError(f"No layer in the partitions of {request.type_name}")
+
+        with stage(request.memory, 'write'), gdal_config_options(format_definition.ogr_config_options):
+            merged = merge_partitions(
+                sources,
+                output_file,
+                format_definition.ogr_provider,
+                request.type_name,
+                format_definition.ogr_datasource_options,
+                layer_options,
+                request.deadline.is_canceled if request.deadline else None,
+            )
+        if request.deadline:
+            request.deadline.check('write')
+        return merged
+
+    def partitions(self, request: PartitionedRequest) -> List[Partition]:
+        """ The partitions of the request, about the maximum number of features in each tile.
+
+        :raise PartitionError when the layer is not found
+        """
+        count = math.ceil(request.feature_count / self.features)
+        if count <= 1:
+            return [(partition_parameters(request.params), None, None)]
+
+        # noinspection PyArgumentList
+        project = QgsProject.instance()
+        layer = find_layer(project, request.type_name)
+        if not layer:
+            raise PartitionError(f"Layer {request.type_name} not found")
+
+        # The tiles are in the CRS of the output, like the geometries of the GML
+        extent = layer.extent()
+        if request.params.get('SRSNAME'):
+            extent = self.transforms.get(
+                layer.crs(),
+                QgsCoordinateReferenceSystem(request.params['SRSNAME']),
+                project.transformContext(),
+            ).transformBoundingBox(extent)
+
+        grid = TileGrid.create(
+            (extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum()), count)
+        # The features owned by a tile are requested even if their coordinates are rounded in the GML
+        margin = 10 ** -QgsServerProjectUtils.wfsLayerPrecision(project, layer.id())
+        partitions = [
+            (partition_parameters(request.params, bbox=grid.tile(index, margin)), grid, index)
+            for index in range(grid.count)
+        ]
+        # Not in any tile
+        partitions.append((partition_parameters(request.params, null_geometry=True), None, None))
+        return partitions
+
+    def fetch(self, request: PartitionedRequest, parameters: Dict[str, str], file_path: Path) -> None:
+        """ Write the GML of the partition, from the WFS service with the access control of the request.
+
+        :raise PartitionError when the request has failed
+        """
+        # noinspection PyUnresolvedReferences
+        server_request = QgsBufferServerRequest(
+            f"?{urlencode(parameters)}",
+            QgsServerRequest.GetMethod,
+            request.headers,
+            None,
+        )
+        service = self.server_iface.serviceRegistry().getService('WFS', parameters['VERSION'])
+        with file_path.open('wb') as stream:
+            response = PartitionResponse(stream)
+            # noinspection PyArgumentList
+            service.executeRequest(server_request, response, QgsProject.instance())
+            response.finish()
+        if response.statusCode() != 200:
+            raise PartitionError(
+                f"HTTP error {response.statusCode()} for the partition {file_path.stem} {response.error}")
+
+    def convert(
+            self, request: PartitionedRequest, partitions: List[Partition], open_options: Tuple[str, ...],
+    ) -> Tuple[List[Path], List[int]]:
+        """ Fetch the partitions one by one, converted by the pool of processes.
+
+        :return: The converted files and their number of features, -1 if not converted
+        :raise PartitionError when a partition can not be fetched or the pool has failed
+        """
+        self.logger.info(
+            f"REQ_ID:{request.request_id or '-'}\t {request.feature_count} features in "
+            f"{len(partitions)} partitions, {min(self.workers, len(partitions))} processes")
+
+        paths = []
+        futures = []
+        pool = self.pool()
+        try:
+            with stage(request.memory, 'read'):
+                for index, (parameters, grid, tile) in enumerate(partitions):
+                    if request.deadline:
+                        request.deadline.check('read')
+                    source = request.temp_dir.joinpath(f'partition-{index}.gml')
+                    self.fetch(request, parameters, source)
+                    paths.append(request.temp_dir.joinpath(f'partition-{index}.{PARTIAL_EXTENSION}'))
+                    futures.append(pool.submit(convert_partition, PartitionTask(
+                        str(source), open_options, str(paths[-1]), grid, tile)))
+                counts = [future.result() for future in futures]
+        except BrokenProcessPool as e:
+            # A process of the pool has died, like killed when out of memory
+            self.discard(pool)
+            raise PartitionError(f"The pool converting the partitions has failed : {e}") from e
+        except BaseException:
+            # The files of the request are removed after the conversions already running
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            raise
+        return paths, counts
@@ -0,0 +1,154 @@
+""" Generate the snapshots of layers exported in some formats.
+
+The snapshots are served by the plugin instead of running the export, while the project and
+the files of the layers are not modified. They are exported without the headers identifying a
+user, and only served to the requests without these headers. The access control plugins found in
+QGIS_PLUGINPATH are loaded by QGIS Server and applied to the export, like for an anonymous user.
+
+From the QGIS Server plugin directory :
+
+    python3 -m wfsOutputExtension.pregenerate /path/to/project.qgs --formats shp,gpkg --layers lines
+"""
+
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+from typing import List, Optional
+
+from qgis.core import QgsApplication, QgsProject, QgsVectorLayer
+from qgis.server import (
+    QgsBufferServerRequest,
+    QgsBufferServerResponse,
+    QgsServer,
+    QgsServerRequest,
+)
+
+from wfsOutputExtension.definitions import OutputFormats
+from wfsOutputExtension.retention import request_key
+from wfsOutputExtension.snapshots import Snapshots, source_stamps
+from wfsOutputExtension.tools import layer_files, layer_type_name
+from wfsOutputExtension.wfs_filter import WFSFilter
+
+
+def wfs_layers(project: QgsProject) -> List[QgsVectorLayer]:
+    """ Vector layers published in the WFS of the project. """
+    layer_ids, _ = project.readListEntry('WFSLayers', '/')
+    layers = [project.mapLayer(layer_id) for layer_id in layer_ids]
+    return [layer for layer in layers if isinstance(layer, QgsVectorLayer)]
+
+
+def export(
+        server: QgsServer, project: QgsProject, type_name: str, output_format: str, output_file: Path,
+) -> Optional[str]:
+    """ Run the GetFeature request of the layer with the plugin.
+
+    :return: The error, None if the file is written
+    """
+    query_string = (
+        "?SERVICE=WFS&VERSION=1.0.0&REQUEST=GetFeature"
+        f"&TYPENAME={type_name}&OUTPUTFORMAT={output_format}&MAP={project.fileName()}"
+    )
+    request = QgsBufferServerRequest(query_string, QgsServerRequest.GetMethod, {}, None)
+    response = QgsBufferServerResponse()
+    server.handleRequest(request, response, project)
+    if response.statusCode() != 200:
+        return f"HTTP {response.statusCode()} {bytes(response.body()).decode('utf8', 'replace')}"
+
+    with output_file.open('wb') as f:
+        # noinspection PyTypeChecker
+        f.write(response.body())
+    return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate the snapshots of the WFS exports of a project.")
+    parser.add_argument('project', help="The QGIS project")
+    parser.add_argument(
+        '--formats', required=True, help="Comma separated list of output formats, like shp,gpkg")
+    parser.add_argument(
+        '--layers', default='', help="Comma separated list of type names, all the WFS layers by default")
+    parser.add_argument(
+        '--snapshot-dir',
+        default=os.getenv('WFSOUTPUTEXTENSION_SNAPSHOT_DIR', ''),
+        help="Directory of the snapshots, WFSOUTPUTEXTENSION_SNAPSHOT_DIR by default")
+    args = parser.parse_args(argv)
+
+    if not args.snapshot_dir:
+        parser.error("The snapshot directory is not set")
+
+    formats = []
+    for name in args.formats.split(','):
+        format_definition = OutputFormats.find(name.strip().lower())
+        if not format_definition:
+            parser.error(f"Unknown output format {name}")
+        formats.append((name.strip().lower(), format_definition))
+
+    os.environ['QT_QPA_PLATFORM'] = 'offscreen'
+    application = QgsApplication([], False)
+    application.initQgis()
+
+    try:
+        project = QgsProject()
+        if not project.read(args.project):
+            print(f"Error reading the project {args.project}", file=sys.stderr)
+            return 1
+
+        layers = {layer_type_name(layer): layer for layer in wfs_layers(project)}
+        type_names = [name.strip() for name in args.layers.split(',') if name.strip()] or list(layers)
+
+        server = QgsServer()
+        server_iface = server.serverInterface()
+        wfs_filter = WFSFilter(server_iface)
+        # Always run the export
+        wfs_filter.snapshots = Snapshots(None, 0)
+        server_iface.registerFilter(wfs_filter, 50)
+
+        # The key of a request without the headers identifying a user
+        variant = request_key({}, "", {name: "" for name in wfs_filter.key_headers})
+        snapshots = Snapshots(Path(args.snapshot_dir), 0)
+        snapshots.root.mkdir(parents=True, exist_ok=True)
+        errors = 0
+        for type_name in type_names:
+            layer = layers.get(type_name)
+            if not layer:
+                print(f"{type_name} is not a WFS layer of the project", file=sys.stderr)
+                errors += 1
+                continue
+
+            for output_format, format_definition in formats:
+                # Taken before the export, a modification during the export makes the snapshot stale
+                created = time.time()
+                stamps = source_stamps([os.path.abspath(project.fileName()), *layer_files(layer)])
+
+                # In the snapshot directory, to move it atomically
+                fd, temp_file = tempfile.mkstemp(dir=snapshots.root, prefix='.pregenerate-')
+                os.close(fd)
+                temp_file = Path(temp_file)
+                try:
+                    error = export(server, project, type_name, output_format, temp_file)
+                    if error:
+                        print(f"{type_name} {output_format} : {error}", file=sys.stderr)
+                        errors += 1
+                        continue
+
+                    target = snapshots.record(
+                        project.fileName(), type_name, format_definition, temp_file, stamps, created, variant)
+                    print(f"{type_name} {output_format} : {target}")
+                finally:
+                    temp_file.unlink(missing_ok=True)
+
+        return 1 if errors else 0
+    finally:
+        application.exitQgis()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
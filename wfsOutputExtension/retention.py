@@ -0,0 +1,97 @@
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import hashlib
+import os
+import time
+
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+
+def request_key(
+        params: Dict[str, str],
+        project_path: str,
+        headers: Dict[str, str],
+        ignore: Iterable[str] = (),
+) -> str:
+    """ Deterministic key of a request.
+
+    The key depends on the parameters, on the project file and its modification time and on the
+    headers identifying the user, so a user never gets the output of another one.
+    """
+    ignored = {name.upper() for name in ignore}
+    digest = hashlib.sha256()
+    for name, value in sorted((k.upper(), v) for k, v in params.items()):
+        if name in ignored:
+            continue
+        digest.update(f"{name}={value}\n".encode('utf8'))
+
+    digest.update(f"project={project_path}\n".encode('utf8'))
+    try:
+        digest.update(f"mtime={os.stat(project_path).st_mtime_ns}\n".encode('utf8'))
+    except OSError:
+        # Not stored in a file
+        pass
+
+    for name, value in sorted(headers.items()):
+        digest.update(f"header:{name.lower()}={value}\n".encode('utf8'))
+
+    return digest.hexdigest()[:32]
+
+
+class RetainedOutputs:
+    """ Output files kept for a short time after the request, under the key of the request. """
+
+    def __init__(self, root: Path, ttl: int):
+        self.root = root
+        # Retention in seconds, 0 to disable
+        self.ttl = ttl
+        if self.enabled:
+            self.root.mkdir(exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def path(self, key: str, extension: str) -> Path:
+        return self.root.joinpath(f"{key}.{extension}")
+
+    def lookup(self, key: str, extension: str) -> Optional[Path]:
+        """ Return the retained file if it is still in the retention window. """
+        if not self.enabled:
+            return None
+
+        file_path = self.path(key, extension)
+        try:
+            if time.time() - file_path.stat().st_mtime < self.ttl:
+                return file_path
+        except OSError:
+            pass
+        return None
+
+    def store(self, key: str, extension: str, file_path: Path) -> Path:
+        """ Move the output file in the retention directory and remove expired files. """
+        self.purge()
+        target = self.path(key, extension)
+        # Atomic, a concurrent request reads the previous file or this one
+        os.replace(file_path, target)
+        return target
+
+    def purge(self) -> None:
+        """ Remove the files out of the retention window. """
+        now = time.time()
+        for file_path in self.root.iterdir():
+            try:
+                if now - file_path.stat().st_mtime >= self.ttl:
+                    file_path.unlink()
+            except OSError:
+                # Removed by another process
+                continue
+
+    @staticmethod
+    def etag(file_path: Path) -> str:
+        """ Validator of the retained file, for the If-Range header. """
+        stat = file_path.stat()
+        return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
@@ -0,0 +1,147 @@
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import os
+import shutil
+import time
+
+from pathlib import Path
+from typing import Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, identical exports are not coalesced
+    fcntl = None
+
+from wfsOutputExtension.logging import Logger
+
+# Delay in seconds between two attempts to take the lock of a request
+POLL_INTERVAL = 0.2
+# Delay in seconds after the maximum wait time, before removing an output shared with waiting requests
+SPOOL_MARGIN = 60
+
+
+class SingleFlight:
+    """ Run only once the identical exports running at the same time in all server processes.
+
+    The first request takes an exclusive lock on the file of its key and runs the export. The
+    identical requests wait for the lock, then send the output stored in the spool directory by
+    the first one. The lock is released by the system if the process dies.
+    """
+
+    def __init__(self, root: Path, max_wait: float):
+        self.root = root
+        # Maximum time in seconds waiting for the first request, 0 to disable
+        self.max_wait = max_wait
+        self.logger = Logger()
+        if self.enabled:
+            self.root.mkdir(exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return fcntl is not None and self.max_wait > 0
+
+    def lock_path(self, key: str) -> Path:
+        return self.root.joinpath(f"{key}.lock")
+
+    def spool_path(self, key: str, extension: str) -> Path:
+        return self.root.joinpath(f"{key}.{extension}")
+
+    @staticmethod
+    def _identity(file_path: Path) -> Optional[Tuple[int, int]]:
+        try:
+            stat = file_path.stat()
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def join(self, key: str, extension: str, request_id: str = "") -> Tuple[Optional[int], Optional[Path]]:
+        """ Lead the export of the request, or wait for the identical request running it.
+
+        :return: The lock to give to publish if the request runs the export, or the output of the
+        request which has run it. None and None if the wait has been too long.
+        """
+        spool = self.spool_path(key, extension)
+        # The output of a previous request is not sent, only the one published during the wait
+        previous = self._identity(spool)
+
+        lock_path = self.lock_path(key)
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+        start = time.monotonic()
+        waited = False
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                if time.monotonic() - start >= self.max_wait:
+                    os.close(fd)
+                    self.logger.warning(
+                        f"REQ_ID:{request_id or '-'}\t identical export still running after "
+                        f"{self.max_wait}s, running this one")
+                    return None, None
+                waited = True
+                time.sleep(POLL_INTERVAL)
+
+        # Not purged while used
+        os.utime(lock_path)
+        if not waited:
+            return fd, None
+
+        published = self._identity(spool)
+        if published is not None and published != previous:
+            self.release(fd)
+            self.logger.info(
+                f"REQ_ID:{request_id or '-'}\t output of the identical export received after "
+                f"{round(time.monotonic() - start, 2)}s")
+            return None, spool
+
+        # The identical export has failed, this request runs it
+        return fd, None
+
+    def publish(self, lock: int, key: str, extension: str, file_path: Path) -> Path:
+        """ Share the output file with the requests waiting for it, then release the lock. """
+        try:
+            self.purge()
+            target = self.spool_path(key, extension)
+            temp = target.with_name(f".{target.name}.{os.getpid()}")
+            try:
+                # The output file is moved or removed after the request, not the link
+                os.link(file_path, temp)
+            except OSError:
+                shutil.copyfile(file_path, temp)
+            # Atomic, a waiting request reads the previous file or this one
+            os.replace(temp, target)
+            return target
+        finally:
+            self.release(lock)
+
+    @staticmethod
+    def release(lock: int) -> None:
+        """ Release the lock of a request, the waiting requests run the export if nothing is published. """
+        fcntl.flock(lock, fcntl.LOCK_UN)
+        os.close(lock)
+
+    def purge(self) -> None:
+        """ Remove the outputs and the unused locks older than the maximum wait time. """
+        now = time.time()
+        for file_path in self.root.iterdir():
+            try:
+                if now - file_path.stat().st_mtime < self.max_wait + SPOOL_MARGIN:
+                    continue
+                if file_path.suffix != '.lock':
+                    file_path.unlink()
+                    continue
+
+                fd = os.open(file_path, os.O_RDWR)
+                try:
+                    # A request opening the file at the same time might run its export twice, not wrongly
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    file_path.unlink()
+                finally:
+                    os.close(fd)
+            except OSError:
+                # Removed or locked by another process
+                continue
@@ -0,0 +1,124 @@
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import hashlib
+import json
+import os
+import time
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from wfsOutputExtension.definitions import Format
+
+# A GetFeature request with other parameters is filtered, it is never served from a snapshot
+SNAPSHOT_PARAMETERS = {'SERVICE', 'VERSION', 'REQUEST', 'TYPENAME', 'TYPENAMES', 'OUTPUTFORMAT', 'MAP'}
+
+
+def file_stamp(path: str) -> Optional[List[int]]:
+    """ Modification time and size of the file, None if it does not exist. """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def source_stamps(paths: Iterable[str]) -> Dict[str, Optional[List[int]]]:
+    """ Stamps of the project and of the files of the layers. """
+    return {path: file_stamp(path) for path in sorted(set(paths))}
+
+
+def snapshot_type_name(params: Dict[str, str]) -> Optional[str]:
+    """ The type name of a request without filter, served from a snapshot, None if it is filtered. """
+    if any(name.upper() not in SNAPSHOT_PARAMETERS for name in params):
+        return None
+
+    type_name = params.get('TYPENAME') or params.get('TYPENAMES') or ''
+    # A single layer, and the name must not escape the directory
+    if not type_name or ',' in type_name or Path(type_name).name != type_name or type_name.startswith('.'):
+        return None
+    return type_name
+
+
+class Snapshots:
+    """ Exports generated in advance, served while the project and the data sources are not modified.
+
+    A snapshot is stored with a JSON file recording the stamps of its sources when it was generated.
+    """
+
+    def __init__(self, root: Optional[Path], max_age: int):
+        # None to disable
+        self.root = root
+        # Seconds, 0 to only check the sources
+        self.max_age = max_age
+
+    @property
+    def enabled(self) -> bool:
+        return self.root is not None
+
+    def path(self, project_path: str, type_name: str, format_definition: Format, variant: str = "") -> Path:
+        """ Path of the snapshot, the variant is a subdirectory of the project, like the key of a user. """
+        project_key = hashlib.sha256(os.path.abspath(project_path).encode('utf8')).hexdigest()[:16]
+        extension = 'zip' if format_definition.zip else format_definition.filename_ext
+        return self.root.joinpath(
+            project_key, variant, format_definition.filename_ext, f"{type_name}.{extension}")
+
+    @staticmethod
+    def metadata_path(file_path: Path) -> Path:
+        return file_path.with_name(f"{file_path.name}.json")
+
+    def lookup(
+            self, project_path: str, params: Dict[str, str], format_definition: Format, variant: str = "",
+    ) -> Optional[Path]:
+        """ Return the snapshot matching the request if it is still fresh. """
+        if not self.enabled or not project_path:
+            return None
+
+        type_name = snapshot_type_name(params)
+        if not type_name:
+            return None
+
+        file_path = self.path(project_path, type_name, format_definition, variant)
+        try:
+            with self.metadata_path(file_path).open(encoding='utf8') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if self.max_age and time.time() - metadata['created'] >= self.max_age:
+            return None
+
+        if source_stamps(metadata['stamps']) != metadata['stamps']:
+            return None
+
+        return file_path if file_path.exists() else None
+
+    def record(
+            self,
+            project_path: str,
+            type_name: str,
+            format_definition: Format,
+            file_path: Path,
+            stamps: Dict[str, Optional[List[int]]],
+            created: float,
+            variant: str = "",
+    ) -> Path:
+        """ Move the export in the snapshot directory, with the stamps of its sources.
+
+        The stamps and the creation time must be taken before the export, so a source modified
+        during the export makes the snapshot stale.
+        The file must be on the same file system than the snapshot directory.
+        """
+        target = self.path(project_path, type_name, format_definition, variant)
+        target.parent.mkdir(parents=True, exist_ok=True)
+
+        # Atomic, a concurrent request reads the previous snapshot or this one
+        os.replace(file_path, target)
+        metadata_file = self.metadata_path(target)
+        temp_file = metadata_file.with_name(f"{metadata_file.name}.tmp")
+        with temp_file.open('w', encoding='utf8') as f:
+            json.dump({'created': created, 'stamps': stamps}, f)
+        os.replace(temp_file, metadata_file)
+        return target
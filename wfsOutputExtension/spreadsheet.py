@@ -0,0 +1,380 @@
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import math
+import re
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import IO, Any, Iterable, List, Optional, Tuple, Union
+
+from qgis.core import QgsFeature, QgsFields
+from qgis.PyQt.QtCore import QDate, QDateTime, QTime, QVariant
+
+# Rows of a sheet in Excel and LibreOffice Calc, including the header
+SHEET_MAX_ROWS = 1048576
+
+# Size of the rows kept in memory before writing them in the zip
+BUFFER_SIZE = 256 * 1024
+
+# Types of the cells
+STRING = 'string'
+NUMBER = 'number'
+BOOLEAN = 'boolean'
+DATE = 'date'
+DATETIME = 'datetime'
+TIME = 'time'
+
+# Not allowed in XML 1.0
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+# Not allowed in the name of a sheet
+INVALID_SHEET_CHARS = re.compile(r'[\[\]:*?/\\]')
+
+Cell = Tuple[Optional[str], Any]
+
+# Origin of the serial dates of spreadsheets
+EPOCH = QDate(1899, 12, 30)
+MIDNIGHT = QTime(0, 0)
+MS_PER_DAY = 86400 * 1000
+
+# Indexes of the cell formats in the styles of a XLSX workbook
+XLSX_STYLES = {DATE: 1, DATETIME: 2, TIME: 3}
+
+
+def cell(value: object) -> Cell:
+    """ Type and value of the cell of an attribute, the type is None for an empty cell. """
+    if value is None or (isinstance(value, QVariant) and value.isNull()):
+        return None, None
+    if isinstance(value, bool):
+        return BOOLEAN, value
+    if isinstance(value, int):
+        return NUMBER, str(value)
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return None, None
+        return NUMBER, repr(value)
+    if isinstance(value, QDateTime):
+        return (DATETIME, value) if value.isValid() else (None, None)
+    if isinstance(value, QDate):
+        return (DATE, value) if value.isValid() else (None, None)
+    if isinstance(value, QTime):
+        return (TIME, value) if value.isValid() else (None, None)
+    return STRING, INVALID_XML_CHARS.sub('', str(value))
+
+
+def sheet_name(name: str, number: int) -> str:
+    """ Name of a sheet, with its number after the first one, like name_2. """
+    name = INVALID_SHEET_CHARS.sub('_', name) or 'features'
+    suffix = f'_{number}' if number > 1 else ''
+    # At most 31 characters
+    return name[:31 - len(suffix)] + suffix
+
+
+def column_name(index: int) -> str:
+    """ Letters of the column, A for the first one. """
+    name = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(ord('A') + remainder) + name
+    return name
+
+
+class SpreadsheetWriter(ABC):
+    """ Spreadsheet written row by row in the zipped XML parts, the rows are not kept in memory. """
+
+    def __init__(self, output_file: Path) -> None:
+        import zipfile
+
+        self.zip_file = zipfile.ZipFile(output_file, 'w', compression=zipfile.ZIP_DEFLATED)
+        self.stream: Optional[IO[bytes]] = None
+        self.buffer: List[str] = []
+        self.buffered = 0
+        self.sheets: List[str] = []
+        self.rows = 0
+
+    def write(self, text: str) -> None:
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        self.stream.write(''.join(self.buffer).encode('utf8'))
+        self.buffer = []
+        self.buffered = 0
+
+    def open_part(self, name: str) -> None:
+        """ Start a part of the zip written as a stream, it can be bigger than 4 GB. """
+        self.stream = self.zip_file.open(name, 'w', force_zip64=True)
+
+    def close_part(self) -> None:
+        self.flush()
+        self.stream.close()
+        self.stream = None
+
+    def start_sheet(self, name: str) -> None:
+        self.sheets.append(name)
+        self.rows = 0
+
+    @abstractmethod
+    def row(self, cells: Iterable[Cell]) -> None:
+        """ Write the next row of the sheet. """
+
+    @abstractmethod
+    def end_sheet(self) -> None:
+        """ Write the end of the sheet. """
+
+    def close(self) -> None:
+        self.zip_file.close()
+
+    def abort(self) -> None:
+        """ Close the file after an error, it is not readable. """
+        if self.stream:
+            self.stream.close()
+        self.zip_file.close()
+
+
+class XlsxWriter(SpreadsheetWriter):
+    """ Office Open XML workbook, with a part for each sheet and the strings inline. """
+
+    def start_sheet(self, name: str) -> None:
+        super().start_sheet(name)
+        self.open_part(f'xl/worksheets/sheet{len(self.sheets)}.xml')
+        self.write(
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+
+    def row(self, cells: Iterable[Cell]) -> None:
+        from xml.sax.saxutils import escape
+
+        self.rows += 1
+        values = []
+        for index, (cell_type, value) in enumerate(cells):
+            if cell_type is None:
+                continue
+            reference = f'{column_name(index)}{self.rows}'
+            if cell_type == STRING:
+                values.append(
+                    f'<c r="{reference}" t="inlineStr">'
+                    f'<is><t xml:space="preserve">{escape(value)}</t></is></c>')
+            elif cell_type == NUMBER:
+                values.append(f'<c r="{reference}"><v>{value}</v></c>')
+            elif cell_type == BOOLEAN:
+                values.append(f'<c r="{reference}" t="b"><v>{int(value)}</v></c>')
+            else:
+                values.append(
+                    f'<c r="{reference}" s="{XLSX_STYLES[cell_type]}"><v>{self.serial(value)}</v></c>')
+        self.write(f'<row r="{self.rows}">{"".join(values)}</row>')
+
+    @staticmethod
+    def serial(value: Union[QDate, QDateTime, QTime]) -> str:
+        """ Number of days since the origin of the spreadsheet dates. """
+        if isinstance(value, QDateTime):
+            return repr(EPOCH.daysTo(value.date()) + MIDNIGHT.msecsTo(value.time()) / MS_PER_DAY)
+        if isinstance(value, QDate):
+            return str(EPOCH.daysTo(value))
+        return repr(MIDNIGHT.msecsTo(value) / MS_PER_DAY)
+
+    def end_sheet(self) -> None:
+        self.write('</sheetData></worksheet>')
+        self.close_part()
+
+    def close(self) -> None:
+        from xml.sax.saxutils import quoteattr
+
+        count = len(self.sheets)
+        self.zip_file.writestr('[Content_Types].xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" '
+            'ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            + ''.join(
+                f'<Override PartName="/xl/worksheets/sheet{number}.xml" '
+                'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                for number in range(1, count + 1))
+            + '</Types>'
+        ))
+        self.zip_file.writestr('_rels/.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="xl/workbook.xml"/>'
+            '</Relationships>'
+        ))
+        self.zip_file.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+            + ''.join(
+                f'<sheet name={quoteattr(name)} sheetId="{number}" r:id="rId{number}"/>'
+                for number, name in enumerate(self.sheets, start=1))
+            + '</sheets></workbook>'
+        ))
+        self.zip_file.writestr('xl/_rels/workbook.xml.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + ''.join(
+                f'<Relationship Id="rId{number}" '
+                'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                f'Target="worksheets/sheet{number}.xml"/>'
+                for number in range(1, count + 1))
+            + f'<Relationship Id="rId{count + 1}" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+            'Target="styles.xml"/>'
+            '</Relationships>'
+        ))
+        # Same number formats as the XLSX driver of GDAL, to read the dates with it
+        self.zip_file.writestr('xl/styles.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            '<numFmts count="3">'
+            '<numFmt numFmtId="164" formatCode="DD/MM/YYYY"/>'
+            '<numFmt numFmtId="165" formatCode="DD/MM/YYYY\\ HH:MM:SS"/>'
+            '<numFmt numFmtId="166" formatCode="HH:MM:SS"/>'
+            '</numFmts>'
+            '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+            '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+            '<fill><patternFill patternType="gray125"/></fill></fills>'
+            '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+            '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+            '<cellXfs count="4">'
+            '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+            '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+            '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+            '<xf numFmtId="166" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+            '</cellXfs>'
+            '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+            '</styleSheet>'
+        ))
+        super().close()
+
+
+class OdsWriter(SpreadsheetWriter):
+    """ OpenDocument spreadsheet, with all the sheets in the content. """
+
+    def __init__(self, output_file: Path) -> None:
+        import zipfile
+
+        super().__init__(output_file)
+        # First and not compressed, to detect the format
+        self.zip_file.writestr(
+            'mimetype', 'application/vnd.oasis.opendocument.spreadsheet', compress_type=zipfile.ZIP_STORED)
+        self.zip_file.writestr('META-INF/manifest.xml', (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0" '
+            'manifest:version="1.2">'
+            '<manifest:file-entry manifest:full-path="/" manifest:version="1.2" '
+            'manifest:media-type="application/vnd.oasis.opendocument.spreadsheet"/>'
+            '<manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/>'
+            '</manifest:manifest>'
+        ))
+        self.open_part('content.xml')
+        self.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<office:document-content xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" '
+            'xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0" '
+            'xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0" office:version="1.2">'
+            '<office:body><office:spreadsheet>')
+
+    def start_sheet(self, name: str) -> None:
+        from xml.sax.saxutils import quoteattr
+
+        super().start_sheet(name)
+        self.write(f'<table:table table:name={quoteattr(name)}>')
+
+    def row(self, cells: Iterable[Cell]) -> None:
+        from xml.sax.saxutils import escape
+
+        self.rows += 1
+        values = []
+        for cell_type, value in cells:
+            if cell_type is None:
+                values.append('<table:table-cell/>')
+            elif cell_type == STRING:
+                values.append(
+                    f'<table:table-cell office:value-type="string"><text:p>{escape(value)}</text:p>'
+                    '</table:table-cell>')
+            elif cell_type == NUMBER:
+                values.append(f'<table:table-cell office:value-type="float" office:value="{value}"/>')
+            elif cell_type == BOOLEAN:
+                values.append(
+                    '<table:table-cell office:value-type="boolean" '
+                    f'office:boolean-value="{"true" if value else "false"}"/>')
+            elif cell_type == TIME:
+                values.append(
+                    '<table:table-cell office:value-type="time" '
+                    f'office:time-value="PT{value.hour():02d}H{value.minute():02d}M{value.second():02d}S"/>')
+            else:
+                values.append(
+                    f'<table:table-cell office:value-type="date" office:date-value="{self.iso(value)}"/>')
+        self.write(f'<table:table-row>{"".join(values)}</table:table-row>')
+
+    @staticmethod
+    def iso(value: Union[QDate, QDateTime]) -> str:
+        if isinstance(value, QDateTime):
+            return value.toString("yyyy-MM-dd'T'HH:mm:ss")
+        return value.toString('yyyy-MM-dd')
+
+    def end_sheet(self) -> None:
+        self.write('</table:table>')
+
+    def close(self) -> None:
+        self.write('</office:spreadsheet></office:body></office:document-content>')
+        self.close_part()
+        super().close()
+
+
+WRITERS = {
+    'xlsx': XlsxWriter,
+    'ods': OdsWriter,
+}
+
+
+def write_spreadsheet(
+        features: Iterable[QgsFeature],
+        output_file: Path,
+        fields: QgsFields,
+        extension: str,
+        name: str,
+        attributes: Optional[List[int]] = None,
+        max_rows: int = SHEET_MAX_ROWS,
+) -> int:
+    """ Write the attributes of the features in a spreadsheet, without keeping them in memory.
+
+    The first row of each sheet is the names of the fields, a new sheet is started when a sheet has
+    max_rows rows.
+
+    :param extension: xlsx or ods
+    :param name: Name of the first sheet, the next ones are numbered
+    :param attributes: Indexes of the fields to write, all the fields if None
+    :return: The number of sheets
+    """
+    indexes = list(range(fields.count())) if attributes is None else attributes
+    header = [(STRING, fields.at(index).name()) for index in indexes]
+
+    writer = WRITERS[extension](output_file)
+    try:
+        writer.start_sheet(sheet_name(name, 1))
+        writer.row(header)
+        for feature in features:
+            if writer.rows >= max_rows:
+                writer.end_sheet()
+                writer.start_sheet(sheet_name(name, len(writer.sheets) + 1))
+                writer.row(header)
+            values = feature.attributes()
+            writer.row([cell(values[index]) for index in indexes])
+        writer.end_sheet()
+    except Exception:
+        writer.abort()
+        raise
+
+    writer.close()
+    return len(writer.sheets)
@@ -0,0 +1,117 @@
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import shutil
+import tempfile
+import time
+
+from pathlib import Path
+from typing import Optional, Tuple
+
+from wfsOutputExtension.logging import Logger
+
+
+class TempQuotaExceeded(Exception):
+    """ When a request uses more temporary disk than allowed. """
+
+    def __init__(self, usage: int, quota: int):
+        super().__init__(f"The export uses {usage} bytes on the temporary disk, more than {quota} bytes")
+        self.usage = usage
+        self.quota = quota
+
+
+class TempStorage:
+    """ Temporary directories of the requests.
+
+    Directories are created in the root with the given prefix. The disk used by a request can be
+    limited with a quota. Stale directories, left by crashed processes or by the debug mode, are
+    removed when they are older than the maximum age.
+    """
+
+    def __init__(self, root: Path, prefix: str, quota: int, max_age: int, sweep_interval: int):
+        self.root = root
+        self.prefix = prefix
+        # Quota in bytes, 0 for no limit
+        self.quota = quota
+        # Maximum age in seconds, 0 to never remove stale directories
+        self.max_age = max_age
+        self.sweep_interval = sweep_interval
+        # Monotonic time of the last sweep, None before the first one
+        self.last_sweep: Optional[float] = None
+        self.logger = Logger()
+
+    def create(self, keep: bool) -> Tuple[Optional[tempfile.TemporaryDirectory], Path]:
+        """ Create a temporary directory for a request.
+
+        :param keep: If the directory must not be removed at the end of the request.
+        :return: The object removing the directory when deleted, None if kept, and the directory path.
+        """
+        if keep:
+            return None, Path(tempfile.mkdtemp(prefix=self.prefix, dir=self.root))
+
+        # Removed when deleted
+        lock_dir = tempfile.TemporaryDirectory(prefix=self.prefix, dir=self.root)
+        return lock_dir, Path(lock_dir.name)
+
+    @staticmethod
+    def usage(path: Path) -> int:
+        """ Bytes used by the files in the directory. """
+        total = 0
+        for file_path in path.rglob('*'):
+            try:
+                if file_path.is_file():
+                    total += file_path.stat().st_size
+            except OSError:
+                # Removed in the meantime
+                continue
+        return total
+
+    def check_quota(self, path: Path) -> int:
+        """ Return the bytes used by the request directory.
+
+        :raise TempQuotaExceeded when the quota is exceeded
+        """
+        usage = self.usage(path)
+        if self.quota and usage > self.quota:
+            raise TempQuotaExceeded(usage, self.quota)
+        return usage
+
+    def sweep_if_due(self) -> None:
+        """ Remove stale directories if the last sweep is older than the interval, or not done yet. """
+        if self.last_sweep is None or time.monotonic() - self.last_sweep >= self.sweep_interval:
+            self.sweep()
+
+    def sweep(self) -> None:
+        """ Remove stale directories and log the temporary disk used by the plugin. """
+        self.last_sweep = time.monotonic()
+        if not self.max_age:
+            return
+
+        now = time.time()
+        removed = 0
+        removed_bytes = 0
+        remaining = 0
+        remaining_bytes = 0
+        for path in self.root.glob(f'{self.prefix}*'):
+            try:
+                if not path.is_dir():
+                    continue
+                age = now - path.stat().st_mtime
+            except OSError:
+                # Removed by another process
+                continue
+
+            usage = self.usage(path)
+            if age < self.max_age:
+                remaining += 1
+                remaining_bytes += usage
+                continue
+
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+            removed_bytes += usage
+
+        if removed:
+            self.logger.info(f"Removed {removed} stale temporary directories, {removed_bytes} bytes")
+        self.logger.info(f"Temporary disk used by {remaining} directories : {remaining_bytes} bytes")
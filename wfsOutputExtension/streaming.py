@@ -0,0 +1,139 @@
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import time
+
+from dataclasses import dataclass
+from io import BufferedReader
+from pathlib import Path
+from typing import Optional, Tuple
+
+from qgis.server import QgsRequestHandler
+
+from wfsOutputExtension.deadline import Deadline, ExportCancelled
+
+# Chunk size in bytes set to 1Mo
+CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class FlushPolicy:
+    """ When the body appended to the response is sent to the client. """
+    # Bytes appended since the last flush
+    max_bytes: int
+    # Seconds since the last flush
+    max_delay: float
+
+
+class RangeNotSatisfiable(Exception):
+    """ When the range requested is outside the file. """
+    pass
+
+
+def parse_range(value: str, size: int) -> Optional[Tuple[int, int]]:
+    """ Parse the Range header for a file of the given size.
+
+    Only a single range of bytes is supported, other ranges are ignored and the whole file is sent.
+
+    :return: The first and the last byte positions, inclusive, or None to send the whole file
+    :raise RangeNotSatisfiable when the range does not overlap the file
+    """
+    unit, _, ranges = value.strip().partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in ranges:
+        return None
+
+    first, _, last = ranges.strip().partition('-')
+    try:
+        if not first:
+            # Suffix range, the last bytes of the file
+            length = int(last)
+            if length <= 0 or size == 0:
+                raise RangeNotSatisfiable(value)
+            return max(0, size - length), size - 1
+
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+
+    if end < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(value)
+    return start, min(end, size - 1)
+
+
+def stream_bytes(
+        handler: QgsRequestHandler,
+        stream: BufferedReader,
+        policy: FlushPolicy,
+        length: Optional[int] = None,
+        deadline: Optional[Deadline] = None,
+) -> int:
+    """ Append the content of the stream to the response body.
+
+    :param length: Maximum number of bytes to send, until the end of the stream if None
+    :param deadline: Checked before sending each part of the body. When the headers are already
+        sent, the streaming stops without error and the client gets a truncated body.
+    :return: The number of bytes sent
+    :raise ExportCancelled when the deadline has passed before the headers are sent
+    """
+    # Pre-allocate input buffer and use readinto(...)
+    # The chunk is copied in bytes, the parameter of appendBody is a QByteArray
+    data = bytearray(CHUNK_SIZE)
+    view = memoryview(data)
+
+    def read() -> int:
+        if length is None:
+            return stream.readinto(data)
+        return stream.readinto(view[:min(CHUNK_SIZE, length - total)]) if length > total else 0
+
+    total = 0
+    pending = 0
+    last_flush = time.monotonic()
+    num_bytes = read()
+    while num_bytes:
+        handler.appendBody(bytes(view[:num_bytes]))
+        total += num_bytes
+        pending += num_bytes
+        now = time.monotonic()
+        if pending >= policy.max_bytes or now - last_flush >= policy.max_delay:
+            if deadline and deadline.is_canceled():
+                if not handler.headersSent():
+                    raise ExportCancelled('stream', deadline.elapsed)
+                # An exception would be appended to the body already sent
+                handler.clearBody()
+                return total - pending
+            handler.sendResponse()  # Call flush()
+            pending = 0
+            last_flush = now
+        num_bytes = read()
+
+    if pending:
+        handler.sendResponse()
+    return total
+
+
+def send_file(
+        handler: QgsRequestHandler,
+        file_path: Path,
+        policy: FlushPolicy,
+        byte_range: Optional[Tuple[int, int]] = None,
+        deadline: Optional[Deadline] = None,
+) -> int:
+    """ Stream the file as the response body, with its length if the headers are not sent yet.
+
+    :param byte_range: The first and the last byte positions to send, the whole file if None
+    :param deadline: Checked before sending each part of the file, like stream_bytes
+    :return: The number of bytes sent
+    :raise ExportCancelled when the deadline has passed before the headers are sent
+    """
+    start, end = byte_range if byte_range else (0, file_path.stat().st_size - 1)
+    length = end - start + 1
+    if not handler.headersSent():
+        handler.setResponseHeader('Content-Length', str(length))
+
+    with file_path.open('rb') as f:
+        f.seek(start)
+        return stream_bytes(handler, f, policy, length, deadline)
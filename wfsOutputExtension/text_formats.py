@@ -0,0 +1,389 @@
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import math
+import re
+
+from pathlib import Path
+from typing import IO, Iterable, List, Optional
+
+from qgis.core import (
+    QgsAbstractGeometry,
+    QgsFeature,
+    QgsField,
+    QgsFields,
+    QgsGeometryCollection,
+    QgsLineString,
+    QgsPoint,
+    QgsPolygon,
+    QgsWkbTypes,
+)
+from qgis.PyQt.QtCore import QDate, QDateTime, Qt, QTime, QVariant
+
+from wfsOutputExtension.definitions import PLUGIN
+
+# Size of the text kept in memory before writing it in the file
+BUFFER_SIZE = 256 * 1024
+
+# Strings looking like numbers are quoted by the OGR CSV driver, STRING_QUOTING=IF_AMBIGUOUS
+NUMBER_REGEX = re.compile(r'^\s*[+-]?(\d+\.?\d*|\.\d+)([eEdD][+-]?\d+)?\s*$')
+
+# Fields written in the elements of GPX by the OGR driver, in the order of the schema
+GPX_WAYPOINT_FIELDS = ('name', 'cmt', 'desc', 'src', 'sym', 'type')
+GPX_ROUTE_FIELDS = ('name', 'cmt', 'desc', 'src', 'number', 'type')
+# Other fields of the GPX schema, written by OGR only
+GPX_LINK_FIELDS = ('link1_href', 'link1_text', 'link1_type', 'link2_href', 'link2_text', 'link2_type')
+GPX_WAYPOINT_RESERVED_FIELDS = (
+    'ele', 'time', 'magvar', 'geoidheight', 'fix', 'sat', 'hdop', 'vdop', 'pdop', 'ageofdgpsdata', 'dgpsid',
+    *GPX_LINK_FIELDS,
+)
+GPX_NAMESPACE = 'ogr'
+GPX_NAMESPACE_URL = 'http://osgeo.org/gdal'
+
+
+class TextWriter:
+    """ Text file written by blocks. """
+
+    def __init__(self, stream: IO[str]) -> None:
+        self.stream = stream
+        self.buffer: List[str] = []
+        self.buffered = 0
+
+    def write(self, text: str) -> None:
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        self.stream.write(''.join(self.buffer))
+        self.buffer = []
+        self.buffered = 0
+
+
+def number(value: float) -> str:
+    """ Coordinate formatted like OGR, with 15 significant digits. """
+    return f'{value:.15g}'
+
+
+def ogr_string(value: object, field: QgsField) -> Optional[str]:
+    """ Value formatted like OGRFeature::GetFieldAsString, None if the value is null. """
+    if value is None or (isinstance(value, QVariant) and value.isNull()):
+        return None
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        if math.isnan(value):
+            return 'nan'
+        if math.isinf(value):
+            return 'inf' if value > 0 else '-inf'
+        if field.length() > 0:
+            return f'{value:.{max(field.precision(), 0)}f}'
+        return f'{value:.15g}'
+    if isinstance(value, QDateTime):
+        if not value.isValid():
+            return None
+        return f'{ogr_date(value.date())} {ogr_time(value.time())}{ogr_time_zone(value)}'
+    if isinstance(value, QDate):
+        return ogr_date(value) if value.isValid() else None
+    if isinstance(value, QTime):
+        return ogr_time(value) if value.isValid() else None
+    return str(value)
+
+
+def ogr_date(value: QDate) -> str:
+    return f'{value.year():04d}/{value.month():02d}/{value.day():02d}'
+
+
+def ogr_time(value: QTime) -> str:
+    if value.msec():
+        return f'{value.hour():02d}:{value.minute():02d}:{value.second() + value.msec() / 1000:06.3f}'
+    return f'{value.hour():02d}:{value.minute():02d}:{value.second():02d}'
+
+
+def ogr_time_zone(value: QDateTime) -> str:
+    """ Time zone like OGR, the date time written by QGIS has a time zone if it is not local. """
+    if value.timeSpec() == Qt.UTC:
+        return '+00'
+    if value.timeSpec() != Qt.OffsetFromUTC:
+        return ''
+    offset = value.offsetFromUtc() // 60
+    sign = '-' if offset < 0 else '+'
+    hours, minutes = divmod(abs(offset), 60)
+    return f'{sign}{hours:02d}' + (f':{minutes:02d}' if minutes else '')
+
+
+def csv_escape(text: str, quote_numbers: bool) -> str:
+    """ Quote the text like the OGR CSV driver. """
+    if '"' in text or ',' in text or '\n' in text or '\r' in text:
+        return '"' + text.replace('"', '""') + '"'
+    if quote_numbers and NUMBER_REGEX.match(text):
+        return f'"{text}"'
+    return text
+
+
+def _indexes(fields: QgsFields, attributes: Optional[List[int]]) -> List[int]:
+    return list(range(fields.count())) if attributes is None else attributes
+
+
+def write_csv(
+        features: Iterable[QgsFeature],
+        stream: IO[str],
+        fields: QgsFields,
+        attributes: Optional[List[int]],
+        geometry_type: 'QgsWkbTypes.Type',
+        name: str,
+) -> None:
+    """ CSV like the OGR driver with its default options, without geometry. """
+    indexes = _indexes(fields, attributes)
+    writer = TextWriter(stream)
+    writer.write(','.join(csv_escape(fields.at(index).name(), False) for index in indexes) + '\n')
+    strings = [fields.at(index).type() == QVariant.String for index in indexes]
+    for feature in features:
+        values = feature.attributes()
+        row = []
+        for index, string in zip(indexes, strings):
+            value = ogr_string(values[index], fields.at(index))
+            row.append('' if value is None else csv_escape(value, string))
+        writer.write(','.join(row) + '\n')
+    writer.flush()
+
+
+def kml_coordinates(points: Iterable[QgsPoint]) -> str:
+    return ' '.join(
+        f'{number(point.x())},{number(point.y())},{number(point.z())}' if point.is3D()
+        else f'{number(point.x())},{number(point.y())}'
+        for point in points
+    )
+
+
+def kml_geometry(geometry: QgsAbstractGeometry) -> str:
+    """ KML geometry like OGR_G_ExportToKML. """
+    if isinstance(geometry, QgsPoint):
+        return f'<Point><coordinates>{kml_coordinates([geometry])}</coordinates></Point>'
+    if isinstance(geometry, QgsLineString):
+        return f'<LineString><coordinates>{kml_coordinates(geometry.points())}</coordinates></LineString>'
+    if isinstance(geometry, QgsPolygon):
+        rings = [
+            '<outerBoundaryIs><LinearRing><coordinates>'
+            f'{kml_coordinates(geometry.exteriorRing().points())}'
+            '</coordinates></LinearRing></outerBoundaryIs>',
+        ]
+        for index in range(geometry.numInteriorRings()):
+            rings.append(
+                '<innerBoundaryIs><LinearRing><coordinates>'
+                f'{kml_coordinates(geometry.interiorRing(index).points())}'
+                '</coordinates></LinearRing></innerBoundaryIs>')
+        return f'<Polygon>{"".join(rings)}</Polygon>'
+    if isinstance(geometry, QgsGeometryCollection):
+        parts = ''.join(kml_geometry(geometry.geometryN(index)) for index in range(geometry.numGeometries()))
+        return f'<MultiGeometry>{parts}</MultiGeometry>'
+    raise ValueError(f'Geometry {geometry.wktTypeStr()} not supported in KML')
+
+
+def kml_type(field: QgsField) -> str:
+    """ Type of the field in the schema, like the OGR KML driver. """
+    if field.type() in (QVariant.Int, QVariant.Bool):
+        return 'int'
+    if field.type() == QVariant.Double:
+        return 'float'
+    return 'string'
+
+
+def write_kml(
+        features: Iterable[QgsFeature],
+        stream: IO[str],
+        fields: QgsFields,
+        attributes: Optional[List[int]],
+        geometry_type: 'QgsWkbTypes.Type',
+        name: str,
+) -> None:
+    """ KML like the OGR driver, the features must be in WGS 84. """
+    from xml.sax.saxutils import escape, quoteattr
+
+    indexes = _indexes(fields, attributes)
+    # Fields written in the name and description of the placemark, NameField and DescriptionField of OGR
+    name_index = next((index for index in indexes if fields.at(index).name().lower() == 'name'), None)
+    description_index = next(
+        (index for index in indexes if fields.at(index).name().lower() == 'description'), None)
+    data_indexes = [index for index in indexes if index not in (name_index, description_index)]
+
+    writer = TextWriter(stream)
+    writer.write(
+        '<?xml version="1.0" encoding="utf-8" ?>\n'
+        '<kml xmlns="http://www.opengis.net/kml/2.2">\n'
+        '<Document id="root_doc">\n')
+    if data_indexes:
+        writer.write(f'<Schema name={quoteattr(name)} id={quoteattr(name)}>\n')
+        for index in data_indexes:
+            field = fields.at(index)
+            writer.write(
+                f'\t<SimpleField name={quoteattr(field.name())} type="{kml_type(field)}"></SimpleField>\n')
+        writer.write('</Schema>\n')
+    writer.write(f'<Folder><name>{escape(name)}</name>\n')
+
+    schema_url = quoteattr(f'#{name}')
+    for feature in features:
+        values = feature.attributes()
+        writer.write('  <Placemark>\n')
+        for index, element in ((name_index, 'name'), (description_index, 'description')):
+            if index is None:
+                continue
+            value = ogr_string(values[index], fields.at(index))
+            if value is not None:
+                writer.write(f'\t<{element}>{escape(value)}</{element}>\n')
+
+        data = []
+        for index in data_indexes:
+            value = ogr_string(values[index], fields.at(index))
+            if value is not None:
+                data.append(
+                    f'\t\t<SimpleData name={quoteattr(fields.at(index).name())}>'
+                    f'{escape(value)}</SimpleData>\n')
+        if data:
+            writer.write(
+                f'\t<ExtendedData><SchemaData schemaUrl={schema_url}>\n{"".join(data)}'
+                '\t</SchemaData></ExtendedData>\n')
+
+        if feature.hasGeometry():
+            writer.write(f'      {kml_geometry(feature.geometry().constGet())}\n')
+        writer.write('  </Placemark>\n')
+
+    writer.write('</Folder>\n</Document></kml>\n')
+    writer.flush()
+
+
+def gpx_number(value: float) -> str:
+    """ Latitude, longitude or elevation like the OGR GPX driver. """
+    text = f'{value:.15f}'.rstrip('0')
+    return text + '0' if text.endswith('.') else text
+
+
+def gpx_extension_name(name: str) -> str:
+    """ Name of the element of the field in the extensions, the prefix of the namespace is removed. """
+    if name.startswith(f'{GPX_NAMESPACE}_'):
+        name = name[len(GPX_NAMESPACE) + 1:]
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+
+
+def gpx_point(element: str, point: QgsPoint, indent: str) -> str:
+    text = f'{indent}<{element} lat="{gpx_number(point.y())}" lon="{gpx_number(point.x())}">\n'
+    if point.is3D():
+        text += f'{indent}  <ele>{gpx_number(point.z())}</ele>\n'
+    return text
+
+
+def write_gpx(
+        features: Iterable[QgsFeature],
+        stream: IO[str],
+        fields: QgsFields,
+        attributes: Optional[List[int]],
+        geometry_type: 'QgsWkbTypes.Type',
+        name: str,
+) -> None:
+    """ GPX like the OGR driver with extensions, waypoints, routes or tracks from the geometry type. """
+    from xml.sax.saxutils import escape
+
+    flat_type = QgsWkbTypes.flatType(geometry_type)
+    indexes = _indexes(fields, attributes)
+    standard = GPX_WAYPOINT_FIELDS if flat_type == QgsWkbTypes.Point else GPX_ROUTE_FIELDS
+    field_names = [fields.at(index).name() for index in indexes]
+    element_indexes = [
+        (element, indexes[field_names.index(element)]) for element in standard if element in field_names]
+    extension_indexes = [
+        (gpx_extension_name(fields.at(index).name()), index) for index in indexes
+        if fields.at(index).name() not in standard]
+
+    writer = TextWriter(stream)
+    writer.write(
+        f'<?xml version="1.0"?>\n'
+        f'<gpx version="1.1" creator="{PLUGIN}" '
+        f'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        f'xmlns:{GPX_NAMESPACE}="{GPX_NAMESPACE_URL}" '
+        f'xmlns="http://www.topografix.com/GPX/1/1" '
+        f'xsi:schemaLocation="http://www.topografix.com/GPX/1/1 '
+        f'http://www.topografix.com/GPX/1/1/gpx.xsd">\n')
+
+    for feature in features:
+        geometry = feature.geometry().constGet() if feature.hasGeometry() else None
+        if flat_type == QgsWkbTypes.Point and geometry is None:
+            # A waypoint must have a position
+            continue
+
+        values = feature.attributes()
+        text = []
+        for element, index in element_indexes:
+            value = ogr_string(values[index], fields.at(index))
+            if value is not None:
+                text.append(f'  <{element}>{escape(value)}</{element}>\n')
+        extensions = []
+        for element, index in extension_indexes:
+            value = ogr_string(values[index], fields.at(index))
+            if value is not None:
+                extensions.append(
+                    f'    <{GPX_NAMESPACE}:{element}>{escape(value)}</{GPX_NAMESPACE}:{element}>\n')
+        if extensions:
+            text.append(f'  <extensions>\n{"".join(extensions)}  </extensions>\n')
+
+        if flat_type == QgsWkbTypes.Point:
+            writer.write(f'{gpx_point("wpt", geometry, "")}{"".join(text)}</wpt>\n')
+        elif flat_type == QgsWkbTypes.LineString:
+            points = geometry.points() if geometry else []
+            writer.write(
+                f'<rte>\n{"".join(text)}'
+                f'{"".join(gpx_point("rtept", point, "  ") + "  </rtept>" + chr(10) for point in points)}'
+                '</rte>\n')
+        else:
+            segments = []
+            for index in range(geometry.numGeometries() if geometry else 0):
+                points = geometry.geometryN(index).points()
+                track = ''.join(f'{gpx_point("trkpt", point, "    ")}    </trkpt>\n' for point in points)
+                segments.append(f'  <trkseg>\n{track}  </trkseg>\n')
+            writer.write(f'<trk>\n{"".join(text)}{"".join(segments)}</trk>\n')
+
+    writer.write('</gpx>\n')
+    writer.flush()
+
+
+TEXT_WRITERS = {
+    'csv': write_csv,
+    'kml': write_kml,
+    'gpx': write_gpx,
+}
+
+
+def text_writer_supported(extension: str, fields: QgsFields, geometry_type: 'QgsWkbTypes.Type') -> bool:
+    """ If the plugin writes the layer like OGR, or if it must be written by OGR. """
+    if extension not in TEXT_WRITERS or QgsWkbTypes.isCurvedType(geometry_type):
+        return False
+    if extension != 'gpx':
+        return True
+
+    # Like the OGR driver, without the other fields of the GPX schema
+    flat_type = QgsWkbTypes.flatType(geometry_type)
+    if flat_type not in (QgsWkbTypes.Point, QgsWkbTypes.LineString, QgsWkbTypes.MultiLineString):
+        return False
+    reserved = GPX_WAYPOINT_RESERVED_FIELDS if flat_type == QgsWkbTypes.Point else GPX_LINK_FIELDS
+    return not set(fields.names()).intersection(reserved)
+
+
+def write_text(
+        features: Iterable[QgsFeature],
+        output_file: Path,
+        fields: QgsFields,
+        extension: str,
+        geometry_type: 'QgsWkbTypes.Type',
+        name: str,
+        attributes: Optional[List[int]] = None,
+) -> None:
+    """ Write the features in a text format, like the OGR driver.
+
+    :param geometry_type: Type of the geometries of the layer, for GPX
+    :param name: Name of the layer, in KML
+    :param attributes: Indexes of the fields to write, all the fields if None
+    """
+    with output_file.open('w', encoding='utf8', newline='') as stream:
+        TEXT_WRITERS[extension](features, stream, fields, attributes, geometry_type, name)
@@ -3,15 +3,25 @@ __license__ = 'GPL version 3'
 __email__ = 'info@3liz.org'
 
 import configparser
+import os
 
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import Union
+from typing import Iterable, Iterator, List, Union
 
-from qgis.core import Qgis, QgsMessageLog
+from qgis.core import (
+    Qgis,
+    QgsMapLayer,
+    QgsMessageLog,
+    QgsProviderRegistry,
+    QgsVectorLayer,
+)
 
 
+@lru_cache(maxsize=None)
 def version() -> str:
-    """ Returns the Lizmap current version. """
+    """ Returns the Lizmap current version, the metadata.txt is read once. """
     file_path = Path(__file__).parent.joinpath('metadata.txt')
     config = configparser.ConfigParser()
     try:
@@ -30,6 +40,17 @@ def version() -> str:
         return config["general"]["version"]
 
 
+def layer_type_name(layer: QgsMapLayer) -> str:
+    """ Name of the layer in the WFS, like QGIS Server. """
+    return (layer.shortName() or layer.name()).replace(' ', '_')
+
+
+def layer_files(layer: QgsVectorLayer) -> List[str]:
+    """ Files of the data source of the layer, none for a database. """
+    path = QgsProviderRegistry.instance().decodeUri(layer.providerType(), layer.source()).get('path')
+    return [os.path.abspath(path)] if path and os.path.exists(path) else []
+
+
 def to_bool(val: Union[str, int, float, bool, None], default_value: bool = True) -> bool:
     """ Convert config value to boolean """
     if isinstance(val, str):
@@ -40,3 +61,50 @@ def to_bool(val: Union[str, int, float, bool, None], default_value: bool = True)
         return False
     else:
         return default_value
+
+
+def env_int(name: str, default: int) -> int:
+    """ Read an integer from the environment, the default is used if not set or not valid. """
+    return int(env_float(name, default))
+
+
+def env_float(name: str, default: float) -> float:
+    """ Read a number from the environment, the default is used if not set or not valid. """
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        # noinspection PyTypeChecker
+        QgsMessageLog.logMessage(
+            f"Invalid value '{value}' for the environment variable {name}, using {default}",
+            "WfsOutputExtension", Qgis.Warning)
+        return default
+
+
+@lru_cache(maxsize=None)
+def driver_available(name: str) -> bool:
+    """ If the OGR driver is in the GDAL used by QGIS. """
+    # Not loaded when the server starts
+    from osgeo import ogr
+
+    return ogr.GetDriverByName(name) is not None
+
+
+@contextmanager
+def gdal_config_options(options: Iterable[str]) -> Iterator[None]:
+    """ Set GDAL configuration options, given as KEY=VALUE, for the duration of the context. """
+    # Not loaded when the server starts
+    from osgeo import gdal
+
+    previous = {}
+    for option in options:
+        key, value = option.split('=', 1)
+        previous[key] = gdal.GetThreadLocalConfigOption(key, None)
+        gdal.SetThreadLocalConfigOption(key, value)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            gdal.SetThreadLocalConfigOption(key, value)
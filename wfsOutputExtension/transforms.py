@@ -0,0 +1,102 @@
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+from collections import OrderedDict
+from typing import Iterable, Set, Tuple
+
+from qgis.core import (
+    Qgis,
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransform,
+    QgsCoordinateTransformContext,
+    QgsCsException,
+    QgsProject,
+    QgsVectorLayer,
+)
+
+from wfsOutputExtension.logging import Logger
+
+
+class TransformCache:
+    """ Coordinate transforms of the process, reused between requests.
+
+    The least recently used transform is removed when the cache is full.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._transforms: OrderedDict[tuple, QgsCoordinateTransform] = OrderedDict()
+        self._projects: Set[Tuple[str, int]] = set()
+        self.logger = Logger()
+
+    @staticmethod
+    def _crs_key(crs: QgsCoordinateReferenceSystem) -> str:
+        return crs.authid() or crs.toWkt()
+
+    def key(
+            self,
+            source: QgsCoordinateReferenceSystem,
+            destination: QgsCoordinateReferenceSystem,
+            context: QgsCoordinateTransformContext,
+    ) -> tuple:
+        """ The key of the transform, the operations of the context may change the transform. """
+        return (
+            self._crs_key(source),
+            self._crs_key(destination),
+            tuple(sorted(context.coordinateOperations().items())),
+        )
+
+    def get(
+            self,
+            source: QgsCoordinateReferenceSystem,
+            destination: QgsCoordinateReferenceSystem,
+            context: QgsCoordinateTransformContext,
+    ) -> QgsCoordinateTransform:
+        """ Return the transform, created if it is not in the cache. """
+        key = self.key(source, destination, context)
+        transform = self._transforms.get(key)
+        if transform is not None:
+            self._transforms.move_to_end(key)
+            return transform
+
+        transform = QgsCoordinateTransform(source, destination, context)
+        self._prepare(transform)
+        self._transforms[key] = transform
+        if len(self._transforms) > self.max_size:
+            self._transforms.popitem(last=False)
+        return transform
+
+    @staticmethod
+    def _prepare(transform: QgsCoordinateTransform) -> None:
+        """ Transform a point so the PROJ pipeline is created now and not with the first feature. """
+        destination = transform.destinationCrs()
+        if not destination.isGeographic():
+            return
+        try:
+            transform.transform(destination.bounds().center(), Qgis.TransformDirection.Reverse)
+        except QgsCsException:
+            # The pipeline is ready even if the point is outside the area of use
+            pass
+
+    def warm_project(self, project: QgsProject, destinations: Iterable[str]) -> None:
+        """ Prepare transforms from the CRS of the project and its layers, once per project version. """
+        project_key = (project.fileName(), project.lastModified().toMSecsSinceEpoch())
+        if not project.fileName() or project_key in self._projects:
+            return
+        self._projects.add(project_key)
+
+        sources = {project.crs().authid(): project.crs()}
+        for layer in project.mapLayers().values():
+            if isinstance(layer, QgsVectorLayer) and layer.crs().isValid():
+                sources.setdefault(layer.crs().authid(), layer.crs())
+
+        context = project.transformContext()
+        for destination in set(destinations):
+            destination_crs = QgsCoordinateReferenceSystem(destination)
+            for source in sources.values():
+                if source.isValid() and source != destination_crs:
+                    self.get(source, destination_crs, context)
+
+        self.logger.info(
+            f"Transforms prepared for the project {project.fileName()}, {len(self._transforms)} in the cache")
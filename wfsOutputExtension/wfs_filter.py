@@ -3,20 +3,23 @@ __license__ = 'GPL version 3'
 __email__ = 'info@3liz.org'
 
 import os
+import re
+import shutil
 import tempfile
+import time
 
 from dataclasses import dataclass
-from io import BufferedReader
 from pathlib import Path
-from typing import Optional
-from xml.dom import minidom
+from typing import Callable, Iterable, List, Optional, Tuple
 
 from qgis.core import (
     QgsCoordinateReferenceSystem,
-    QgsCoordinateTransform,
+    QgsCsException,
+    QgsFeature,
     QgsProject,
     QgsVectorFileWriter,
     QgsVectorLayer,
+    QgsWkbTypes,
 )
 from qgis.server import (
     QgsBufferServerRequest,
@@ -28,8 +31,67 @@ from qgis.server import (
     QgsServerRequest,
 )
 
-from wfsOutputExtension.definitions import Format, OutputFormats
+from wfsOutputExtension.admission import AdmissionControl, AdmissionRejected
+from wfsOutputExtension.deadline import Deadline, ExportCancelled, cancellable
+from wfsOutputExtension.definitions import (
+    INTERMEDIATE_FORMATS,
+    MB,
+    Format,
+    Intermediate,
+    OutputFormats,
+)
+from wfsOutputExtension.estimate import (
+    estimate_bytes,
+    find_layer,
+    parse_hits,
+    pipeline_stages,
+    sample_layer,
+)
 from wfsOutputExtension.logging import Logger, log_function
+from wfsOutputExtension.memory import MemoryProbe, stage
+from wfsOutputExtension.paging import (
+    LAYER_NAME,
+    PAGING_PARAMETERS,
+    POSITION_COLUMN,
+    numbered_features,
+    page_subset,
+    requested_page,
+    snapshot_feature_count,
+)
+from wfsOutputExtension.partition import PartitionedExport, PartitionedRequest
+from wfsOutputExtension.retention import RetainedOutputs, request_key
+from wfsOutputExtension.singleflight import SingleFlight
+from wfsOutputExtension.snapshots import Snapshots, snapshot_type_name, source_stamps
+from wfsOutputExtension.spreadsheet import SHEET_MAX_ROWS, WRITERS, write_spreadsheet
+from wfsOutputExtension.storage import TempQuotaExceeded, TempStorage
+from wfsOutputExtension.streaming import (
+    FlushPolicy,
+    RangeNotSatisfiable,
+    parse_range,
+    send_file,
+)
+from wfsOutputExtension.text_formats import (
+    TEXT_WRITERS,
+    text_writer_supported,
+    write_text,
+)
+from wfsOutputExtension.tools import (
+    driver_available,
+    env_float,
+    env_int,
+    gdal_config_options,
+    layer_files,
+    to_bool,
+)
+from wfsOutputExtension.transforms import TransformCache
+from wfsOutputExtension.writer import (
+    SplitPolicy,
+    output_parts,
+    part_path,
+    reprojected_features,
+    simplified_features,
+    write_features,
+)
 
 
 class ProcessingRequestException(Exception):
@@ -51,35 +113,190 @@ class Context:
     all_gml: bool = False
     has_errors: bool = False
     request_id: str = ""
+    # Deterministic key of the request, empty if outputs are not retained
+    request_key: str = ""
+    # Existing file sent instead of running the export
+    served_file: Optional[Path] = None
+    # Estimation of the export requested with RESULTTYPE=estimate, the output is not written
+    estimate: bool = False
+    # Body of the hits response already flushed by QGIS Server
+    hits: bytes = b""
+    # Features fetched by partitions of the extent, converted by a pool of processes
+    partitioned: bool = False
+    # Number of features of the partitioned request
+    feature_count: int = 0
+    # False to write a table without geometry
+    with_geometry: bool = True
+    # Number of decimals of the coordinates, None to keep them
+    precision: Optional[int] = None
+    # In the unit of the output CRS, 0 to keep all the vertices
+    simplify_tolerance: float = 0
+    # Index of the first feature and number of features of a paged request
+    page: Optional[Tuple[int, Optional[int]]] = None
+    # Key of the snapshot of the whole result, shared by the pages
+    paging_key: str = ""
+    # Snapshot of the whole result the page is read from, instead of running the query
+    page_source: Optional[Path] = None
+    # Format of the features returned by QGIS Server
+    intermediate: Intermediate = INTERMEDIATE_FORMATS['gml2']
+    # Memory used by the stages of the request, if measured
+    memory: Optional[MemoryProbe] = None
+    # Lock held while running an export shared with the identical requests, and its key
+    flight_lock: Optional[int] = None
+    flight_key: str = ""
+    # Cancels the export lasting too long, None without deadline
+    deadline: Optional[Deadline] = None
+    # Layer and key of the user of a FlatGeobuf kept in the cache after the export, empty if not cached
+    cache_type_name: str = ""
+    cache_variant: str = ""
+    # Time of the request, before QGIS Server reads the data
+    created: float = 0
+
+    @property
+    def intermediate_file(self) -> Path:
+        return self.temp_dir.joinpath(f'{self.filename}.{self.intermediate.extension}')
 
 
 TRUE_STR = ('yes', 'true', '1')
 TMPDIR_PREFIX = "QGIS_WfsOutputExtension-"
-
-# Chunk size in bytes set to 1Mo
-CHUNK_SIZE = 1024 * 1024
-
-
-# Stream bytes
-def stream_bytes(handler: QgsRequestHandler, stream: BufferedReader):
-    # Pre-allocate input buffer and use readinto(...)
-    # NOTE: we should be able to read content directly into the internal
-    # QByteArray
-    data = bytearray(CHUNK_SIZE)
-    num_bytes = stream.readinto(data)
-    while num_bytes:
-        handler.appendBody(data[:num_bytes])
-        handler.sendResponse()  # Call flush()
-        num_bytes = stream.readinto(data)
+# Shared by all server processes, not prefixed like the request directories
+LOCKDIR_NAME = "QGIS_WfsOutputExtension_locks"
+RETENTION_DIR_NAME = "QGIS_WfsOutputExtension_retained"
+PAGING_DIR_NAME = "QGIS_WfsOutputExtension_pages"
+SINGLE_FLIGHT_DIR_NAME = "QGIS_WfsOutputExtension_inflight"
+FGB_CACHE_DIR_NAME = "QGIS_WfsOutputExtension_fgb"
 
 
 class WFSFilter(QgsServerFilter):
     @log_function
-    def __init__(self, server_iface: QgsServerInterface) -> None:
+    def __init__(
+            self, server_iface: QgsServerInterface, on_first_response: Optional[Callable[[], None]] = None,
+    ) -> None:
         super().__init__(server_iface)
         self.server_iface = server_iface
         self.logger = Logger()
+        # Called once after the first response, the server does not run an event loop
+        self.on_first_response = on_first_response
         self.debug_mode = os.getenv("DEBUG_WFSOUTPUTEXTENSION", "").lower() in TRUE_STR
+        # Skip the R-tree of GeoPackage exports if clients do not need it
+        self.gpkg_spatial_index = to_bool(os.getenv("WFSOUTPUTEXTENSION_GPKG_SPATIAL_INDEX", "yes"))
+        self.admission = AdmissionControl(
+            Path(tempfile.gettempdir(), LOCKDIR_NAME),
+            max_slots=env_int("WFSOUTPUTEXTENSION_MAX_HEAVY_EXPORTS", 0),
+            max_wait=env_float("WFSOUTPUTEXTENSION_HEAVY_EXPORT_WAIT", 30),
+            retry_after=env_int("WFSOUTPUTEXTENSION_RETRY_AFTER", 30),
+        )
+        self.storage = TempStorage(
+            Path(tempfile.gettempdir()),
+            TMPDIR_PREFIX,
+            quota=env_int("WFSOUTPUTEXTENSION_TEMP_QUOTA", 0) * MB,
+            max_age=env_int("WFSOUTPUTEXTENSION_TEMP_MAX_AGE", 24 * 3600),
+            sweep_interval=env_int("WFSOUTPUTEXTENSION_TEMP_SWEEP_INTERVAL", 3600),
+        )
+        self.transforms = TransformCache(env_int("WFSOUTPUTEXTENSION_TRANSFORM_CACHE_SIZE", 64))
+        # Reproject geometries by batches of features, instead of one by one in the writer
+        self.batch_reprojection = to_bool(
+            os.getenv("WFSOUTPUTEXTENSION_BATCH_REPROJECTION"), default_value=False)
+        self.reprojection_batch_size = env_int("WFSOUTPUTEXTENSION_REPROJECTION_BATCH_SIZE", 10000)
+        self.flush_policy = FlushPolicy(
+            max_bytes=int(env_float("WFSOUTPUTEXTENSION_FLUSH_SIZE", 4) * MB),
+            max_delay=env_float("WFSOUTPUTEXTENSION_FLUSH_DELAY", 1),
+        )
+        self.retention = RetainedOutputs(
+            Path(tempfile.gettempdir(), RETENTION_DIR_NAME),
+            ttl=env_int("WFSOUTPUTEXTENSION_RETENTION", 0),
+        )
+        # Rate of the requests with their info messages logged
+        self.log_sampling = env_float("WFSOUTPUTEXTENSION_LOG_SAMPLING", 1)
+        # Table formats written without geometry if not requested
+        self.without_geometry = [
+            name.strip().lower() for name in os.getenv("WFSOUTPUTEXTENSION_WITHOUT_GEOMETRY", "").split(',')
+        ]
+        # Snapshots of the whole result of paged requests, in GeoPackage
+        self.paging = RetainedOutputs(
+            Path(tempfile.gettempdir(), PAGING_DIR_NAME),
+            ttl=env_int("WFSOUTPUTEXTENSION_PAGING_CACHE", 0),
+        )
+        # Intermediate formats chosen for some output formats, like gpkg:geojson
+        self.intermediates = {}
+        for item in os.getenv("WFSOUTPUTEXTENSION_INTERMEDIATE_FORMATS", "").split(','):
+            if not item.strip():
+                continue
+            name, _, intermediate = item.partition(':')
+            if intermediate.strip().lower() not in INTERMEDIATE_FORMATS:
+                self.logger.warning(f"Unknown intermediate format in '{item}'")
+                continue
+            self.intermediates[name.strip().lower()] = INTERMEDIATE_FORMATS[intermediate.strip().lower()]
+        # Headers identifying the user, part of the key of a request
+        self.key_headers = [
+            name.strip() for name in os.getenv(
+                "WFSOUTPUTEXTENSION_KEY_HEADERS", "Authorization,X-Lizmap-User,X-Lizmap-User-Groups",
+            ).split(',') if name.strip()
+        ]
+        # Exports generated in advance with the pregenerate command
+        snapshot_dir = os.getenv("WFSOUTPUTEXTENSION_SNAPSHOT_DIR")
+        self.snapshots = Snapshots(
+            Path(snapshot_dir) if snapshot_dir else None,
+            max_age=env_int("WFSOUTPUTEXTENSION_SNAPSHOT_MAX_AGE", 0),
+        )
+        # Limits of a part of the formats written in several files, like the 2 GB of a Shapefile, 0 to disable
+        self.split_size = int(env_float("WFSOUTPUTEXTENSION_SPLIT_SIZE", 0) * MB)
+        self.split_features = env_int("WFSOUTPUTEXTENSION_SPLIT_FEATURES", 0)
+        # Formats written by the plugin instead of OGR, the OGR spreadsheet drivers keep the whole
+        # file in memory
+        native_writers = os.getenv("WFSOUTPUTEXTENSION_NATIVE_WRITERS", "")
+        self.native_writers = [
+            name.strip().lower() for name in native_writers.split(',')
+            if name.strip().lower() in WRITERS or name.strip().lower() in TEXT_WRITERS
+        ]
+        self.sheet_max_rows = env_int("WFSOUTPUTEXTENSION_SHEET_MAX_ROWS", SHEET_MAX_ROWS)
+        # Log the resident memory of the stages of the requests, and the top Python allocations
+        self.memory_profile = to_bool(os.getenv("WFSOUTPUTEXTENSION_MEMORY_PROFILE"), default_value=False)
+        self.tracemalloc_top = env_int("WFSOUTPUTEXTENSION_TRACEMALLOC_TOP", 0)
+        # Identical exports requested at the same time are run once
+        self.single_flight = SingleFlight(
+            Path(tempfile.gettempdir(), SINGLE_FLIGHT_DIR_NAME),
+            max_wait=env_float("WFSOUTPUTEXTENSION_SINGLE_FLIGHT_WAIT", 0),
+        )
+        # Seconds a FlatGeobuf of a whole layer is kept and served with range requests, 0 to disable
+        fgb_cache_age = env_int("WFSOUTPUTEXTENSION_FGB_CACHE", 0)
+        self.fgb_cache = Snapshots(
+            Path(tempfile.gettempdir(), FGB_CACHE_DIR_NAME) if fgb_cache_age > 0 else None,
+            max_age=fgb_cache_age,
+        )
+        # Zoom levels and simplification of the vector tiles, generated by a pool of threads
+        self.tile_options = [
+            f"MINZOOM={env_int('WFSOUTPUTEXTENSION_TILES_MINZOOM', 0)}",
+            f"MAXZOOM={env_int('WFSOUTPUTEXTENSION_TILES_MAXZOOM', 14)}",
+        ]
+        tile_simplification = os.getenv("WFSOUTPUTEXTENSION_TILES_SIMPLIFICATION")
+        if tile_simplification:
+            self.tile_options.append(
+                f"SIMPLIFICATION={env_float('WFSOUTPUTEXTENSION_TILES_SIMPLIFICATION', 0)}")
+        self.tile_threads = os.getenv("WFSOUTPUTEXTENSION_TILES_THREADS", "ALL_CPUS")
+        # Processes converting the partitions of the large exports, 0 to disable
+        self.partitions = PartitionedExport(
+            server_iface,
+            self.transforms,
+            workers=env_int("WFSOUTPUTEXTENSION_PARTITION_WORKERS", 0),
+            features=env_int("WFSOUTPUTEXTENSION_PARTITION_FEATURES", 100000),
+            formats=[
+                name.strip().lower()
+                for name in os.getenv("WFSOUTPUTEXTENSION_PARTITION_FORMATS", "gpkg,fgb,csv").split(',')
+            ],
+            executable=os.getenv("WFSOUTPUTEXTENSION_PARTITION_PYTHON", ""),
+        )
+        # Seconds before cancelling an export, for all formats or for some formats like shp:600
+        self.deadline = env_float("WFSOUTPUTEXTENSION_DEADLINE", 0)
+        self.format_deadlines = {}
+        for item in os.getenv("WFSOUTPUTEXTENSION_FORMAT_DEADLINES", "").split(','):
+            if not item.strip():
+                continue
+            name, _, seconds = item.partition(':')
+            try:
+                self.format_deadlines[name.strip().lower()] = float(seconds)
+            except ValueError:
+                self.logger.warning(f"Invalid deadline in '{item}'")
         # NOTE: we need to hold a reference to the context
         # because of the QgsServerFilter implementation
         self.context: Optional[Context] = None
@@ -88,6 +305,7 @@ class WFSFilter(QgsServerFilter):
     def requestReady(self):
 
         self.context = None
+        Logger.sample_request(self.log_sampling)
 
         handler = self.serverInterface().requestHandler()
         params = handler.parameterMap()
@@ -105,20 +323,51 @@ class WFSFilter(QgsServerFilter):
         # verifying format
         output_format = params.get('OUTPUTFORMAT', '').lower()
         format_definition = OutputFormats.find(output_format)
-        if not format_definition:
+        if not format_definition or not driver_available(format_definition.ogr_provider):
             # Fallback to default
             return
 
-        handler.setParameter('OUTPUTFORMAT', 'GML2')
+        try:
+            precision = int(params['PRECISION']) if params.get('PRECISION') else None
+            simplify_tolerance = float(params.get('SIMPLIFY_TOLERANCE') or 0)
+            if (precision is not None and precision < 0) or not simplify_tolerance >= 0:
+                raise ValueError
+        except ValueError:
+            handler.setServiceException(QgsServerException(
+                "PRECISION must be a positive integer and SIMPLIFY_TOLERANCE a positive number", 400))
+            return
 
-        # Create temporary directory
-        if self.debug_mode:
-            lock_dir = None
-            temp_dir = Path(tempfile.mkdtemp(prefix=TMPDIR_PREFIX))
-        else:
-            # Removed when deleted
-            lock_dir = tempfile.TemporaryDirectory(prefix=TMPDIR_PREFIX)
-            temp_dir = Path(lock_dir.name)
+        estimate = params.get('RESULTTYPE', '').lower() == 'estimate'
+        if estimate:
+            # QGIS Server counts the features, with the filters and the access control
+            handler.setParameter('RESULTTYPE', 'hits')
+
+        key = ""
+        if self.retention.enabled and not estimate:
+            key = self.request_key(handler, params)
+
+        page = requested_page(params) if self.paging.enabled and not estimate else None
+        paging_key = ""
+        if page:
+            # The same snapshot for all the pages and all the output formats
+            paging_key = self.request_key(handler, params, ignore=(*PAGING_PARAMETERS, 'OUTPUTFORMAT'))
+
+        intermediate = self.intermediate_format(format_definition)
+        handler.setParameter('OUTPUTFORMAT', intermediate.output_format)
+
+        with_geometry = self.with_geometry(format_definition, params.get('GEOMETRY', ''))
+        if not with_geometry:
+            # QGIS Server does not encode the geometries in the GML
+            handler.setParameter('GEOMETRYNAME', 'NONE')
+
+        partitioned = not estimate and with_geometry and self.partitions.accepts(params, format_definition)
+        if partitioned:
+            # QGIS Server counts the features, they are fetched by partitions in responseComplete
+            handler.setParameter('RESULTTYPE', 'hits')
+
+        # Create temporary directory, kept in debug mode
+        self.storage.sweep_if_due()
+        lock_dir, temp_dir = self.storage.create(keep=self.debug_mode)
 
         base_name_target = f"to-{output_format}"
         request_id = handler.requestHeader("X-Request-Id")
@@ -136,95 +385,358 @@ class WFSFilter(QgsServerFilter):
             lock_dir=lock_dir,
             temp_dir=temp_dir,
             request_id=request_id,
+            request_key=key,
+            estimate=estimate,
+            partitioned=partitioned,
+            with_geometry=with_geometry,
+            precision=precision,
+            simplify_tolerance=simplify_tolerance,
+            page=page,
+            paging_key=paging_key,
+            intermediate=intermediate,
+            memory=self.memory_probe(request_id),
+            deadline=None if estimate else self.export_deadline(format_definition),
         )
 
-        self.logger.info(f"REQ_ID:{request_id or '-'}\t request accepted")
+        memory = f", RSS {self.context.memory.start_rss / MB:.1f} MB" if self.context.memory else ""
+        self.logger.info(f"REQ_ID:{request_id or '-'}\t request accepted{memory}")
+
+        if estimate:
+            return
+
+        # The snapshots and the cache are by user, the features depend on the access control
+        variant = request_key({}, "", {name: handler.requestHeader(name) for name in self.key_headers})
+        snapshot = self.snapshots.lookup(
+            self.serverInterface().configFilePath(), params, format_definition, variant)
+        if snapshot:
+            self.logger.info(f"REQ_ID:{request_id or '-'}\t serving the snapshot {snapshot}")
+            self.context.served_file = snapshot
+            self.skip_service(handler)
+            return
+
+        if self.fgb_cache.enabled and format_definition == OutputFormats.Fgb:
+            cached = self.fgb_cache.lookup(
+                self.serverInterface().configFilePath(), params, format_definition, variant)
+            if cached:
+                self.logger.info(f"REQ_ID:{request_id or '-'}\t serving the cached FlatGeobuf {cached}")
+                self.context.served_file = cached
+                self.skip_service(handler)
+                return
+            self.context.cache_type_name = snapshot_type_name(params) or ""
+            self.context.cache_variant = variant
+            self.context.created = time.time()
+
+        if key and handler.requestHeader('Range'):
+            # Resume the download of a finished export
+            retained = self.retention.lookup(key, self.output_extension(format_definition))
+            if retained:
+                self.logger.info(f"REQ_ID:{request_id or '-'}\t range request on the retained output")
+                self.context.served_file = retained
+                self.skip_service(handler)
+                return
+
+        if self.single_flight.enabled:
+            flight_key = key or self.request_key(handler, params)
+            lock, output = self.single_flight.join(
+                flight_key, self.output_extension(format_definition), request_id)
+            if output:
+                self.logger.info(f"REQ_ID:{request_id or '-'}\t serving the output of the identical export")
+                self.context.served_file = output
+                self.skip_service(handler)
+                return
+            self.context.flight_lock = lock
+            self.context.flight_key = flight_key
+
+        if page:
+            page_source = self.paging.lookup(paging_key, 'gpkg')
+            if page_source:
+                self.logger.info(f"REQ_ID:{request_id or '-'}\t page {page} read from {page_source}")
+                self.context.page_source = page_source
+                self.skip_service(handler)
+                return
+
+            # QGIS Server returns the whole result, stored for the next pages
+            for name in PAGING_PARAMETERS:
+                handler.removeParameter(name)
 
         # set headers
         handler.clear()
+        self.set_output_headers(handler, self.context)
+
+    def memory_probe(self, request_id: str) -> Optional[MemoryProbe]:
+        """ Probe of the memory used by the request, None if not measured. """
+        if not self.memory_profile or not Logger.info_enabled():
+            return None
+        return MemoryProbe(request_id, self.tracemalloc_top)
+
+    def export_deadline(self, format_definition: Format) -> Optional[Deadline]:
+        """ Deadline of the export, starting now, None if the export is not cancelled. """
+        seconds = self.format_deadlines.get(format_definition.filename_ext, self.deadline)
+        return Deadline(seconds) if seconds > 0 else None
+
+    def request_key(self, handler: QgsRequestHandler, params: dict, ignore: Iterable[str] = ()) -> str:
+        """ Key of the request, from its parameters, its project and the headers identifying the user. """
+        headers = {name: handler.requestHeader(name) for name in self.key_headers}
+        return request_key(params, self.serverInterface().configFilePath(), headers, ignore)
+
+    def with_geometry(self, format_definition: Format, geometry: str) -> bool:
+        """ If the geometry is written, from the GEOMETRY parameter or the default of the format. """
+        if not format_definition.table:
+            return True
+        if geometry:
+            return geometry.lower() != 'none'
+        return format_definition.filename_ext not in self.without_geometry
+
+    def intermediate_format(self, format_definition: Format) -> Intermediate:
+        """ Format requested to QGIS Server for this output format. """
+        return self.intermediates.get(
+            format_definition.filename_ext, INTERMEDIATE_FORMATS[format_definition.intermediate])
+
+    @staticmethod
+    def output_extension(format_definition: Format) -> str:
+        """ Extension of the file sent to the client. """
+        return 'zip' if format_definition.zip else format_definition.filename_ext
+
+    @staticmethod
+    def set_output_headers(handler: QgsRequestHandler, context: Context) -> None:
+        """ Set the content type and the file name of the output. """
+        format_definition = context.format_definition
         handler.setResponseHeader('Content-Type', format_definition.content_type)
         if format_definition.zip:
             handler.setResponseHeader(
-                'Content-Disposition', f'attachment; filename="{self.context.typename}.zip"')
+                'Content-Disposition', f'attachment; filename="{context.typename}.zip"')
         else:
             handler.setResponseHeader(
                 'Content-Disposition',
-                f'attachment; filename="{self.context.typename}.{format_definition.filename_ext}"')
+                f'attachment; filename="{context.typename}.{format_definition.filename_ext}"')
+
+    @staticmethod
+    def skip_service(handler: QgsRequestHandler) -> None:
+        """ Do not execute the WFS service, the response is written in responseComplete.
+
+        A server filter can not cancel the execution of the service, but QGIS Server does not
+        execute it when an exception has been set during requestReady.
+        """
+        handler.setServiceException(
+            QgsServerException("Response written by the WfsOutputExtension plugin", 200))
 
     def sendResponse(self) -> None:
         # if the context is null, nothing to do
-        if not self.context or self.context.has_errors:
-            return
-
         context = self.context
+        if not context or context.has_errors or context.served_file or context.page_source:
+            return
 
         handler = self.serverInterface().requestHandler()
 
-        # write body in GML temp file
-        data = handler.body().data().decode('utf8')
-        output_file = context.temp_dir.joinpath(f'{context.filename}.gml')
-
-        with output_file.open('ab') as f:
-            if data.find('xsi:schemaLocation') == -1:
-                # noinspection PyTypeChecker
-                f.write(handler.body())
-            else:
-                # to avoid that QGIS Server/OGR loads schemas when reading GML
-                import re
-                data = re.sub(r'xsi:schemaLocation=\".*\"', 'xsi:schemaLocation=""', data)
-                f.write(data.encode('utf8'))
+        if context.estimate or context.partitioned:
+            # Read in responseComplete
+            # noinspection PyTypeChecker
+            context.hits += bytes(handler.body())
+            handler.clearBody()
+            return
 
-        format_definition = context.format_definition
+        # write body in the intermediate temp file
+        with stage(context.memory, 'intercept', log=False):
+            # noinspection PyTypeChecker
+            data = bytes(handler.body())
+            self.append_intermediate(context, data)
+
+        try:
+            self.storage.check_quota(context.temp_dir)
+        except TempQuotaExceeded as e:
+            context.has_errors = True
+            self.set_exception(handler, context, e)
+            return
 
         # change the headers
         # update content-type and content-disposition
         if not handler.headersSent():
             handler.clear()
-            handler.setResponseHeader('Content-Type', format_definition.content_type)
-            if format_definition.zip:
-                handler.setResponseHeader(
-                    'Content-Disposition', f'attachment; filename="{context.typename}.zip"')
-            else:
-                handler.setResponseHeader(
-                    'Content-Disposition',
-                    f'attachment; filename="{context.typename}.{format_definition.filename_ext}"')
+            self.set_output_headers(handler, context)
         else:
             handler.clearBody()
 
-        if data.rstrip().endswith('</wfs:FeatureCollection>'):
+        if context.intermediate.extension == 'gml' and data.rstrip().endswith(b'</wfs:FeatureCollection>'):
             try:
                 # all the gml has been intercepted
                 context.all_gml = True
                 self.send_output_file(handler, context)
             except Exception as e:
-                self.logger.log_exception(e)
                 context.has_errors = True
-                handler.clearBody()
-                handler.setServiceException(QgsServerException("Internal error", 500))
+                self.set_exception(handler, context, e)
+
+    @staticmethod
+    def append_intermediate(context: Context, data: bytes) -> None:
+        """ Append a part of the response of QGIS Server to the intermediate file. """
+        with context.intermediate_file.open('ab') as f:
+            if context.intermediate.extension == 'gml' and b'xsi:schemaLocation' in data:
+                # to avoid that QGIS Server/OGR loads schemas when reading GML
+                data = re.sub(rb'xsi:schemaLocation=\".*\"', b'xsi:schemaLocation=""', data)
+            f.write(data)
+
+    def set_exception(self, handler: QgsRequestHandler, context: Context, exception: Exception) -> None:
+        """ Reply with the HTTP error matching the exception raised while processing the request. """
+        handler.clearBody()
+        if isinstance(exception, AdmissionRejected):
+            handler.setServiceException(
+                QgsServerException("Too many exports are running on the server, retry later", 503))
+            # Set after the exception, writing the exception resets the headers
+            if not handler.headersSent():
+                handler.setResponseHeader('Retry-After', str(exception.retry_after))
+        elif isinstance(exception, ExportCancelled):
+            self.logger.warning(f"REQ_ID:{context.request_id or '-'}\t {exception}")
+            if context.lock_dir:
+                # Not kept until the end of the request
+                context.lock_dir.cleanup()
+            handler.setServiceException(
+                QgsServerException("The export has been cancelled, it has lasted too long", 504))
+        elif isinstance(exception, TempQuotaExceeded):
+            self.logger.critical(f"REQ_ID:{context.request_id or '-'}\t {exception}")
+            handler.setServiceException(
+                QgsServerException("The export is too big for the temporary storage of the server", 507))
+        else:
+            self.logger.critical("Critical exception when processing the request :")
+            self.logger.log_exception(exception)
+            handler.setServiceException(QgsServerException("Internal error", 500))
 
     @log_function
     def send_output_file(self, handler: QgsRequestHandler, context: Context) -> bool:
         """ Process the request.
 
         :raise ProcessingRequestException when there is an error
+        :raise AdmissionRejected when too many heavy exports are already running
         """
-        format_definition = context.format_definition
-        self.logger.info(f"WFS request to get format {format_definition.ogr_provider}")
+        # The size of the GML is the estimation of the cost of the export
+        if context.partitioned:
+            # Running on several cores, always limited
+            estimated_size = context.format_definition.heavy_size or 0
+        elif context.page_source:
+            # The part of the snapshot read for the page
+            estimated_size = context.page_source.stat().st_size
+            _, count = context.page
+            total = snapshot_feature_count(context.page_source)
+            if count is not None and total > count:
+                estimated_size = estimated_size * count // total
+        else:
+            estimated_size = context.intermediate_file.stat().st_size
+
+        with self.admission.slot(context.format_definition, estimated_size, context.request_id):
+            output_file = self.write_output_file(handler, context)
+            if not output_file:
+                handler.appendBody(b'')
+                return False
+
+            usage = self.storage.check_quota(context.temp_dir)
+            self.logger.info(f"REQ_ID:{context.request_id or '-'}\t temporary disk usage {usage} bytes")
+
+            if context.flight_lock is not None:
+                # The identical requests waiting for this export send the same file
+                lock, context.flight_lock = context.flight_lock, None
+                self.single_flight.publish(
+                    lock, context.flight_key, self.output_extension(context.format_definition), output_file)
+
+            if context.cache_type_name:
+                self.cache_output(context, output_file)
+
+            if context.request_key:
+                # Keep the output for the range requests resuming the download
+                output_file = self.retention.store(
+                    context.request_key, self.output_extension(context.format_definition), output_file)
+                if not handler.headersSent():
+                    handler.setResponseHeader('Accept-Ranges', 'bytes')
+                    handler.setResponseHeader('ETag', self.retention.etag(output_file))
+
+            self.logger.info("Sending the output file")
+            with stage(context.memory, 'stream'):
+                sent = send_file(handler, output_file, self.flush_policy, deadline=context.deadline)
+            size = output_file.stat().st_size
+            if sent < size:
+                self.logger.warning(
+                    f"REQ_ID:{context.request_id or '-'}\t streaming stopped by the deadline after "
+                    f"{sent} of {size} bytes")
+            return True
+
+    def cache_output(self, context: Context, output_file: Path) -> None:
+        """ Keep the FlatGeobuf of the layer, served with its spatial index to the range requests. """
+        # noinspection PyArgumentList
+        project = QgsProject.instance()
+        layer = find_layer(project, context.cache_type_name)
+        if not layer:
+            return
 
-        # Fetch the XSD
-        type_name = context.typename
-        headers = handler.requestHeaders()
-        result = self.xsd_for_layer(type_name, headers, context)
+        stamps = source_stamps([os.path.abspath(project.fileName()), *layer_files(layer)])
+        if any(stamp and stamp[0] >= context.created * 1e9 for stamp in stamps.values()):
+            # Modified while QGIS Server was reading it
+            return
+
+        self.fgb_cache.root.mkdir(exist_ok=True)
+        temp_file = self.fgb_cache.root.joinpath(f".{output_file.name}.{os.getpid()}")
+        try:
+            # The output file is moved or removed after the request, not the link
+            os.link(output_file, temp_file)
+        except OSError:
+            shutil.copyfile(output_file, temp_file)
+        target = self.fgb_cache.record(
+            self.serverInterface().configFilePath(),
+            context.cache_type_name,
+            context.format_definition,
+            temp_file,
+            stamps,
+            context.created,
+            context.cache_variant,
+        )
+        self.logger.info(f"REQ_ID:{context.request_id or '-'}\t FlatGeobuf kept in the cache {target}")
 
-        # read the GML
-        gml_path = context.temp_dir.joinpath(f'{context.filename}.gml')
-        gml_url = f"{gml_path}|option:FORCE_SRS_DETECTION=YES" if result else f"{gml_path}"
-        output_layer = QgsVectorLayer(gml_url, 'qgis_server_wfs_features', 'ogr')
+    def layer_options(self, format_definition: Format) -> List[str]:
+        """ OGR layer creation options of the output. """
+        layer_options = list(format_definition.ogr_layer_options)
+        if format_definition == OutputFormats.Gpkg:
+            # GDAL defers the R-tree creation when the table is created in the same session,
+            # it is built in bulk when the file is closed
+            layer_options.append(f"SPATIAL_INDEX={'YES' if self.gpkg_spatial_index else 'NO'}")
+        return layer_options
 
-        self.logger.info(f"Temporary GML file is {gml_url}")
+    def write_output_file(self, handler: QgsRequestHandler, context: Context) -> Optional[Path]:
+        """ Convert the GML to the output format, zipped if needed.
 
-        if not output_layer.isValid():
-            raise ProcessingRequestException(f'Output layer {gml_url} is not valid.')
+        :return: The file to send, None if the file has not been written
+        :raise ProcessingRequestException when there is an error
+        """
+        format_definition = context.format_definition
+        self.logger.info(f"WFS request to get format {format_definition.ogr_provider}")
+
+        if context.partitioned:
+            output_file = context.temp_dir.joinpath(
+                f"{context.base_name_target}.{format_definition.filename_ext}")
+            open_options = ()
+            if self.xsd_for_layer(context.typename, handler.requestHeaders(), context, '1.0.0'):
+                # The same fields in all the partitions, even without features
+                xsd = context.temp_dir.joinpath(f'{context.filename}.xsd')
+                open_options = (f'XSD={xsd}', 'FORCE_SRS_DETECTION=YES')
+            request = PartitionedRequest(
+                params=handler.parameterMap(),
+                headers=handler.requestHeaders(),
+                type_name=context.typename,
+                feature_count=context.feature_count,
+                temp_dir=context.temp_dir,
+                request_id=context.request_id,
+                deadline=context.deadline,
+                memory=context.memory,
+            )
+            merged = self.partitions.write(
+                request, output_file, format_definition, self.layer_options(format_definition), open_options)
+            if not merged:
+                self.logger.critical(
+                    f"REQ_ID:{context.request_id or '-'}\t the partitions have not been merged")
+                return None
+            return output_file
+
+        if context.page_source:
+            output_layer = self.page_layer(context, context.page_source)
+        else:
+            output_layer = self.intermediate_layer(handler, context)
+            if context.page:
+                output_layer = self.page_layer(context, self.store_paging_snapshot(context, output_layer))
 
         # Temporary file where to write the output
         output_file = context.temp_dir.joinpath(
@@ -241,88 +753,358 @@ class WFSFilter(QgsServerFilter):
         options.fileEncoding = 'utf-8'
 
         # coordinate transformation
-        if format_definition.force_crs:
-            # noinspection PyArgumentList
-            options.ct = QgsCoordinateTransform(
+        # noinspection PyArgumentList
+        transform_context = QgsProject.instance().transformContext()
+        transform = None
+        geometry_type = output_layer.wkbType()
+        if not context.with_geometry:
+            # The schema declares the geometry, even if it is not in the GML
+            geometry_type = QgsWkbTypes.NoGeometry
+            options.overrideGeometryType = geometry_type
+        elif format_definition.force_crs:
+            transform = self.transforms.get(
                 output_layer.crs(),
                 QgsCoordinateReferenceSystem(format_definition.force_crs),
-                QgsProject.instance())
+                transform_context)
 
         # datasource options
-        if format_definition.ogr_datasource_options:
-            options.datasourceOptions = format_definition.ogr_datasource_options
+        datasource_options = list(format_definition.ogr_datasource_options)
+        config_options = list(format_definition.ogr_config_options)
+        if format_definition.tiles:
+            datasource_options.extend(self.tile_options)
+            config_options.append(f"GDAL_NUM_THREADS={self.tile_threads}")
+            # Name of the layer in the tiles, instead of the file name
+            options.layerName = context.typename
+        if datasource_options:
+            options.datasourceOptions = datasource_options
+
+        # layer options
+        layer_options = self.layer_options(format_definition)
+        if layer_options:
+            options.layerOptions = layer_options
+
+        attributes = None
+        if context.page:
+            # The feature ID of the paging snapshot is not in the output
+            primary_keys = output_layer.primaryKeyAttributes()
+            attributes = [i for i in range(output_layer.fields().count()) if i not in primary_keys]
+            options.attributes = attributes
+
+        # Geometries simplified or rounded after the reprojection, in the output CRS
+        processed = context.with_geometry and (
+            context.precision is not None or context.simplify_tolerance > 0)
+
+        split = None
+        if format_definition.split and (self.split_size or self.split_features):
+            split = SplitPolicy(self.split_size, self.split_features, format_definition.ext_to_zip)
+
+        native = format_definition.filename_ext in self.native_writers
+        if native and format_definition.filename_ext in TEXT_WRITERS:
+            # Written by OGR if the plugin can not write the layer like OGR
+            native = text_writer_supported(
+                format_definition.filename_ext, output_layer.fields(), geometry_type)
+
+        features = None
+        if transform:
+            if self.batch_reprojection or processed or native or split:
+                features = reprojected_features(output_layer, transform, self.reprojection_batch_size)
+            else:
+                options.ct = transform
+        elif processed or split:
+            features = output_layer.getFeatures()
+
+        if processed:
+            features = simplified_features(features, context.simplify_tolerance, context.precision)
+
+        if context.deadline:
+            # The vector file writer stops when the feedback is canceled
+            options.feedback = context.deadline.feedback
+            if features is not None:
+                features = cancellable(features, context.deadline)
 
         # write file
-        # noinspection PyArgumentList
-        write_result, error_message, _, _ = QgsVectorFileWriter.writeAsVectorFormatV3(
-            output_layer,
-            str(output_file),
-            QgsProject.instance().transformContext(),
-            options)
+        # QgsVectorFileWriter wraps all inserts in a single transaction when the driver supports it
+        with stage(context.memory, 'write'), gdal_config_options(config_options):
+            if native and format_definition.filename_ext in TEXT_WRITERS:
+                try:
+                    write_text(
+                        features if features is not None else self.source_features(output_layer, context),
+                        output_file,
+                        output_layer.fields(),
+                        format_definition.filename_ext,
+                        geometry_type,
+                        context.typename,
+                        attributes)
+                    write_result, error_message = QgsVectorFileWriter.NoError, ''
+                except QgsCsException as e:
+                    # Raised by the reprojection of the features by batches, like write_features
+                    write_result = QgsVectorFileWriter.ErrProjection
+                    error_message = f"Failed to transform a point of a feature: {e}"
+            elif native:
+                # Only the attributes, like the OGR driver
+                sheets = write_spreadsheet(
+                    self.source_features(output_layer, context),
+                    output_file,
+                    output_layer.fields(),
+                    format_definition.filename_ext,
+                    context.typename,
+                    attributes,
+                    self.sheet_max_rows)
+                self.logger.info(
+                    f"REQ_ID:{context.request_id or '-'}\t spreadsheet written in {sheets} sheets")
+                write_result, error_message = QgsVectorFileWriter.NoError, ''
+            elif features is not None:
+                write_result, error_message = write_features(
+                    features,
+                    output_file,
+                    output_layer.fields(),
+                    geometry_type,
+                    transform.destinationCrs() if transform else output_layer.crs(),
+                    transform_context,
+                    options,
+                    attributes,
+                    split)
+            else:
+                # noinspection PyArgumentList
+                write_result, error_message, _, _ = QgsVectorFileWriter.writeAsVectorFormatV3(
+                    output_layer,
+                    str(output_file),
+                    transform_context,
+                    options)
+
+        if context.deadline:
+            # The output is not complete
+            context.deadline.check('write')
 
         # noinspection PyUnresolvedReferences
         if write_result != QgsVectorFileWriter.NoError:
-            handler.appendBody(b'')
             self.logger.critical(error_message)
-            return False
+            return None
+
+        self.storage.check_quota(context.temp_dir)
+
+        parts = output_parts(output_file)
+        if len(parts) > 1:
+            self.logger.info(f"REQ_ID:{context.request_id or '-'}\t output written in {len(parts)} parts")
 
         if format_definition == OutputFormats.Shp:
             # For SHP, we add the CPG, #55
-            cpg_file = context.temp_dir.joinpath(f"{context.base_name_target}.cpg")
-            with cpg_file.open('w', encoding='utf8') as f:
-                f.write(f"{options.fileEncoding}\n")
+            for part in parts:
+                with part.with_suffix('.cpg').open('w', encoding='utf8') as f:
+                    f.write(f"{options.fileEncoding}\n")
 
-        if format_definition.zip:
-            # compress files
-            import zipfile
-            try:
-                import zlib  # noqa
-                compression = zipfile.ZIP_DEFLATED
-            except ImportError:
-                compression = zipfile.ZIP_STORED
+        if not format_definition.zip:
+            # return the file created without zip
+            return output_file
+
+        # compress files
+        import zipfile
+        try:
+            import zlib  # noqa
+            compression = zipfile.ZIP_DEFLATED
+        except ImportError:
+            compression = zipfile.ZIP_STORED
+
+        # create the zip file
+        zip_file_path = context.temp_dir.joinpath(f"{context.base_name_target}.zip")
+        self.logger.info(f"Zipping the output in {zip_file_path}")
+        with stage(context.memory, 'zip'), zipfile.ZipFile(zip_file_path, 'w') as zf:
 
-            # create the zip file
-            zip_file_path = context.temp_dir.joinpath(f"{context.base_name_target}.zip")
-            self.logger.info(f"Zipping the output in {zip_file_path}")
-            with zipfile.ZipFile(zip_file_path, 'w') as zf:
+            for number, part in enumerate(parts, start=1):
+                if context.deadline:
+                    context.deadline.check('zip')
+
+                # Named like the part, typename_part2.shp for the second one
+                arc_name = part_path(
+                    Path(f'{context.typename}.{format_definition.filename_ext}'), number).stem
 
                 # Add the main file
-                arc_filename = f'{context.typename}.{format_definition.filename_ext}'
                 zf.write(
-                    output_file,
+                    part,
                     compress_type=compression,
-                    arcname=arc_filename,
+                    arcname=f'{arc_name}.{format_definition.filename_ext}',
                 )
 
                 for extension in format_definition.ext_to_zip:
-                    file_path = context.temp_dir.joinpath(f'{context.base_name_target}.{extension}')
+                    file_path = part.with_suffix(f'.{extension}')
                     if file_path.exists():
-                        arc_filename = f'{context.typename}.{extension}'
                         zf.write(
                             file_path,
                             compress_type=compression,
-                            arcname=arc_filename,
+                            arcname=f'{arc_name}.{extension}',
                         )
 
-                zf.close()
+            zf.close()
+
+        return zip_file_path
+
+    def send_partitioned(self, handler: QgsRequestHandler, context: Context) -> None:
+        """ Export the features counted by QGIS Server, fetched by partitions. """
+        # noinspection PyTypeChecker
+        body = context.hits + bytes(handler.body())
+        feature_count = parse_hits(body)
+        if feature_count is None:
+            # Exception of QGIS Server, like an unknown type name
+            handler.clearBody()
+            handler.appendBody(body)
+            return
+
+        context.feature_count = feature_count
+        handler.clear()
+        self.set_output_headers(handler, context)
+        self.send_output_file(handler, context)
+
+    @staticmethod
+    def source_features(layer: QgsVectorLayer, context: Context) -> Iterable[QgsFeature]:
+        """ The features of the layer, until the deadline of the export. """
+        features = layer.getFeatures()
+        return cancellable(features, context.deadline) if context.deadline else features
+
+    def intermediate_layer(self, handler: QgsRequestHandler, context: Context) -> QgsVectorLayer:
+        """ The features returned by QGIS Server, with the schema of the GML.
+
+        :raise ProcessingRequestException when the file can not be read
+        """
+        url = f"{context.intermediate_file}"
+        schema_version = context.intermediate.schema_version
+        with stage(context.memory, 'read'):
+            # Fetch the XSD
+            if schema_version and self.xsd_for_layer(
+                    context.typename, handler.requestHeaders(), context, schema_version):
+                url = f"{context.intermediate_file}|option:FORCE_SRS_DETECTION=YES"
+
+            layer = QgsVectorLayer(url, 'qgis_server_wfs_features', 'ogr')
 
-            with zip_file_path.open("rb") as f:
-                stream_bytes(handler, f)
-                return True
+        self.logger.info(f"Temporary {context.intermediate.output_format} file is {url}")
 
+        if not layer.isValid():
+            raise ProcessingRequestException(f'Output layer {url} is not valid.')
+        return layer
+
+    def store_paging_snapshot(self, context: Context, layer: QgsVectorLayer) -> Path:
+        """ Write the whole result in a GeoPackage, read by the next pages of the request.
+
+        :raise ProcessingRequestException when the snapshot can not be written
+        """
+        snapshot = context.temp_dir.joinpath('paging.gpkg')
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = 'GPKG'
+        options.fileEncoding = 'utf-8'
+        options.layerName = LAYER_NAME
+        # Pages are read by positions, not by extent. A column of the result named fid is not
+        # written as the feature ID.
+        options.layerOptions = ['SPATIAL_INDEX=NO', f'FID={POSITION_COLUMN}']
+
+        with gdal_config_options(OutputFormats.Gpkg.ogr_config_options):
+            write_result, error_message = write_features(
+                numbered_features(layer.getFeatures()),
+                snapshot,
+                layer.fields(),
+                layer.wkbType(),
+                layer.crs(),
+                QgsProject.instance().transformContext(),
+                options)
+
+        # noinspection PyUnresolvedReferences
+        if write_result != QgsVectorFileWriter.NoError:
+            raise ProcessingRequestException(f'Paging snapshot not written : {error_message}')
+
+        self.storage.check_quota(context.temp_dir)
+        self.logger.info(f"REQ_ID:{context.request_id or '-'}\t paging snapshot {context.paging_key} stored")
+        return self.paging.store(context.paging_key, 'gpkg', snapshot)
+
+    @staticmethod
+    def page_layer(context: Context, snapshot: Path) -> QgsVectorLayer:
+        """ The features of the requested page, in the paging snapshot.
+
+        :raise ProcessingRequestException when the snapshot can not be read
+        """
+        start, count = context.page
+        uri = f"{snapshot}|layername={LAYER_NAME}|subset={page_subset(start, count)}"
+        layer = QgsVectorLayer(uri, 'qgis_server_wfs_page', 'ogr')
+        if not layer.isValid():
+            raise ProcessingRequestException(f'Paging snapshot {uri} is not valid.')
+        return layer
+
+    def send_served_file(self, handler: QgsRequestHandler, context: Context) -> None:
+        """ Send an existing output file, the range requested if any. """
+        file_path = context.served_file
+        etag = self.retention.etag(file_path)
+        size = file_path.stat().st_size
+
+        # Remove the exception used to skip the service
+        handler.clear()
+        self.set_output_headers(handler, context)
+        handler.setResponseHeader('Accept-Ranges', 'bytes')
+        handler.setResponseHeader('ETag', etag)
+
+        byte_range = None
+        range_header = handler.requestHeader('Range')
+        if_range = handler.requestHeader('If-Range')
+        # If the validator does not match, the whole file is sent
+        if range_header and (not if_range or if_range == etag):
+            try:
+                byte_range = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                handler.setStatusCode(416)
+                handler.setResponseHeader('Content-Range', f'bytes */{size}')
+                return
+
+        if byte_range:
+            start, end = byte_range
+            handler.setStatusCode(206)
+            handler.setResponseHeader('Content-Range', f'bytes {start}-{end}/{size}')
         else:
-            self.logger.info("Sending the output file")
-            # return the file created without zip
-            with output_file.open("rb") as f:
-                stream_bytes(handler, f)
-                return True
+            handler.setStatusCode(200)
+
+        self.logger.info(f"REQ_ID:{context.request_id or '-'}\t sending {file_path}, range {byte_range}")
+        send_file(handler, file_path, self.flush_policy, byte_range)
+
+    def send_estimate(self, handler: QgsRequestHandler, context: Context, params: dict) -> None:
+        """ Reply with the estimated size, from the count of QGIS Server and a sample of features. """
+        # noinspection PyTypeChecker
+        body = context.hits + bytes(handler.body())
+        feature_count = parse_hits(body)
+        if feature_count is None:
+            # Exception of QGIS Server, like an unknown type name
+            handler.clearBody()
+            handler.appendBody(body)
+            return
+
+        max_features = params.get('MAXFEATURES') or params.get('COUNT') or ''
+        if max_features.isdigit():
+            feature_count = min(feature_count, int(max_features))
 
-        handler.appendBody(b'')
-        self.logger.critical('Error no output file')
-        return False
+        # The count is for all the type names, the average feature size of the layers is used
+        # noinspection PyArgumentList
+        project = QgsProject.instance()
+        estimations = []
+        for type_name in context.typename.split(','):
+            layer = find_layer(project, type_name.strip())
+            if layer:
+                estimations.append(
+                    estimate_bytes(context.format_definition, sample_layer(layer), feature_count))
+        estimated_size = sum(estimations) // len(estimations) if estimations else None
+
+        self.logger.info(
+            f"REQ_ID:{context.request_id or '-'}\t estimation of {feature_count} features : "
+            f"{estimated_size} bytes")
+
+        import json
+
+        handler.clear()
+        handler.setStatusCode(200)
+        handler.setResponseHeader('Content-Type', 'application/json')
+        handler.appendBody(json.dumps({
+            'typeName': context.typename,
+            'outputFormat': context.output_format,
+            'numberOfFeatures': feature_count,
+            'estimatedSize': estimated_size,
+            'pipeline': pipeline_stages(context.format_definition, context.intermediate),
+        }).encode('utf8'))
 
     @log_function
-    def xsd_for_layer(self, type_name: str, headers: dict, context: Context) -> bool:
+    def xsd_for_layer(self, type_name: str, headers: dict, context: Context, version: str = "1.0.0") -> bool:
 
         """ Get the XSD describing the layer. """
         # noinspection PyArgumentList
@@ -330,7 +1112,7 @@ class WFSFilter(QgsServerFilter):
         parameters = {
             "MAP": project.fileName(),
             "SERVICE": "WFS",
-            "VERSION": "1.0.0",
+            "VERSION": version,
             "REQUEST": "DescribeFeatureType",
             "TYPENAME": type_name,
             "OUTPUT": "XMLSCHEMA",
@@ -344,7 +1126,7 @@ class WFSFilter(QgsServerFilter):
             headers,
             None,
         )
-        service = self.server_iface.serviceRegistry().getService('WFS', '1.0.0')
+        service = self.server_iface.serviceRegistry().getService('WFS', version)
         response = QgsBufferServerResponse()
         service.executeRequest(request, response, project)
         # Flush otherwise the body is empty
@@ -373,7 +1155,18 @@ class WFSFilter(QgsServerFilter):
         # Remove current context
         self.context = None
 
+        if self.on_first_response:
+            on_first_response, self.on_first_response = self.on_first_response, None
+            on_first_response()
+
+        if context and context.flight_lock is not None:
+            # Nothing published, the identical requests run their export
+            self.single_flight.release(context.flight_lock)
+            context.flight_lock = None
+
         if context and context.has_errors:
+            if context.memory:
+                context.memory.finish()
             return
 
         # Update the WFS capabilities
@@ -385,68 +1178,108 @@ class WFSFilter(QgsServerFilter):
         if service != 'WFS':
             return
 
+        # The project has been loaded by QGIS Server after requestReady
+        # noinspection PyArgumentList
+        self.transforms.warm_project(
+            QgsProject.instance(), (f.force_crs for f in OutputFormats if f.force_crs))
+
         request = params.get('REQUEST', '').upper()
         if request not in ('GETCAPABILITIES', 'GETFEATURE'):
             return
 
         if request == 'GETFEATURE' and context:
-            if not context.all_gml:
+            if context.estimate:
+                self.send_estimate(handler, context, params)
+            elif context.served_file:
+                self.send_served_file(handler, context)
+            elif context.partitioned:
+                try:
+                    self.send_partitioned(handler, context)
+                except Exception as e:
+                    self.set_exception(handler, context, e)
+            elif context.page_source:
+                # Remove the exception used to skip the service
+                handler.clear()
+                self.set_output_headers(handler, context)
                 try:
-                    # all the gml has not been intercepted in sendResponse
-                    handler.clearBody()
-                    with context.temp_dir.joinpath(f'{context.filename}.gml').open('a') as f:
-                        f.write('</wfs:FeatureCollection>')
                     self.send_output_file(handler, context)
                 except Exception as e:
-                    self.logger.critical("Critical exception when processing the request :")
-                    self.logger.log_exception(e)
+                    self.set_exception(handler, context, e)
+            elif not context.all_gml:
+                try:
+                    # the end of the response has not been intercepted in sendResponse
+                    # noinspection PyTypeChecker
+                    data = bytes(handler.body())
                     handler.clearBody()
-                    handler.setServiceException(QgsServerException("Internal error", 500))
+                    self.append_intermediate(context, data)
+                    if context.intermediate.extension == 'gml' and not data.rstrip().endswith(
+                            b'</wfs:FeatureCollection>'):
+                        self.append_intermediate(context, b'</wfs:FeatureCollection>')
+                    self.send_output_file(handler, context)
+                except Exception as e:
+                    self.set_exception(handler, context, e)
+            if context.memory:
+                context.memory.finish()
             return
 
         if request == 'GETCAPABILITIES':
-            data = handler.body().data()
-            dom = minidom.parseString(data)
+            memory = self.memory_probe(handler.requestHeader("X-Request-Id"))
+            with stage(memory, 'capabilities'):
+                self.add_output_formats(handler)
+            if memory:
+                memory.finish()
 
-            formats_added = False
+    @staticmethod
+    def available_formats() -> List[Format]:
+        """ The output formats with their OGR driver in the GDAL used by QGIS. """
+        return [output for output in OutputFormats if driver_available(output.ogr_provider)]
 
-            if dom.documentElement.attributes['version'].value == '1.0.0':
+    def add_output_formats(self, handler: QgsRequestHandler) -> None:
+        """ Add the output formats to GetFeature in the WFS capabilities. """
+        # Not loaded when the server starts
+        from xml.dom import minidom
 
-                for _ in dom.getElementsByTagName('GetFeature'):
-                    for result_format_node in dom.getElementsByTagName('ResultFormat'):
-                        formats_added = True
-                        for output in OutputFormats:
-                            format_node = dom.createElement(output.filename_ext.upper())
-                            result_format_node.appendChild(format_node)
+        data = handler.body().data()
+        dom = minidom.parseString(data)
 
-            else:
-                for operation_metadata_node in dom.getElementsByTagName('ows:OperationsMetadata'):
-                    for operation_node in operation_metadata_node.getElementsByTagName('ows:Operation'):
-                        if 'name' not in operation_node.attributes:
-                            continue
+        formats_added = False
 
-                        if operation_node.attributes['name'].value != 'GetFeature':
-                            continue
+        if dom.documentElement.attributes['version'].value == '1.0.0':
 
-                        for param_node in operation_node.getElementsByTagName('ows:Parameter'):
-                            if 'name' not in param_node.attributes:
-                                continue
+            for _ in dom.getElementsByTagName('GetFeature'):
+                for result_format_node in dom.getElementsByTagName('ResultFormat'):
+                    formats_added = True
+                    for output in self.available_formats():
+                        format_node = dom.createElement(output.filename_ext.upper())
+                        result_format_node.appendChild(format_node)
 
-                            if param_node.attributes['name'].value != 'outputFormat':
-                                continue
+        else:
+            for operation_metadata_node in dom.getElementsByTagName('ows:OperationsMetadata'):
+                for operation_node in operation_metadata_node.getElementsByTagName('ows:Operation'):
+                    if 'name' not in operation_node.attributes:
+                        continue
 
-                            formats_added = True
-                            for output in OutputFormats:
-                                value_node = dom.createElement('ows:Value')
-                                text_node = dom.createTextNode(output.filename_ext.upper())
-                                value_node.appendChild(text_node)
-                                param_node.appendChild(value_node)
+                    if operation_node.attributes['name'].value != 'GetFeature':
+                        continue
 
-            if formats_added:
-                self.logger.info("All formats have been added in the GetCapabilities")
-            else:
-                self.logger.info("No formats have been added in the GetCapabilities")
+                    for param_node in operation_node.getElementsByTagName('ows:Parameter'):
+                        if 'name' not in param_node.attributes:
+                            continue
 
-            handler.clearBody()
-            handler.appendBody(dom.toxml('utf-8'))
-            return
+                        if param_node.attributes['name'].value != 'outputFormat':
+                            continue
+
+                        formats_added = True
+                        for output in self.available_formats():
+                            value_node = dom.createElement('ows:Value')
+                            text_node = dom.createTextNode(output.filename_ext.upper())
+                            value_node.appendChild(text_node)
+                            param_node.appendChild(value_node)
+
+        if formats_added:
+            self.logger.info("All formats have been added in the GetCapabilities")
+        else:
+            self.logger.info("No formats have been added in the GetCapabilities")
+
+        handler.clearBody()
+        handler.appendBody(dom.toxml('utf-8'))
@@ -0,0 +1,163 @@
+__copyright__ = 'Copyright 2025, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransform,
+    QgsCoordinateTransformContext,
+    QgsCsException,
+    QgsFeature,
+    QgsFields,
+    QgsTopologyPreservingSimplifier,
+    QgsVectorFileWriter,
+    QgsVectorLayer,
+    QgsWkbTypes,
+)
+
+from wfsOutputExtension.geometry import batch_reproject
+
+# Number of features written between two checks of the size of the files
+SPLIT_CHECK_INTERVAL = 1000
+
+
+class SplitPolicy(NamedTuple):
+    """ Limits of a file, a new part is written when one is reached. """
+    # Size of the biggest file of the part, like the DBF of a Shapefile, 0 for no limit
+    max_bytes: int
+    # 0 for no limit
+    max_features: int
+    # Extensions of the files of a part, other than the main file
+    extensions: Tuple[str, ...] = ()
+
+    def full(self, output_file: Path, count: int) -> bool:
+        """ If the part has reached a limit, after writing count features. """
+        if self.max_features and count >= self.max_features:
+            return True
+        if not self.max_bytes or count % SPLIT_CHECK_INTERVAL:
+            return False
+        files = [output_file, *(output_file.with_suffix(f'.{extension}') for extension in self.extensions)]
+        return max(path.stat().st_size if path.exists() else 0 for path in files) >= self.max_bytes
+
+
+def part_path(output_file: Path, part: int) -> Path:
+    """ Main file of a part of the output, the first part is the output file. """
+    if part == 1:
+        return output_file
+    return output_file.with_name(f'{output_file.stem}_part{part}{output_file.suffix}')
+
+
+def output_parts(output_file: Path) -> List[Path]:
+    """ Main files of the parts written for the output. """
+    parts = []
+    while part_path(output_file, len(parts) + 1).exists():
+        parts.append(part_path(output_file, len(parts) + 1))
+    return parts
+
+
+def _reprojected(features: List[QgsFeature], transform: QgsCoordinateTransform) -> List[QgsFeature]:
+    geometries = batch_reproject([feature.geometry() for feature in features], transform)
+    for feature, geometry in zip(features, geometries):
+        feature.setGeometry(geometry)
+    return features
+
+
+def reprojected_features(
+        layer: QgsVectorLayer, transform: QgsCoordinateTransform, batch_size: int,
+) -> Iterator[QgsFeature]:
+    """ Features of the layer, the geometries are reprojected by batches of features. """
+    batch = []
+    for feature in layer.getFeatures():
+        batch.append(feature)
+        if len(batch) >= batch_size:
+            yield from _reprojected(batch, transform)
+            batch = []
+
+    if batch:
+        yield from _reprojected(batch, transform)
+
+
+def simplified_features(
+        features: Iterable[QgsFeature], tolerance: float, precision: Optional[int],
+) -> Iterator[QgsFeature]:
+    """ Simplify the geometries, preserving their topology, then round the coordinates.
+
+    :param tolerance: In the unit of the CRS of the features, 0 to keep all the vertices
+    :param precision: Number of decimals of the coordinates, None to keep them
+    """
+    simplifier = QgsTopologyPreservingSimplifier(tolerance) if tolerance else None
+    spacing = 10 ** -precision if precision is not None else 0
+    for feature in features:
+        if feature.hasGeometry():
+            geometry = feature.geometry()
+            if simplifier:
+                geometry = simplifier.simplify(geometry)
+            if spacing:
+                geometry = geometry.snappedToGrid(spacing, spacing)
+            feature.setGeometry(geometry)
+        yield feature
+
+
+def write_features(
+        features: Iterable[QgsFeature],
+        output_file: Path,
+        fields: QgsFields,
+        geometry_type: 'QgsWkbTypes.Type',
+        crs: QgsCoordinateReferenceSystem,
+        transform_context: QgsCoordinateTransformContext,
+        options: QgsVectorFileWriter.SaveVectorOptions,
+        attributes: Optional[List[int]] = None,
+        split: Optional[SplitPolicy] = None,
+) -> Tuple[int, str]:
+    """ Write the features, already in the destination CRS, with the vector file writer.
+
+    :param attributes: Indexes of the fields to write, all the fields if None
+    :param split: Limits of a file, the next features are written in a new part named by part_path
+    :return: The error code and the error message, like QgsVectorFileWriter.writeAsVectorFormatV3,
+        ErrProjection if a geometry can not be reprojected
+    """
+    if attributes is not None:
+        source_fields = fields
+        fields = QgsFields()
+        for index in attributes:
+            fields.append(source_fields.at(index))
+
+    part = 1
+    count = 0
+    # noinspection PyArgumentList
+    writer = QgsVectorFileWriter.create(
+        str(output_file), fields, geometry_type, crs, transform_context, options)
+    if writer.hasError() != QgsVectorFileWriter.NoError:
+        return writer.hasError(), writer.errorMessage()
+
+    try:
+        for feature in features:
+            if split and count and split.full(part_path(output_file, part), count):
+                # Close the part
+                del writer
+                part += 1
+                count = 0
+                # noinspection PyArgumentList
+                writer = QgsVectorFileWriter.create(
+                    str(part_path(output_file, part)), fields, geometry_type, crs, transform_context, options)
+                if writer.hasError() != QgsVectorFileWriter.NoError:
+                    return writer.hasError(), writer.errorMessage()
+
+            if attributes is not None:
+                selected = QgsFeature(fields, feature.id())
+                selected.setGeometry(feature.geometry())
+                selected.setAttributes([feature.attribute(index) for index in attributes])
+                feature = selected
+            if not writer.addFeature(feature):
+                return QgsVectorFileWriter.ErrFeatureWriteFailed, writer.errorMessage()
+            count += 1
+    except QgsCsException as e:
+        # Raised by the reprojection of the features by batches
+        return QgsVectorFileWriter.ErrProjection, f"Failed to transform a point of a feature: {e}"
+
+    # Close the file
+    del writer
+    return QgsVectorFileWriter.NoError, ''